@@ -0,0 +1,73 @@
+"""
+压测用的服务入口: 把上游客户端换成指向 benchmarks/fake_upstream.py 的假客户端, 再启动 main 里的 app.
+
+python -m benchmarks.bench_server --port 8000 --upstream_url http://127.0.0.1:9100/bot/ --clients 4
+"""
+
+import json
+from typing import Dict, Tuple
+
+import fire
+import httpx
+import uvicorn
+
+
+class FakeUpstreamClient:
+    """Speaks the fake upstream's SSE protocol with the interface /form_chat uses."""
+
+    def __init__(self, http: httpx.AsyncClient, base_url: str):
+        self.http = http
+        self.base_url = base_url
+
+    async def stream_message(self, message, conversation_id, model, **kwargs):
+        event = None
+        async with self.http.stream(
+            "POST", f"{self.base_url}{model}", json={"query": message}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event == "text":
+                    yield json.loads(line[5:])["text"]
+                elif event == "error":
+                    raise RuntimeError(f"Fake upstream error: {line}")
+        for callback in kwargs.get("call_back") or ():
+            await callback()
+
+    async def upload_images(self, file):
+        return {"file_name": file.filename}
+
+
+def fake_clients(
+    upstream_url: str, count: int
+) -> Tuple[Dict[int, FakeUpstreamClient], Dict[int, FakeUpstreamClient]]:
+    http = httpx.AsyncClient(timeout=httpx.Timeout(120.0))
+    basic = {idx: FakeUpstreamClient(http, upstream_url) for idx in range(count)}
+    plus = {idx: FakeUpstreamClient(http, upstream_url) for idx in range(count)}
+    return basic, plus
+
+
+def install_fake_clients(upstream_url: str, count: int):
+    """Make every ClientManager in this process return the fake clients."""
+    from rev_claude.client.client_manager import ClientManager
+
+    clients = fake_clients(upstream_url, count)
+    ClientManager.get_clients = lambda self: clients
+
+
+def main(
+    upstream_url: str,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    clients: int = 4,
+):
+    install_fake_clients(upstream_url, clients)
+    # 客户端替换好之后再导入 app, 单进程运行, 替换对所有请求都生效
+    from main import create_app
+
+    uvicorn.run(create_app(), host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
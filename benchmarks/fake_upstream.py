@@ -0,0 +1,70 @@
+"""
+本地的假上游机器人服务, 按照 Poe bot 的 SSE 协议以可配置的速率吐出 token.
+
+python -m benchmarks.fake_upstream --port 9100 --tokens-per-second 40 --jitter 0.3
+"""
+
+import asyncio
+import json
+import random
+
+import fire
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+WORDS = (
+    "the quick brown fox jumps over the lazy dog while streaming tokens "
+    "through a reverse proxy to measure latency and throughput"
+).split()
+
+
+def create_app(
+    tokens_per_second: float = 40.0,
+    jitter: float = 0.3,
+    tokens: int = 200,
+    first_token_delay: float = 0.3,
+) -> FastAPI:
+    app = FastAPI()
+    interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    async def sleep_with_jitter(base: float):
+        if base > 0:
+            await asyncio.sleep(
+                max(0.0, random.uniform(base * (1 - jitter), base * (1 + jitter)))
+            )
+
+    async def generate():
+        yield 'event: meta\ndata: {"content_type": "text/markdown"}\n\n'
+        await sleep_with_jitter(first_token_delay)
+        for i in range(tokens):
+            text = WORDS[i % len(WORDS)] + " "
+            yield f"event: text\ndata: {json.dumps({'text': text})}\n\n"
+            await sleep_with_jitter(interval)
+        yield "event: done\ndata: {}\n\n"
+
+    @app.post("/bot/{bot_name}")
+    async def bot(bot_name: str, request: Request):
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def main(
+    host: str = "127.0.0.1",
+    port: int = 9100,
+    tokens_per_second: float = 40.0,
+    jitter: float = 0.3,
+    tokens: int = 200,
+    first_token_delay: float = 0.3,
+):
+    app = create_app(tokens_per_second, jitter, tokens, first_token_delay)
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,110 @@
+"""
+压测用的数据准备: 本地 Redis(redis-server 或 fakeredis), 真实的 models.json 条目, 测试用 API key.
+"""
+
+import json
+import random
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from rev_claude.api_key.api_key_layout import APIKeyRedisKeys
+from rev_claude.configs import POE_BOT_INFO
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, host: str = "127.0.0.1", timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{host}:{port} did not come up in {timeout}s")
+
+
+class LocalRedis:
+    """A throwaway Redis: redis-server if installed, otherwise fakeredis over TCP."""
+
+    def __init__(self, port: Optional[int] = None, backend: str = "auto"):
+        self.port = port or free_port()
+        self.backend = backend
+        self._process: Optional[subprocess.Popen] = None
+        self._server = None
+
+    def start(self) -> "LocalRedis":
+        backend = self.backend
+        if backend == "auto":
+            backend = "redis-server" if shutil.which("redis-server") else "fakeredis"
+        if backend == "redis-server":
+            self._process = subprocess.Popen(
+                [
+                    "redis-server",
+                    "--port",
+                    str(self.port),
+                    "--save",
+                    "",
+                    "--appendonly",
+                    "no",
+                ],
+                stdout=subprocess.DEVNULL,
+            )
+        else:
+            from fakeredis import TcpFakeServer
+
+            self._server = TcpFakeServer(("127.0.0.1", self.port), server_type="redis")
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.backend = backend
+        wait_for_port(self.port)
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def client(self):
+        import redis
+
+        return redis.Redis(host="127.0.0.1", port=self.port, decode_responses=True)
+
+    def total_commands(self) -> int:
+        return int(self.client().info("stats").get("total_commands_processed", 0))
+
+
+def sample_models(count: int = 50, seed: int = 0, path: Path = POE_BOT_INFO) -> dict:
+    """Pick real catalog entries so billing lookups see realistic data."""
+    with open(path, "r", encoding="utf-8") as f:
+        models = json.load(f)
+    names = sorted(models)
+    random.Random(seed).shuffle(names)
+    return {name: models[name] for name in names[:count]}
+
+
+def seed_api_keys(redis_client, count: int, key_type: str = "plus") -> List[str]:
+    api_keys = []
+    pipe = redis_client.pipeline(transaction=False)
+    for i in range(count):
+        api_key = f"sk-bench-{key_type}-{i:05d}"
+        keys = APIKeyRedisKeys(api_key)
+        pipe.set(keys.api_key, "active")
+        pipe.set(keys.type, key_type)
+        pipe.set(keys.usage, 0)
+        pipe.set(keys.current_usage, 0)
+        pipe.set(keys.is_activated, "1")
+        api_keys.append(api_key)
+    pipe.execute()
+    return api_keys
@@ -0,0 +1,76 @@
+"""
+用 python -X importtime 统计导入 main 的耗时, 找出拖慢冷启动的模块.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).parent.parent
+# 单独报告的较重的顶层包, 没有被导入的不出现在结果里
+WATCHED_PACKAGES = (
+    "fastapi",
+    "uvicorn",
+    "redis",
+    "httpx",
+    "pydantic",
+    "rev_claude",
+    "poe_api_wrapper",
+    "duckduckgo_search",
+    "tiktoken",
+    "numpy",
+    "PIL",
+    "brotli",
+    "docx",
+    "pdfminer",
+)
+
+
+def _run_importtime(module: str) -> Dict[str, Tuple[int, int]]:
+    """Return {module: (self_us, cumulative_us)} for one cold interpreter."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{process.stderr[-2000:]}")
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def profile_imports(
+    module: str = "main", runs: int = 3, top: int = 20
+) -> Tuple[Dict[str, Optional[float]], List[Tuple[str, float, float]]]:
+    """Best-of-``runs`` import timings of ``module`` in milliseconds.
+
+    Returns the compared results (total and per watched package) and the
+    ``top`` slowest modules by cumulative time as (name, self_ms, cumulative_ms).
+    """
+    best: Dict[str, Tuple[int, int]] = {}
+    for _ in range(runs):
+        for name, (self_us, cumulative_us) in _run_importtime(module).items():
+            previous = best.get(name)
+            if previous is None or cumulative_us < previous[1]:
+                best[name] = (self_us, cumulative_us)
+
+    results: Dict[str, Optional[float]] = {
+        "import_total_ms": best[module][1] / 1000 if module in best else None,
+        "imported_modules": len(best),
+    }
+    for package in WATCHED_PACKAGES:
+        if package in best:
+            results[f"import_{package.lower()}_ms"] = best[package][1] / 1000
+    slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    report = [
+        (name, self_us / 1000, cumulative_us / 1000)
+        for name, (self_us, cumulative_us) in slowest
+    ]
+    return results, report
@@ -0,0 +1,276 @@
+"""
+/form_chat 和 /api/v1/clients_status 的压测客户端.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+# 这些消息说明请求没有真正生成回答, 虽然 HTTP 状态码是 200
+ERROR_MESSAGES = ("排队超时", "no available", "不支持非SSE")
+# 排队提示不是模型输出, 不计入首 token 时间
+QUEUE_MESSAGE = "正在排队"
+
+
+def _frame_message(data: str) -> str:
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(payload, dict):
+        if payload.get("error"):
+            return f"error: {payload['error']}"
+        return str(payload.get("message", payload.get("content", "")))
+    return str(payload)
+
+
+def classify_frame(data: str) -> Optional[str]:
+    """Kind of a /form_chat data frame: "closed", "error", "notice" or None for output."""
+    message = _frame_message(data.strip())
+    if message == "closed":
+        return "closed"
+    if message.startswith("error:") or any(m in message for m in ERROR_MESSAGES):
+        return "error"
+    if QUEUE_MESSAGE in message:
+        return "notice"
+    return None
+
+
+class ProcessSampler:
+    """CPU time and RSS of the server process tree, read from /proc or psutil."""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        try:
+            import psutil
+
+            self._psutil = psutil
+        except ImportError:
+            self._psutil = None
+
+    def _pids(self) -> List[int]:
+        if self.pid is None:
+            return []
+        if self._psutil is not None:
+            try:
+                proc = self._psutil.Process(self.pid)
+                return [self.pid] + [c.pid for c in proc.children(recursive=True)]
+            except self._psutil.Error:
+                return []
+        return [self.pid]
+
+    @staticmethod
+    def _proc_cpu_seconds(pid: int) -> float:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime 和 stime 是第 14, 15 个字段
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    @staticmethod
+    def _proc_rss_bytes(pid: int) -> int:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+        return 0
+
+    def cpu_seconds(self) -> float:
+        total = 0.0
+        for pid in self._pids():
+            try:
+                if self._psutil is not None:
+                    times = self._psutil.Process(pid).cpu_times()
+                    total += times.user + times.system
+                else:
+                    total += self._proc_cpu_seconds(pid)
+            except Exception:
+                pass
+        return total
+
+    def rss_bytes(self) -> int:
+        total = 0
+        for pid in self._pids():
+            try:
+                if self._psutil is not None:
+                    total += self._psutil.Process(pid).memory_info().rss
+                else:
+                    total += self._proc_rss_bytes(pid)
+            except Exception:
+                pass
+        return total
+
+
+async def run_chat_stream(
+    client: httpx.AsyncClient,
+    chat_url: str,
+    api_key: str,
+    model: str,
+    client_type: str,
+) -> Dict:
+    start = perf_counter()
+    ttft = None
+    frames = 0
+    ok = False
+    closed = failed = False
+    try:
+        async with client.stream(
+            "POST",
+            chat_url,
+            headers={"Authorization": api_key},
+            data={
+                "message": "Benchmark prompt: explain connection pooling briefly.",
+                "model": model,
+                "client_type": client_type,
+                "client_idx": "0",
+                "stream": "true",
+            },
+        ) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    kind = classify_frame(line[5:])
+                    if kind == "closed":
+                        closed = True
+                    elif kind == "error":
+                        failed = True
+                    elif kind is None and ttft is None:
+                        ttft = perf_counter() - start
+                    frames += 1
+            # 上游出错时流会在 200 之后被截断, 没有最后的 closed 帧
+            ok = response.status_code == 200 and closed and not failed
+    except httpx.HTTPError:
+        ok = False
+    return {
+        "ok": ok,
+        "ttft": ttft,
+        "duration": perf_counter() - start,
+        "frames": frames,
+    }
+
+
+async def run_status_request(client: httpx.AsyncClient, status_url: str) -> Dict:
+    start = perf_counter()
+    try:
+        response = await client.get(status_url)
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return {"ok": ok, "duration": perf_counter() - start}
+
+
+async def drive_load(
+    base_url: str,
+    api_keys: List[str],
+    models: List[str],
+    streams: int = 200,
+    concurrency: int = 50,
+    status_requests: int = 200,
+    chat_path: str = "/api/v1/claude/form_chat",
+    status_path: str = "/api/v1/clients_status",
+    client_type: str = "plus",
+    server_pid: Optional[int] = None,
+    redis_commands=None,
+) -> Dict:
+    """Run the load and return a flat dict of results.
+
+    ``redis_commands`` is an optional callable returning the total number of
+    commands Redis has processed, used for the ops per request figure.
+    """
+    sampler = ProcessSampler(server_pid)
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    timeout = httpx.Timeout(120.0)
+    chat_url = base_url.rstrip("/") + chat_path
+    status_url = base_url.rstrip("/") + status_path
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        rss_before = sampler.rss_bytes()
+        cpu_before = sampler.cpu_seconds()
+        commands_before = redis_commands() if redis_commands else None
+        peak_rss = rss_before
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(coro_factory):
+            async with semaphore:
+                return await coro_factory()
+
+        async def sample_rss(stop: asyncio.Event):
+            nonlocal peak_rss
+            while not stop.is_set():
+                peak_rss = max(peak_rss, sampler.rss_bytes())
+                await asyncio.sleep(0.05)
+
+        stop = asyncio.Event()
+        sampler_task = asyncio.create_task(sample_rss(stop))
+        wall_start = time.perf_counter()
+        chat_results = await asyncio.gather(
+            *(
+                limited(
+                    lambda: run_chat_stream(
+                        client,
+                        chat_url,
+                        random.choice(api_keys),
+                        random.choice(models),
+                        client_type,
+                    )
+                )
+                for _ in range(streams)
+            )
+        )
+        chat_wall = time.perf_counter() - wall_start
+        cpu_after_chat = sampler.cpu_seconds()
+        stop.set()
+        await sampler_task
+
+        status_results = await asyncio.gather(
+            *(
+                limited(lambda: run_status_request(client, status_url))
+                for _ in range(status_requests)
+            )
+        )
+        commands_after = redis_commands() if redis_commands else None
+
+    ttfts = [r["ttft"] for r in chat_results if r["ok"] and r["ttft"] is not None]
+    completed = sum(1 for r in chat_results if r["ok"])
+    status_latencies = [r["duration"] for r in status_results if r["ok"]]
+    cpu_used = cpu_after_chat - cpu_before
+    total_requests = streams + status_requests
+
+    return {
+        "streams": streams,
+        "concurrency": concurrency,
+        "streams_completed": completed,
+        "ttft_p50_ms": _ms(percentile(ttfts, 50)),
+        "ttft_p99_ms": _ms(percentile(ttfts, 99)),
+        "streams_per_second": completed / chat_wall if chat_wall > 0 else None,
+        "streams_per_cpu_second": completed / cpu_used if cpu_used > 0 else None,
+        "memory_per_stream_kb": (
+            (peak_rss - rss_before) / concurrency / 1024 if server_pid else None
+        ),
+        "status_p50_ms": _ms(percentile(status_latencies, 50)),
+        "status_p99_ms": _ms(percentile(status_latencies, 99)),
+        "redis_ops_per_request": (
+            (commands_after - commands_before) / total_requests
+            if commands_before is not None
+            else None
+        ),
+    }
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000, 3)
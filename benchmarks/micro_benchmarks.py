@@ -0,0 +1,132 @@
+"""
+热路径组件的进程内微基准, 不需要 Redis 和上游服务.
+"""
+
+import asyncio
+import timeit
+from typing import Callable, Dict
+
+
+def _per_call_us(func: Callable, number: int) -> float:
+    timer = timeit.Timer(func)
+    best = min(timer.repeat(repeat=5, number=number))
+    return round(best / number * 1e6, 4)
+
+
+def bench_catalog_lookup(number: int = 200000) -> Dict[str, float]:
+    from rev_claude.catalog.bot_catalog import bot_catalog
+
+    bot_catalog.snapshot  # 首次加载不计入
+    return {
+        "catalog_points_exact_us": _per_call_us(
+            lambda: bot_catalog.get_points("gpt-4o"), number
+        ),
+        "catalog_points_casefold_us": _per_call_us(
+            lambda: bot_catalog.get_points("GPT-4o"), number
+        ),
+    }
+
+
+class _Status:
+    __slots__ = ("type", "idx", "usage")
+
+    def __init__(self, type, idx, usage):
+        self.type = type
+        self.idx = idx
+        self.usage = usage
+
+
+def bench_client_selector(clients: int = 500, number: int = 200000) -> Dict[str, float]:
+    from rev_claude.client.client_selector import ClientSelector, build_alias_table
+
+    status_list = [
+        _Status("plus" if i % 2 else "normal", i, (i * 37) % 101)
+        for i in range(clients)
+    ]
+    results = {}
+    for policy in ("usage_weighted", "least_in_flight", "power_of_two"):
+        selector = ClientSelector(policy)
+        selector.update(status_list)
+        results[f"select_{policy}_us"] = _per_call_us(
+            lambda: selector.select("plus"),
+            number if policy != "least_in_flight" else number // 20,
+        )
+    usages = [s.usage for s in status_list]
+    results["alias_table_build_us"] = _per_call_us(
+        lambda: build_alias_table(usages), 2000
+    )
+    return results
+
+
+def bench_sse_encoder(number: int = 200000) -> Dict[str, float]:
+    from rev_claude.utils.sse_encoder import SSEFrameEncoder
+    from rev_claude.utils.sse_utils import build_sse_data
+
+    encoder = SSEFrameEncoder("6f1c0b8e-bench-conversation")
+    delta = "streamed token "
+    return {
+        "sse_encoder_frame_us": _per_call_us(lambda: encoder.encode(delta), number),
+        "build_sse_data_frame_us": _per_call_us(
+            lambda: build_sse_data(
+                message=delta, id="6f1c0b8e-bench-conversation"
+            ).encode(),
+            number,
+        ),
+    }
+
+
+def bench_metrics(number: int = 200000) -> Dict[str, float]:
+    from rev_claude.metrics.prometheus_metrics import Histogram
+
+    histogram = Histogram("bench_seconds", "bench", ("stage",))
+    return {
+        "histogram_observe_us": _per_call_us(
+            lambda: histogram.observe(0.003, "bench"), number
+        )
+    }
+
+
+def bench_write_behind(writes: int = 20000) -> Dict[str, float]:
+    from rev_claude.utils.write_behind_queue import WriteBehindQueue
+
+    async def run():
+        queue = WriteBehindQueue(batch_size=256, flush_interval=0.002)
+        flushed = []
+
+        async def flush(batch):
+            flushed.append(len(batch))
+
+        queue._flush = flush
+        queue.start()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i in range(writes):
+            await queue.push_usage(f"key-{i % 100}", 10)
+        await queue.stop()
+        return (loop.time() - start) / writes * 1e6, writes / max(len(flushed), 1)
+
+    per_write_us, batch = asyncio.run(run())
+    return {
+        "write_behind_enqueue_us": round(per_write_us, 4),
+        "write_behind_avg_batch": round(batch, 2),
+    }
+
+
+MICRO_BENCHMARKS = {
+    "catalog": bench_catalog_lookup,
+    "selector": bench_client_selector,
+    "sse_encoder": bench_sse_encoder,
+    "metrics": bench_metrics,
+    "write_behind": bench_write_behind,
+}
+
+
+def run_micro_benchmarks() -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    for name, bench in MICRO_BENCHMARKS.items():
+        try:
+            results.update(bench())
+        except ImportError as e:
+            # 缺少部分模块时跳过这一组, 其余照常运行
+            print(f"skip {name}: {e}")
+    return results
@@ -0,0 +1,214 @@
+"""
+压测入口, 结果和 benchmarks/baselines 下的基线对比, 变差超过阈值时以非零状态退出.
+
+进程内微基准:
+    python -m benchmarks.run_benchmark micro
+完整压测(假上游 + 本地 Redis + 真实服务):
+    python -m benchmarks.run_benchmark load --streams 500 --concurrency 100
+冷启动的导入耗时(python -X importtime):
+    python -m benchmarks.run_benchmark imports --top 30
+更新基线:
+    python -m benchmarks.run_benchmark micro --update-baseline
+"""
+
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+import fire
+
+from benchmarks.fixtures import (
+    LocalRedis,
+    free_port,
+    sample_models,
+    seed_api_keys,
+    wait_for_port,
+)
+from benchmarks.import_profile import profile_imports
+from benchmarks.load_driver import drive_load
+from benchmarks.micro_benchmarks import run_micro_benchmarks
+
+BENCH_DIR = Path(__file__).parent
+ROOT = BENCH_DIR.parent
+BASELINE_DIR = BENCH_DIR / "baselines"
+DEFAULT_TOLERANCE = 0.15
+
+# 这些指标越大越好, 其余都是越小越好
+HIGHER_IS_BETTER = {
+    "streams_completed",
+    "streams_per_second",
+    "streams_per_cpu_second",
+    "write_behind_avg_batch",
+}
+# 只是压测参数, 不参与对比
+NOT_COMPARED = {"streams", "concurrency", "imported_modules"}
+
+
+def compare_with_baseline(
+    results: Dict[str, float], baseline: Dict[str, float], tolerance: float
+) -> Dict[str, dict]:
+    regressions = {}
+    for name, value in results.items():
+        base = baseline.get(name)
+        if name in NOT_COMPARED or value is None or not base:
+            continue
+        change = (value - base) / abs(base)
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions[name] = {
+                "baseline": base,
+                "current": value,
+                "change": round(change, 4),
+            }
+    return regressions
+
+
+def _report(
+    name: str, results: Dict[str, float], update_baseline: bool, tolerance: float
+) -> int:
+    payload = {
+        "results": results,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": int(time.time()),
+    }
+    print(json.dumps(payload, indent=2))
+    baseline_path = BASELINE_DIR / f"{name}.json"
+    if update_baseline:
+        baseline_path.write_text(json.dumps(payload, indent=2) + "\n")
+        print(f"Baseline written to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}, run with --update-baseline first")
+        return 1
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = compare_with_baseline(results, baseline, tolerance)
+    if regressions:
+        print(f"Regressions beyond {tolerance:.0%}:")
+        print(json.dumps(regressions, indent=2))
+        return 1
+    print(f"No regressions beyond {tolerance:.0%} against {baseline_path}")
+    return 0
+
+
+def micro(update_baseline: bool = False, tolerance: float = DEFAULT_TOLERANCE):
+    sys.exit(_report("micro", run_micro_benchmarks(), update_baseline, tolerance))
+
+
+def imports(
+    module: str = "main",
+    runs: int = 3,
+    top: int = 20,
+    update_baseline: bool = False,
+    tolerance: float = DEFAULT_TOLERANCE,
+):
+    """Profile the cold import of ``module`` and list the slowest modules."""
+    results, slowest = profile_imports(module, runs=runs, top=top)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_ms, cumulative_ms in slowest:
+        print(f"{cumulative_ms:14.1f} {self_ms:9.1f}  {name}")
+    sys.exit(_report("imports", results, update_baseline, tolerance))
+
+
+def load(
+    streams: int = 200,
+    concurrency: int = 50,
+    status_requests: int = 200,
+    api_keys: int = 100,
+    models: int = 20,
+    tokens_per_second: float = 40.0,
+    jitter: float = 0.3,
+    tokens: int = 200,
+    upstream_clients: int = 4,
+    redis_backend: str = "auto",
+    chat_path: str = "/api/v1/claude/form_chat",
+    client_type: str = "plus",
+    update_baseline: bool = False,
+    tolerance: float = DEFAULT_TOLERANCE,
+):
+    """Start a fake upstream, a local Redis and the server, then drive load.
+
+    The server runs through benchmarks.bench_server, which replaces the
+    upstream clients with ``upstream_clients`` fake clients per type that
+    stream from the fake upstream.
+    """
+    redis_server = LocalRedis(backend=redis_backend).start()
+    upstream_port = free_port()
+    server_port = free_port()
+    processes = []
+    try:
+        keys = seed_api_keys(redis_server.client(), api_keys)
+        model_names = list(sample_models(models))
+
+        processes.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.fake_upstream",
+                    f"--port={upstream_port}",
+                    f"--tokens_per_second={tokens_per_second}",
+                    f"--jitter={jitter}",
+                    f"--tokens={tokens}",
+                ],
+                cwd=ROOT,
+            )
+        )
+        wait_for_port(upstream_port)
+
+        env = dict(
+            os.environ,
+            REDIS_HOST="127.0.0.1",
+            REDIS_PORT=str(redis_server.port),
+            WEB_SEARCH_PROVIDER="stub",
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_server",
+                f"--upstream_url=http://127.0.0.1:{upstream_port}/bot/",
+                f"--port={server_port}",
+                "--host=127.0.0.1",
+                f"--clients={upstream_clients}",
+            ],
+            cwd=ROOT,
+            env=env,
+        )
+        processes.append(server)
+        wait_for_port(server_port, timeout=60)
+
+        results = asyncio.run(
+            drive_load(
+                f"http://127.0.0.1:{server_port}",
+                keys,
+                model_names,
+                streams=streams,
+                concurrency=concurrency,
+                status_requests=status_requests,
+                chat_path=chat_path,
+                client_type=client_type,
+                server_pid=server.pid,
+                redis_commands=redis_server.total_commands,
+            )
+        )
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        redis_server.stop()
+    sys.exit(_report("load", results, update_baseline, tolerance))
+
+
+if __name__ == "__main__":
+    fire.Fire({"micro": micro, "load": load, "imports": imports})
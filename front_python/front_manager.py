@@ -2,7 +2,6 @@ import streamlit as st
 import requests
 import pandas as pd
 import altair as alt
-from tqdm import tqdm
 from urllib.request import urlopen
 
 
@@ -41,6 +40,8 @@ if main_function == "API密钥管理":
             "获取所有API密钥",
             "重置API密钥使用量",  # Add this line
             "延长API密钥过期时间",  # 新增这一行
+            "批量重置API密钥使用量",
+            "批量延长API密钥过期时间",
         ],
     )
 
@@ -124,15 +125,28 @@ if main_function == "API密钥管理":
 
     elif api_key_function == "获取所有API密钥":
         st.subheader("获取所有API密钥")
-
-        if st.button("获取所有API密钥"):
-            # url = f"{BASE_URL}/api/v1/api_key/list_keys"
-            url = f"{API_KEY_ROUTER}/list_keys"
+        list_key_type = st.selectbox("密钥类型", ["全部", "plus", "basic"])
+        page_size = st.number_input("每页数量", min_value=1, value=500, step=100)
+
+        # 服务端按 SCAN 游标分页, 游标为 0 表示已经取完
+        if "list_keys_cursor" not in st.session_state:
+            st.session_state.list_keys_cursor = 0
+        if st.button("从头开始"):
+            st.session_state.list_keys_cursor = 0
+
+        if st.button("获取下一页"):
+            url = f"{API_KEY_ROUTER}/list_keys_page"
+            params = {"cursor": st.session_state.list_keys_cursor, "count": page_size}
+            if list_key_type != "全部":
+                params["key_type"] = list_key_type
             headers = {"accept": "application/json"}
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, params=params)
             if response.status_code == 200:
-                api_keys = response.json()
-                st.write(api_keys)
+                page = response.json()
+                st.session_state.list_keys_cursor = page["cursor"]
+                st.write(page["keys"])
+                if page["cursor"] == 0:
+                    st.info("已经是最后一页。")
             else:
                 st.error("获取API密钥列表失败。")
 
@@ -145,29 +159,15 @@ if main_function == "API密钥管理":
         )
 
         if st.button("绘制API密钥使用情况条状图"):
-            # url = f"{BASE_URL}/api/v1/api_key/list_keys"
-            url = f"{API_KEY_ROUTER}/list_keys"
+            # 排行由服务端的 Redis 有序集合计算, 不再下载全部 key
+            url = f"{API_KEY_ROUTER}/top_usage"
             headers = {"accept": "application/json"}
-            response = requests.get(url, headers=headers)
+            params = {"key_type": key_type, "top_n": top_n}
+            response = requests.get(url, headers=headers, params=params)
             if response.status_code == 200:
-                api_keys = response.json()
-                api_key_usage = []
-
-                for api_key, info in tqdm(api_keys.items()):
-                    try:
-                        type = info["key_type"]
-                        if type == key_type:
-                            api_key_usage.append(
-                                {"api_key": api_key, "usage": info["usage"]}
-                            )
-                    except Exception as e:
-                        pass
+                api_key_usage = response.json()
 
                 api_key_usage_df = pd.DataFrame(api_key_usage)
-
-                api_key_usage_df = api_key_usage_df.sort_values(
-                    "usage", ascending=False
-                ).head(top_n)
                 chart = (
                     alt.Chart(api_key_usage_df)
                     .mark_bar()
@@ -186,6 +186,51 @@ if main_function == "API密钥管理":
                 st.error("获取API密钥列表失败。")
 
                 st.subheader("查看API密钥使用情况")
+
+        st.subheader("API密钥用量趋势")
+        granularity = st.selectbox("统计粒度", ["hourly", "daily"])
+        points = st.number_input("显示的时间段数量", min_value=1, value=24, step=1)
+
+        if st.button("绘制用量趋势图"):
+            # 总量和按小时/按天的统计都是计费时增量维护的, 直接读取
+            totals_response = requests.get(f"{API_KEY_ROUTER}/usage_totals")
+            series_response = requests.get(
+                f"{API_KEY_ROUTER}/usage_timeseries",
+                params={"granularity": granularity, "points": points},
+            )
+            if (
+                totals_response.status_code == 200
+                and series_response.status_code == 200
+            ):
+                st.write(totals_response.json())
+                usage_rows = [
+                    {
+                        "bucket": row["bucket"],
+                        "key_type": usage_key_type,
+                        "points": usage["points"],
+                        "requests": usage["requests"],
+                    }
+                    for row in series_response.json()
+                    for usage_key_type, usage in row["usage"].items()
+                ]
+                if usage_rows:
+                    usage_df = pd.DataFrame(usage_rows)
+                    chart = (
+                        alt.Chart(usage_df)
+                        .mark_line(point=True)
+                        .encode(
+                            x=alt.X("bucket:N", title="时间(UTC)"),
+                            y=alt.Y("points:Q", title="使用积分"),
+                            color="key_type:N",
+                            tooltip=["bucket", "key_type", "points", "requests"],
+                        )
+                    )
+                    st.altair_chart(chart, use_container_width=True)
+                else:
+                    st.info("这段时间内没有使用记录。")
+            else:
+                st.error("获取API密钥用量统计失败。")
+
         api_key = st.text_input("请输入要查看的API密钥")
 
         if st.button("查看API密钥使用情况"):
@@ -230,6 +275,61 @@ if main_function == "API密钥管理":
                 st.error("延长API密钥过期时间失败。")
                 st.write(response.text)
 
+    elif api_key_function == "批量重置API密钥使用量":
+        st.subheader("批量重置API密钥使用量")
+        api_keys_to_reset = st.text_area("输入要重置的API密钥（每行一个或用逗号分隔）")
+
+        if st.button("批量重置使用量"):
+            api_keys_list = [
+                key.strip().strip("'\"")
+                for line in api_keys_to_reset.split("\n")
+                for key in line.split(",")
+                if key.strip()
+            ]
+            if api_keys_list:
+                url = f"{API_KEY_ROUTER}/batch_reset_usage"
+                response = requests.post(url, json={"api_keys": api_keys_list})
+                if response.status_code == 200:
+                    result = response.json()
+                    st.success(f"成功重置 {len(result['reset'])} 个API密钥。")
+                    st.write(result)
+                else:
+                    st.error("批量重置API密钥使用量失败。")
+                    st.write(response.text)
+            else:
+                st.warning("请输入至少一个API密钥。")
+
+    elif api_key_function == "批量延长API密钥过期时间":
+        st.subheader("批量延长API密钥过期时间")
+        api_keys_to_extend = st.text_area("输入要延长的API密钥（每行一个或用逗号分隔）")
+        additional_days = st.number_input("要延长的天数", min_value=1, value=30, step=1)
+
+        if st.button("批量延长过期时间"):
+            api_keys_list = [
+                key.strip().strip("'\"")
+                for line in api_keys_to_extend.split("\n")
+                for key in line.split(",")
+                if key.strip()
+            ]
+            if api_keys_list:
+                url = f"{API_KEY_ROUTER}/batch_extend_expiration"
+                payload = {
+                    "api_keys": api_keys_list,
+                    "additional_days": additional_days,
+                }
+                response = requests.post(url, json=payload)
+                if response.status_code == 200:
+                    result = response.json()
+                    st.success(
+                        f"成功延长 {len(result['expiration_seconds'])} 个API密钥。"
+                    )
+                    st.write(result)
+                else:
+                    st.error("批量延长API密钥过期时间失败。")
+                    st.write(response.text)
+            else:
+                st.warning("请输入至少一个API密钥。")
+
 
 elif main_function == "Cookie管理":
     # Cookie管理部分
@@ -1,57 +1,170 @@
-import argparse
-import fire
-import uvicorn
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Optional
+
 from loguru import logger
-from rev_claude.client.client_manager import ClientManager
-from rev_claude.configs import LOG_DIR
-from rev_claude.lifespan import lifespan
-from rev_claude.middlewares.register_middlewares import register_middleware
-from rev_claude.router import router
-from rev_claude.status.clients_status_manager import ClientsStatus
-from utility import get_client_status
-parser = argparse.ArgumentParser()
-parser.add_argument("--host", default="0.0.0.0", help="host")
-parser.add_argument("--port", default=6238, help="port")
-args = parser.parse_args()
-logger.add(LOG_DIR / "log_file.log", rotation="1 week")  # 每周轮换一次文件
-app = FastAPI(lifespan=lifespan)
-app = register_middleware(app)
-
-
-@app.get("/api/v1/clients_status")
-async def _get_client_status(show_details: bool = False):
-    if not show_details:
-        basic_clients, plus_clients = ClientManager().get_clients()
-        all_status = await get_client_status(basic_clients, plus_clients)
-        # Group by type and aggregate usage
-        grouped_status = {}
-        for status in all_status:
-            client_type = status.type
-            if client_type not in grouped_status:
-                grouped_status[client_type] = status.model_dump()
-                grouped_status[client_type]["usage"] = status.usage
-            else:
-                grouped_status[client_type]["usage"] += status.usage
-
-        # Convert back to list format with one entry per type
-        result = [ClientsStatus(**status) for status in grouped_status.values()]
-        return result
-    else:
-        basic_clients, plus_clients = ClientManager().get_clients()
-        return await get_client_status(basic_clients, plus_clients)
-
-
-def start_server(port=args.port, host=args.host):
-    logger.info(f"Starting server at {host}:{port}")
+from rev_claude.configs import GRACEFUL_SHUTDOWN_TIMEOUT, LOG_DIR, SERVER_WORKERS
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
+# start_server 添加的主日志文件 sink, 单进程运行时 lifespan 直接沿用
+_main_log_sink: Optional[int] = None
+_app: Optional["FastAPI"] = None
+
+
+def _add_log_sink(filename: str) -> int:
+    # 每周轮换一次文件
+    return logger.add(LOG_DIR / filename, rotation="1 week")
+
+
+def create_app() -> "FastAPI":
+    """Build the app; the subsystems are imported here, not when main is imported.
+
+    The multi-worker parent process and the CLI never build an app, so
+    they don't pay for importing the router, catalog, tokenizer and friends.
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+    from rev_claude.api_key.api_key_bulk_router import router as api_key_bulk_router
+    from rev_claude.api_key.api_key_cache import api_key_cache
+    from rev_claude.catalog.bot_catalog import bot_catalog
+    from rev_claude.catalog.catalog_assets import catalog_assets
+    from rev_claude.catalog.catalog_router import router as catalog_router
+    from rev_claude.client.shared_client_state import shared_client_state
+    from rev_claude.lifespan import lifespan
+    from rev_claude.metrics.prometheus_metrics import registry as metrics_registry
+    from rev_claude.middlewares.api_key_invalidation_middleware import (
+        APIKeyInvalidationMiddleware,
+    )
+    from rev_claude.middlewares.register_middlewares import register_middleware
+    from rev_claude.prompts_builder.web_search_service import web_search_service
+    from rev_claude.router import router
+    from rev_claude.status.clients_status_snapshot import clients_status_snapshot
+    from rev_claude.utils.async_redis_utils import close_async_redis
+    from rev_claude.utils.document_convert_cache import document_convert_cache
+    from rev_claude.utils.resumable_stream import get_resumable_streams
+    from rev_claude.utils.tokenizer_service import tokenizer_service
+    from rev_claude.utils.write_behind_queue import write_behind_queue
+
+    async def _warm_up():
+        # 不在启动路径上等待: 加载 tokenizer 词表、预先序列化目录和头像、
+        # 导入 duckduckgo_search 都在线程里进行,
+        # uvicorn 可以先绑定端口开始服务, 没预热完的部分在第一次用到时再加载
+        for name, warm_up in (
+            ("tokenizer", tokenizer_service.start),
+            ("catalog assets", catalog_assets.start),
+            ("web search", web_search_service.warm_up),
+        ):
+            try:
+                await warm_up()
+            except Exception as e:
+                logger.warning(f"Warm-up of {name} failed: {e}")
+
+    @asynccontextmanager
+    async def app_lifespan(app: FastAPI):
+        # 多 worker(uvicorn --workers 或 gunicorn)时每个进程写自己的文件,
+        # 多个进程轮换同一个文件会互相覆盖; 不放在模块级, 因为 worker 会导入
+        # main.py 两次(__mp_main__ 和 main), 每行日志会写两遍
+        worker_log_sink = None
+        if _main_log_sink is None:
+            worker_log_sink = _add_log_sink(f"log_file.{os.getpid()}.log")
+        try:
+            async with lifespan(app):
+                bot_catalog.start()
+                warm_up_task = asyncio.get_running_loop().create_task(_warm_up())
+                clients_status_snapshot.start()
+                api_key_cache.start()
+                write_behind_queue.start()
+                shared_client_state.start()
+                try:
+                    yield
+                finally:
+                    warm_up_task.cancel()
+                    # 先让后台生成的流写完, 它们结束时还要写历史和用量
+                    await get_resumable_streams().stop()
+                    await shared_client_state.stop()
+                    await write_behind_queue.stop()
+                    await api_key_cache.stop()
+                    await clients_status_snapshot.stop()
+                    await bot_catalog.stop()
+                    document_convert_cache.shutdown()
+                    tokenizer_service.shutdown()
+                    await close_async_redis()
+        finally:
+            if worker_log_sink is not None:
+                logger.remove(worker_log_sink)
+
+    app = FastAPI(lifespan=app_lifespan)
+    app = register_middleware(app)
+    app.add_middleware(APIKeyInvalidationMiddleware)
+
+    @app.get("/api/v1/clients_status")
+    async def _get_client_status(show_details: bool = False):
+        if not show_details:
+            # 按类型聚合后的结果随快照缓存, 只有快照更新时才重新计算
+            return await clients_status_snapshot.get_grouped()
+        else:
+            return await clients_status_snapshot.get()
+
+    @app.get("/api/v1/metrics", response_class=PlainTextResponse)
+    async def _get_metrics():
+        # Prometheus text format
+        return PlainTextResponse(
+            metrics_registry.render(), media_type="text/plain; version=0.0.4"
+        )
+
     app.include_router(router)
-    config = uvicorn.Config(app, host=host, port=port)
-    server = uvicorn.Server(config=config)
+    app.include_router(api_key_bulk_router, prefix="/api/v1/api_key")
+    app.include_router(catalog_router)
+    return app
+
+
+def __getattr__(name: str):
+    # main:app 仍然可用(gunicorn、uvicorn), app 在第一次访问时才创建
+    if name == "app":
+        global _app
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def start_server(
+    port: int = 6238,
+    host: str = "0.0.0.0",
+    workers: int = SERVER_WORKERS,
+    graceful_timeout: int = GRACEFUL_SHUTDOWN_TIMEOUT,
+):
+    """Run the server; with workers > 1 each worker is a separate process.
+
+    On SIGTERM/SIGINT a worker stops accepting connections and waits up to
+    ``graceful_timeout`` seconds for open SSE streams before exiting.
+    The same app also runs under gunicorn:
+    gunicorn main:app -k uvicorn.workers.UvicornWorker -w 4 --graceful-timeout 300
+    """
+    import uvicorn
+
+    global _main_log_sink
+    # 启动过程的日志, 以及单进程运行时的全部日志
+    _main_log_sink = _add_log_sink("log_file.log")
+    logger.info(f"Starting server at {host}:{port} with {workers} worker(s)")
     try:
-        server.run()
+        uvicorn.run(
+            # 多进程模式下各 worker 通过导入路径自己创建 app, 主进程不创建
+            "main:create_app" if workers > 1 else create_app(),
+            factory=workers > 1,
+            host=host,
+            port=int(port),
+            workers=workers,
+            timeout_graceful_shutdown=graceful_timeout,
+        )
     finally:
         logger.info("Server shutdown.")
 
 
 if __name__ == "__main__":
+    import fire
+
     fire.Fire(start_server)
@@ -0,0 +1,267 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from rev_claude.api_key.api_key_cache import api_key_cache
+from rev_claude.api_key.api_key_layout import APIKeyRedisKeys
+from rev_claude.configs import (
+    API_KEY_REFRESH_INTERVAL,
+    API_KEY_TYPES,
+    BASIC_KEY_MAX_USAGE,
+    PLUS_KEY_MAX_USAGE,
+    USAGE_DAILY_RETENTION,
+    USAGE_HOURLY_RETENTION,
+)
+from rev_claude.utils.async_redis_utils import get_async_redis
+
+# 一次往返完成: 是否存在 / 激活 / 类型 / 当前用量 / 上限 / 剩余有效期
+CHECK_API_KEY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0}
+end
+local key_type = redis.call('GET', KEYS[2]) or 'basic'
+local current = tonumber(redis.call('GET', KEYS[3]) or '0') or 0
+local limit = redis.call('GET', KEYS[4])
+if not limit then
+    if key_type == 'plus' then limit = ARGV[2] else limit = ARGV[1] end
+end
+local newly_activated = 0
+if redis.call('GET', KEYS[5]) ~= '1' then
+    local days = tonumber(redis.call('GET', KEYS[6]) or '0') or 0
+    if days > 0 then
+        redis.call('EXPIRE', KEYS[1], math.floor(days * 86400))
+    end
+    redis.call('SET', KEYS[5], '1')
+    newly_activated = 1
+end
+return {1, key_type, tostring(current), tostring(limit), newly_activated, redis.call('TTL', KEYS[1])}
+"""
+
+# 原子地增加用量并检查是否超过上限, 同时增量维护按类型的用量排行、总量和按小时/天的统计
+INCREMENT_USAGE_SCRIPT = """
+local amount = tonumber(ARGV[1])
+local total = redis.call('INCRBY', KEYS[1], amount)
+local current = redis.call('INCRBY', KEYS[2], amount)
+if redis.call('TTL', KEYS[2]) < 0 then
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+end
+local key_type = redis.call('GET', KEYS[3]) or 'basic'
+local limit = redis.call('GET', KEYS[4])
+if not limit then
+    if key_type == 'plus' then limit = ARGV[3] else limit = ARGV[2] end
+end
+limit = tonumber(limit)
+local exceeded = 0
+if current >= limit then exceeded = 1 end
+-- 每个类型在 KEYS 中依次是排行集合和重建用的临时集合, 重建期间两边都要累加
+for i = 8, #ARGV do
+    if ARGV[i] == key_type then
+        local index = 8 + 2 * (i - 8)
+        redis.call('ZINCRBY', KEYS[index + 1], amount, ARGV[5])
+        if redis.call('EXISTS', KEYS[8]) == 1 then
+            redis.call('ZINCRBY', KEYS[index + 2], amount, ARGV[5])
+        end
+    end
+end
+for i = 5, 7 do
+    redis.call('HINCRBY', KEYS[i], key_type .. ':points', amount)
+    redis.call('HINCRBY', KEYS[i], key_type .. ':requests', 1)
+end
+for i = 6, 7 do
+    if redis.call('TTL', KEYS[i]) < 0 then
+        redis.call('EXPIRE', KEYS[i], ARGV[i])
+    end
+end
+return {total, current, tostring(limit), exceeded}
+"""
+
+USAGE_INDEX_PREFIX = "api_key_usage_index:"
+# 重建排行期间存在, 值为进行中的重建的 token
+USAGE_INDEX_REBUILD_KEY = f"{USAGE_INDEX_PREFIX}rebuild"
+USAGE_TOTALS_KEY = "api_key_usage_totals"
+USAGE_HOURLY_PREFIX = "api_key_usage_hourly:"
+USAGE_DAILY_PREFIX = "api_key_usage_daily:"
+USAGE_HOURLY_FORMAT = "%Y%m%d%H"
+USAGE_DAILY_FORMAT = "%Y%m%d"
+
+
+def usage_index_key(key_type: str) -> str:
+    return f"{USAGE_INDEX_PREFIX}{key_type}"
+
+
+def usage_index_staging_key(key_type: str) -> str:
+    return f"{usage_index_key(key_type)}:rebuild"
+
+
+def usage_bucket_keys(now: Optional[float] = None) -> Tuple[str, str]:
+    """Hourly and daily usage counter keys for ``now``, bucketed in UTC."""
+    now = time.gmtime(now)
+    return (
+        USAGE_HOURLY_PREFIX + time.strftime(USAGE_HOURLY_FORMAT, now),
+        USAGE_DAILY_PREFIX + time.strftime(USAGE_DAILY_FORMAT, now),
+    )
+
+
+class APIKeyState(BaseModel):
+    api_key: str
+    valid: bool
+    key_type: Optional[str] = None
+    current_usage: float = 0
+    usage_limit: float = 0
+    newly_activated: bool = False
+    # 剩余有效期(秒), -1 表示永不过期
+    ttl: int = -1
+
+    @property
+    def exceeded(self) -> bool:
+        return self.valid and self.current_usage >= self.usage_limit
+
+    @property
+    def exceed_message(self) -> str:
+        return (
+            f"您的APIKEY使用额度已经用完(已使用{int(self.current_usage)}积分, "
+            f"上限{int(self.usage_limit)}积分)，请联系管理员重置或者续费。"
+        )
+
+
+class UsageIncrementResult(BaseModel):
+    total_usage: int
+    current_usage: int
+    usage_limit: float
+    exceeded: bool
+
+
+class APIKeyAccounting:
+    """Async API key validation and usage accounting on redis.asyncio.
+
+    Validation, activation and the limit check are one Lua call; usage
+    increments are another, so each step costs a single round-trip.
+    """
+
+    def __init__(self, redis=None):
+        self.redis = redis or get_async_redis()
+        self._check_script = self.redis.register_script(CHECK_API_KEY_SCRIPT)
+        self._increment_script = self.redis.register_script(INCREMENT_USAGE_SCRIPT)
+
+    @staticmethod
+    def _check_keys(api_key: str) -> List[str]:
+        keys = APIKeyRedisKeys(api_key)
+        return [
+            keys.api_key,
+            keys.type,
+            keys.current_usage,
+            keys.usage_limit,
+            keys.is_activated,
+            keys.expiration_days,
+        ]
+
+    @staticmethod
+    def _check_args() -> list:
+        return [BASIC_KEY_MAX_USAGE, PLUS_KEY_MAX_USAGE]
+
+    @staticmethod
+    def _increment_keys(api_key: str) -> List[str]:
+        keys = APIKeyRedisKeys(api_key)
+        hourly_key, daily_key = usage_bucket_keys()
+        return [
+            keys.usage,
+            keys.current_usage,
+            keys.type,
+            keys.usage_limit,
+            USAGE_TOTALS_KEY,
+            hourly_key,
+            daily_key,
+            USAGE_INDEX_REBUILD_KEY,
+        ] + [
+            key
+            for key_type in API_KEY_TYPES
+            for key in (usage_index_key(key_type), usage_index_staging_key(key_type))
+        ]
+
+    @staticmethod
+    def _increment_args(api_key: str, amount: int) -> list:
+        return [
+            int(amount),
+            BASIC_KEY_MAX_USAGE,
+            PLUS_KEY_MAX_USAGE,
+            API_KEY_REFRESH_INTERVAL,
+            api_key,
+            USAGE_HOURLY_RETENTION,
+            USAGE_DAILY_RETENTION,
+            *API_KEY_TYPES,
+        ]
+
+    @staticmethod
+    def _parse_check(api_key: str, result) -> APIKeyState:
+        if not result or int(result[0]) == 0:
+            return APIKeyState(api_key=api_key, valid=False)
+        return APIKeyState(
+            api_key=api_key,
+            valid=True,
+            key_type=result[1],
+            current_usage=float(result[2]),
+            usage_limit=float(result[3]),
+            newly_activated=bool(int(result[4])),
+            ttl=int(result[5]),
+        )
+
+    @staticmethod
+    def _parse_increment(result) -> UsageIncrementResult:
+        return UsageIncrementResult(
+            total_usage=int(result[0]),
+            current_usage=int(result[1]),
+            usage_limit=float(result[2]),
+            exceeded=bool(int(result[3])),
+        )
+
+    async def check(self, api_key: str, use_cache: bool = True) -> APIKeyState:
+        if use_cache:
+            # 热点 key 直接命中本地缓存, 不访问 Redis
+            state = api_key_cache.get(api_key)
+            if state is not None:
+                return state
+        result = await self._check_script(
+            keys=self._check_keys(api_key), args=self._check_args()
+        )
+        state = self._parse_check(api_key, result)
+        api_key_cache.put(state.model_copy(update={"newly_activated": False}))
+        return state
+
+    async def increment_usage(self, api_key: str, amount: int) -> UsageIncrementResult:
+        result = await self._increment_script(
+            keys=self._increment_keys(api_key),
+            args=self._increment_args(api_key, amount),
+        )
+        result = self._parse_increment(result)
+        api_key_cache.update_usage(api_key, result.current_usage)
+        return result
+
+    async def increment_usage_many(
+        self, increments: Dict[str, int]
+    ) -> Dict[str, UsageIncrementResult]:
+        """Apply several usage increments in one pipelined round-trip."""
+        api_keys = list(increments)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for api_key in api_keys:
+                await self._increment_script(
+                    keys=self._increment_keys(api_key),
+                    args=self._increment_args(api_key, increments[api_key]),
+                    client=pipe,
+                )
+            raw_results = await pipe.execute()
+        results = {}
+        for api_key, raw in zip(api_keys, raw_results):
+            result = results[api_key] = self._parse_increment(raw)
+            api_key_cache.update_usage(api_key, result.current_usage)
+        return results
+
+
+_api_key_accounting: Optional[APIKeyAccounting] = None
+
+
+def get_api_key_accounting() -> APIKeyAccounting:
+    global _api_key_accounting
+    if _api_key_accounting is None:
+        _api_key_accounting = APIKeyAccounting()
+    return _api_key_accounting
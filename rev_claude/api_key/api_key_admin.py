@@ -0,0 +1,419 @@
+import asyncio
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import BaseModel
+
+from rev_claude.api_key.api_key_accounting import (
+    USAGE_DAILY_FORMAT,
+    USAGE_HOURLY_FORMAT,
+    USAGE_INDEX_PREFIX,
+    USAGE_INDEX_REBUILD_KEY,
+    USAGE_TOTALS_KEY,
+    usage_bucket_keys,
+    usage_index_key,
+    usage_index_staging_key,
+)
+from rev_claude.api_key.api_key_layout import (
+    API_KEY_FIELDS,
+    FIELD_KEY_MATCH,
+    APIKeyRedisKeys,
+    split_field_key,
+)
+from rev_claude.configs import (
+    API_KEY_BATCH_CHUNK_SIZE,
+    API_KEY_LIST_PAGE_SIZE,
+    API_KEY_TYPES,
+    API_KEY_USAGE_INDEX_REBUILD_INTERVAL,
+)
+from rev_claude.utils.async_redis_utils import get_async_redis
+
+# 批量重置当前用量, KEYS 为每个 key 的 (api_key, current_usage), 不存在的 key 返回 0
+BATCH_RESET_USAGE_SCRIPT = """
+local results = {}
+for i = 1, #KEYS, 2 do
+    local n = (i + 1) / 2
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('SET', KEYS[i + 1], 0)
+        results[n] = 1
+    else
+        results[n] = 0
+    end
+end
+return results
+"""
+
+# 批量延期: 已激活的 key 直接延长 TTL, 未激活的 key 增加 expiration_days
+# KEYS 为每个 key 的 (api_key, is_activated, expiration_days)
+# 返回新的 TTL(秒), -1 表示永不过期或尚未激活, -2 表示 key 不存在
+BATCH_EXTEND_EXPIRATION_SCRIPT = """
+local seconds = tonumber(ARGV[1])
+local days = tonumber(ARGV[2])
+local results = {}
+for i = 1, #KEYS, 3 do
+    local n = (i + 2) / 3
+    local ttl = redis.call('TTL', KEYS[i])
+    if ttl == -2 then
+        results[n] = -2
+    elseif ttl > 0 then
+        redis.call('EXPIRE', KEYS[i], ttl + seconds)
+        results[n] = ttl + seconds
+    else
+        if redis.call('GET', KEYS[i + 1]) ~= '1' then
+            redis.call('INCRBY', KEYS[i + 2], days)
+        end
+        results[n] = -1
+    end
+end
+return results
+"""
+
+
+# 开始重建: 抢占重建标记并清空上次遗留的临时集合
+# KEYS: 重建标记, 各类型的临时集合; ARGV: token, 标记的过期时间(秒)
+START_REBUILD_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('DEL', KEYS[i])
+end
+return 1
+"""
+
+# 把一批 key 的当前总用量原子地写入临时集合, 覆盖重建期间已经累加的增量
+# KEYS: 重建标记, n 个类型的临时集合, 然后每个 key 的 (type, usage)
+# ARGV: token, 临时集合的过期时间(秒), n, n 个类型, 然后每个 key 的名字
+SEED_REBUILD_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local n = tonumber(ARGV[3])
+local staging = {}
+for i = 1, n do
+    staging[ARGV[3 + i]] = KEYS[1 + i]
+end
+for i = 4 + n, #ARGV do
+    local k = 2 + n + 2 * (i - 4 - n)
+    local target = staging[redis.call('GET', KEYS[k]) or 'basic']
+    if target then
+        local usage = tonumber(redis.call('GET', KEYS[k + 1]) or '0') or 0
+        redis.call('ZADD', target, usage, ARGV[i])
+    end
+end
+for i = 1, n do
+    redis.call('EXPIRE', KEYS[1 + i], ARGV[2])
+end
+return 1
+"""
+
+# 用临时集合替换排行, 并按排行重新计算各类型的总积分
+# KEYS: 重建标记, 总量 hash, 重建完成标记, 然后每个类型的 (临时集合, 排行集合)
+# ARGV: token, 重建完成标记的过期时间(秒), 当前时间, 各类型
+COMMIT_REBUILD_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for i = 4, #ARGV do
+    local staging = KEYS[4 + 2 * (i - 4)]
+    local index = KEYS[5 + 2 * (i - 4)]
+    local total = 0
+    local scores = redis.call('ZRANGE', staging, 0, -1, 'WITHSCORES')
+    for j = 2, #scores, 2 do
+        total = total + tonumber(scores[j])
+    end
+    if #scores > 0 then
+        redis.call('RENAME', staging, index)
+        redis.call('PERSIST', index)
+    else
+        redis.call('DEL', index)
+    end
+    redis.call('HSET', KEYS[2], ARGV[i] .. ':points', string.format('%d', total))
+end
+redis.call('DEL', KEYS[1])
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[2])
+return 1
+"""
+
+
+class BatchKeysRequest(BaseModel):
+    api_keys: List[str]
+
+
+class BatchExtendExpirationRequest(BaseModel):
+    api_keys: List[str]
+    additional_days: int
+
+
+# 存在即表示排行集合已经完整重建过, 之后靠 INCREMENT_USAGE_SCRIPT 增量维护
+USAGE_INDEX_READY_KEY = f"{USAGE_INDEX_PREFIX}ready"
+# 重建标记的过期时间, 重建中断后这么久才能重新开始
+USAGE_INDEX_REBUILD_TIMEOUT = 60 * 60
+
+
+def _chunks(items: List[str], size: int = API_KEY_BATCH_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class APIKeyAdmin:
+    """Bulk API key administration, one pipeline or Lua call per chunk of keys."""
+
+    def __init__(self, redis=None):
+        self.redis = redis or get_async_redis()
+        self._reset_script = self.redis.register_script(BATCH_RESET_USAGE_SCRIPT)
+        self._extend_script = self.redis.register_script(BATCH_EXTEND_EXPIRATION_SCRIPT)
+        self._start_rebuild_script = self.redis.register_script(START_REBUILD_SCRIPT)
+        self._seed_rebuild_script = self.redis.register_script(SEED_REBUILD_SCRIPT)
+        self._commit_rebuild_script = self.redis.register_script(COMMIT_REBUILD_SCRIPT)
+        self._rebuild_task: Optional[asyncio.Task] = None
+
+    async def _run_batch_script(
+        self, script, api_keys: List[str], fields: Tuple[str, ...], args: list
+    ) -> list:
+        results = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for chunk in _chunks(api_keys):
+                keys = []
+                for api_key in chunk:
+                    redis_keys = APIKeyRedisKeys(api_key)
+                    keys.extend(getattr(redis_keys, field) for field in fields)
+                await script(keys=keys, args=args, client=pipe)
+            for chunk_results in await pipe.execute():
+                results.extend(chunk_results)
+        return results
+
+    async def batch_reset_usage(self, api_keys: List[str]) -> Dict[str, bool]:
+        results = await self._run_batch_script(
+            self._reset_script, api_keys, ("api_key", "current_usage"), []
+        )
+        return {api_key: bool(int(r)) for api_key, r in zip(api_keys, results)}
+
+    async def batch_extend_expiration(
+        self, api_keys: List[str], additional_days: int
+    ) -> Dict[str, int]:
+        results = await self._run_batch_script(
+            self._extend_script,
+            api_keys,
+            ("api_key", "is_activated", "expiration_days"),
+            [additional_days * 86400, additional_days],
+        )
+        return {api_key: int(r) for api_key, r in zip(api_keys, results)}
+
+    async def _read_many(self, api_keys: List[str]) -> Dict[str, Tuple[int, list]]:
+        """TTL and raw API_KEY_FIELDS values of each existing key."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for api_key in api_keys:
+                keys = APIKeyRedisKeys(api_key)
+                pipe.ttl(keys.api_key)
+                for field in API_KEY_FIELDS:
+                    pipe.get(getattr(keys, field))
+            raw = await pipe.execute()
+        width = len(API_KEY_FIELDS) + 1
+        values = {}
+        for i, api_key in enumerate(api_keys):
+            ttl, *fields = raw[i * width : i * width + width]
+            if ttl != -2:
+                values[api_key] = (ttl, fields)
+        return values
+
+    @staticmethod
+    def _information(ttl: int, fields: list) -> dict:
+        raw = dict(zip(API_KEY_FIELDS, fields))
+        return {
+            "key_type": raw["type"] or "basic",
+            "usage": int(raw["usage"] or 0),
+            "current_usage": int(raw["current_usage"] or 0),
+            "usage_limit": float(raw["usage_limit"]) if raw["usage_limit"] else None,
+            "is_activated": raw["is_activated"] == "1",
+            "expiration_days": int(raw["expiration_days"] or 0),
+            "expiration_seconds": ttl,
+        }
+
+    async def _scan_page(
+        self, cursor: int, count: int
+    ) -> Tuple[int, Dict[str, Tuple[int, list]]]:
+        """One SCAN step over the field keys of APIKeyRedisKeys.
+
+        A key is reported on the step that returns its first existing field,
+        so a full SCAN lists each key once (SCAN's own repeats aside).
+        """
+        cursor, names = await self.redis.scan(
+            cursor=cursor, match=FIELD_KEY_MATCH, count=count
+        )
+        scanned: Dict[str, set] = {}
+        for name in names:
+            split = split_field_key(name)
+            if split is not None:
+                scanned.setdefault(split[0], set()).add(split[1])
+        values = await self._read_many(list(scanned)) if scanned else {}
+        page = {}
+        for api_key, (ttl, fields) in values.items():
+            first = next(
+                (field for field, value in zip(API_KEY_FIELDS, fields) if value),
+                None,
+            )
+            if first in scanned[api_key]:
+                page[api_key] = (ttl, fields)
+        return int(cursor), page
+
+    async def list_keys_page(
+        self,
+        cursor: int = 0,
+        count: int = API_KEY_LIST_PAGE_SIZE,
+        key_type: Optional[str] = None,
+    ) -> Tuple[int, Dict[str, dict]]:
+        """One SCAN step; a returned cursor of 0 means the listing is complete.
+
+        Like SCAN itself a page may hold fewer than ``count`` keys, even none.
+        """
+        cursor, page = await self._scan_page(cursor, count)
+        information = {
+            api_key: self._information(ttl, fields)
+            for api_key, (ttl, fields) in page.items()
+        }
+        if key_type is not None:
+            information = {
+                api_key: info
+                for api_key, info in information.items()
+                if info["key_type"] == key_type
+            }
+        return cursor, information
+
+    async def rebuild_usage_index(self) -> bool:
+        """Rebuild the per-type usage sorted sets and point totals from a full SCAN.
+
+        Returns False if another rebuild is running or this one lost its marker.
+        """
+        # 先写到临时集合, 期间的计费会同时累加到临时集合, 全部写完再原子替换
+        token = uuid.uuid4().hex
+        staging_keys = [usage_index_staging_key(t) for t in API_KEY_TYPES]
+        started = await self._start_rebuild_script(
+            keys=[USAGE_INDEX_REBUILD_KEY, *staging_keys],
+            args=[token, USAGE_INDEX_REBUILD_TIMEOUT],
+        )
+        if not int(started):
+            return False
+        cursor = None
+        while cursor != 0:
+            cursor, page = await self._scan_page(cursor or 0, API_KEY_BATCH_CHUNK_SIZE)
+            if not page:
+                continue
+            keys = [USAGE_INDEX_REBUILD_KEY, *staging_keys]
+            for api_key in page:
+                redis_keys = APIKeyRedisKeys(api_key)
+                keys.extend((redis_keys.type, redis_keys.usage))
+            seeded = await self._seed_rebuild_script(
+                keys=keys,
+                args=[
+                    token,
+                    USAGE_INDEX_REBUILD_TIMEOUT,
+                    len(API_KEY_TYPES),
+                    *API_KEY_TYPES,
+                    *page,
+                ],
+            )
+            if not int(seeded):
+                logger.warning("Usage index rebuild lost its marker, giving up.")
+                return False
+        keys = [USAGE_INDEX_REBUILD_KEY, USAGE_TOTALS_KEY, USAGE_INDEX_READY_KEY]
+        for key_type in API_KEY_TYPES:
+            keys.extend((usage_index_staging_key(key_type), usage_index_key(key_type)))
+        committed = await self._commit_rebuild_script(
+            keys=keys,
+            args=[
+                token,
+                API_KEY_USAGE_INDEX_REBUILD_INTERVAL,
+                int(time.time()),
+                *API_KEY_TYPES,
+            ],
+        )
+        return bool(int(committed))
+
+    async def _rebuild_in_background(self):
+        try:
+            await self.rebuild_usage_index()
+        except Exception:
+            from traceback import format_exc
+
+            logger.error(format_exc())
+
+    def _ensure_rebuild(self) -> asyncio.Task:
+        task = self._rebuild_task
+        if task is None or task.done():
+            task = self._rebuild_task = asyncio.get_running_loop().create_task(
+                self._rebuild_in_background()
+            )
+        return task
+
+    async def remove_from_usage_index(self, api_keys: List[str]):
+        """Drop deleted keys from the usage sorted sets, including a running rebuild's."""
+        if not api_keys:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key_type in API_KEY_TYPES:
+                pipe.zrem(usage_index_key(key_type), *api_keys)
+                pipe.zrem(usage_index_staging_key(key_type), *api_keys)
+            await pipe.execute()
+
+    async def top_usage(self, key_type: str, top_n: int = 10) -> List[dict]:
+        """Top keys by total usage, O(log n) from the incrementally kept sorted set."""
+        # 排行过期时先返回现有的, 在后台重建; 别的 worker 正在重建时不再重复
+        if not await self.redis.exists(USAGE_INDEX_READY_KEY, USAGE_INDEX_REBUILD_KEY):
+            self._ensure_rebuild()
+        rows = await self.redis.zrevrange(
+            usage_index_key(key_type), 0, top_n - 1, withscores=True
+        )
+        return [{"api_key": api_key, "usage": int(usage)} for api_key, usage in rows]
+
+    @staticmethod
+    def _parse_usage_hash(raw: Dict[str, str]) -> Dict[str, dict]:
+        # field 形如 plus:points / plus:requests
+        result: Dict[str, dict] = {}
+        for field, value in (raw or {}).items():
+            key_type, _, metric = field.rpartition(":")
+            result.setdefault(key_type, {"points": 0, "requests": 0})[metric] = int(
+                value
+            )
+        return result
+
+    async def usage_totals(self) -> Dict[str, dict]:
+        """Running points and request totals per key type."""
+        return self._parse_usage_hash(await self.redis.hgetall(USAGE_TOTALS_KEY))
+
+    async def usage_timeseries(
+        self, granularity: str = "hourly", points: int = 24
+    ) -> List[dict]:
+        """Per-type usage of the last ``points`` hours or days, oldest first, in UTC."""
+        step = {"hourly": 60 * 60, "daily": 24 * 60 * 60}.get(granularity)
+        if step is None:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        label_format = (
+            USAGE_HOURLY_FORMAT if granularity == "hourly" else USAGE_DAILY_FORMAT
+        )
+        now = time.time()
+        bucket_times = [now - step * i for i in range(points - 1, -1, -1)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for bucket_time in bucket_times:
+                hourly_key, daily_key = usage_bucket_keys(bucket_time)
+                pipe.hgetall(hourly_key if granularity == "hourly" else daily_key)
+            raw = await pipe.execute()
+        return [
+            {
+                "bucket": time.strftime(label_format, time.gmtime(bucket_time)),
+                "usage": self._parse_usage_hash(bucket),
+            }
+            for bucket_time, bucket in zip(bucket_times, raw)
+        ]
+
+
+_api_key_admin: Optional[APIKeyAdmin] = None
+
+
+def get_api_key_admin() -> APIKeyAdmin:
+    global _api_key_admin
+    if _api_key_admin is None:
+        _api_key_admin = APIKeyAdmin()
+    return _api_key_admin
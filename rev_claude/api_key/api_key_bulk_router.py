@@ -0,0 +1,76 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from rev_claude.api_key.api_key_admin import (
+    APIKeyAdmin,
+    BatchExtendExpirationRequest,
+    BatchKeysRequest,
+    get_api_key_admin,
+)
+from rev_claude.configs import API_KEY_LIST_PAGE_SIZE
+
+# 挂载在 /api/v1/api_key 下, 批量接口名以 batch_ 开头,
+# APIKeyInvalidationMiddleware 会在成功后让各 worker 的 key 缓存失效
+router = APIRouter()
+
+
+@router.post("/batch_reset_usage")
+async def batch_reset_usage(
+    request: BatchKeysRequest, admin: APIKeyAdmin = Depends(get_api_key_admin)
+):
+    results = await admin.batch_reset_usage(request.api_keys)
+    return {
+        "reset": [api_key for api_key, ok in results.items() if ok],
+        "not_found": [api_key for api_key, ok in results.items() if not ok],
+    }
+
+
+@router.post("/batch_extend_expiration")
+async def batch_extend_expiration(
+    request: BatchExtendExpirationRequest,
+    admin: APIKeyAdmin = Depends(get_api_key_admin),
+):
+    results = await admin.batch_extend_expiration(
+        request.api_keys, request.additional_days
+    )
+    return {
+        "expiration_seconds": {
+            api_key: ttl for api_key, ttl in results.items() if ttl != -2
+        },
+        "not_found": [api_key for api_key, ttl in results.items() if ttl == -2],
+    }
+
+
+@router.get("/list_keys_page")
+async def list_keys_page(
+    cursor: int = 0,
+    count: int = Query(API_KEY_LIST_PAGE_SIZE, ge=1, le=10000),
+    key_type: Optional[str] = None,
+    admin: APIKeyAdmin = Depends(get_api_key_admin),
+):
+    next_cursor, keys = await admin.list_keys_page(cursor, count, key_type)
+    return {"cursor": next_cursor, "keys": keys}
+
+
+@router.get("/top_usage")
+async def top_usage(
+    key_type: str = "plus",
+    top_n: int = Query(10, ge=1, le=1000),
+    admin: APIKeyAdmin = Depends(get_api_key_admin),
+):
+    return await admin.top_usage(key_type, top_n)
+
+
+@router.get("/usage_totals")
+async def usage_totals(admin: APIKeyAdmin = Depends(get_api_key_admin)):
+    return await admin.usage_totals()
+
+
+@router.get("/usage_timeseries")
+async def usage_timeseries(
+    granularity: str = Query("hourly", pattern="^(hourly|daily)$"),
+    points: int = Query(24, ge=1, le=400),
+    admin: APIKeyAdmin = Depends(get_api_key_admin),
+):
+    return await admin.usage_timeseries(granularity, points)
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from loguru import logger
+
+from rev_claude.configs import API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL
+from rev_claude.utils.async_redis_utils import get_async_redis
+
+API_KEY_INVALIDATION_CHANNEL = "api_key:invalidate"
+# 广播这个值表示清空所有 worker 的缓存
+INVALIDATE_ALL = "*"
+
+
+class APIKeyCache:
+    """Bounded LRU/TTL cache of API key state, local to one worker.
+
+    Entries are dropped across all workers through Redis pub/sub whenever
+    an admin endpoint changes a key.
+    """
+
+    def __init__(
+        self, maxsize: int = API_KEY_CACHE_SIZE, ttl: float = API_KEY_CACHE_TTL
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # api_key -> (expires_at, APIKeyState)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._listen_task: Optional[asyncio.Task] = None
+
+    def get(self, api_key: str):
+        entry = self._entries.get(api_key)
+        if entry is None:
+            return None
+        expires_at, state = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(api_key, None)
+            return None
+        self._entries.move_to_end(api_key)
+        return state
+
+    def put(self, state):
+        if self.maxsize <= 0 or not state.valid:
+            return
+        ttl = self.ttl
+        if state.ttl > 0:
+            # 不要让缓存比 key 本身活得更久
+            ttl = min(ttl, state.ttl)
+        self._entries[state.api_key] = (time.monotonic() + ttl, state)
+        self._entries.move_to_end(state.api_key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def update_usage(self, api_key: str, current_usage: float):
+        entry = self._entries.get(api_key)
+        if entry is not None:
+            entry[1].current_usage = current_usage
+
+    def invalidate(self, api_keys: Iterable[str]):
+        for api_key in api_keys:
+            if api_key == INVALIDATE_ALL:
+                self._entries.clear()
+                return
+            self._entries.pop(api_key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def publish_invalidation(self, api_keys: Iterable[str]):
+        api_keys = list(api_keys)
+        self.invalidate(api_keys)
+        await get_async_redis().publish(
+            API_KEY_INVALIDATION_CHANNEL, json.dumps(api_keys)
+        )
+
+    def _on_message(self, data: str):
+        try:
+            api_keys = json.loads(data)
+        except ValueError:
+            api_keys = [data]
+        if isinstance(api_keys, str):
+            api_keys = [api_keys]
+        self.invalidate(api_keys)
+
+    async def _listen(self):
+        while True:
+            pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(API_KEY_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._on_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                from traceback import format_exc
+
+                logger.error(format_exc())
+                # 订阅断开期间可能错过失效消息, 直接清空
+                self.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def start(self):
+        if self._listen_task is None:
+            self._listen_task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+
+
+api_key_cache = APIKeyCache()
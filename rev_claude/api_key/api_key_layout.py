@@ -0,0 +1,45 @@
+from typing import Optional, Tuple
+
+# 一个 API key 在 Redis 中的全部字段, 每个字段是一个独立的 string key: {api_key}:{field}
+API_KEY_FIELDS: Tuple[str, ...] = (
+    "type",
+    "usage",
+    "current_usage",
+    "usage_limit",
+    "is_activated",
+    "expiration_days",
+)
+
+
+def field_key(api_key: str, field: str) -> str:
+    if field not in API_KEY_FIELDS:
+        raise ValueError(f"Unknown API key field: {field}")
+    return f"{api_key}:{field}"
+
+
+class APIKeyRedisKeys:
+    """Redis key names of one API key.
+
+    This module is the only definition of the layout: the accounting
+    scripts, the bulk admin operations and the benchmarks all build key
+    names through it, and so must any other code that reads or writes keys.
+    """
+
+    __slots__ = ("api_key",) + API_KEY_FIELDS
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        for field in API_KEY_FIELDS:
+            setattr(self, field, field_key(api_key, field))
+
+
+# SCAN 时匹配的 key 名, 再用 split_field_key 按字段名过滤
+FIELD_KEY_MATCH = "*:*"
+
+
+def split_field_key(name: str) -> Optional[Tuple[str, str]]:
+    """(api_key, field) of a field key name, or None for any other key."""
+    api_key, sep, field = name.rpartition(":")
+    if not sep or not api_key or field not in API_KEY_FIELDS:
+        return None
+    return api_key, field
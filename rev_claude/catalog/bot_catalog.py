@@ -0,0 +1,300 @@
+import asyncio
+import json
+import signal
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from rev_claude.configs import (
+    BOT_CATALOG_RELOAD_INTERVAL,
+    POE_BOT_INFO,
+    POE_BOT_INFO_ZH,
+    POE_BOT_POLICY,
+)
+
+# 语言与文件一一对应, 元组下标即 BotRecord 中多语言字段的下标
+LOCALES: Tuple[str, ...] = ("en", "zh")
+LOCALE_FILES: Tuple[Path, ...] = (POE_BOT_INFO, POE_BOT_INFO_ZH)
+DEFAULT_LOCALE = "en"
+WATCHED_FILES: Tuple[Path, ...] = LOCALE_FILES + (POE_BOT_POLICY,)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class BotRecord:
+    """One bot of the catalog, shared by all locales."""
+
+    __slots__ = (
+        "name",
+        "base_model",
+        "tokens",
+        "points",
+        "premium_model",
+        "text2image",
+        "endpoints",
+        "object",
+        "path",
+        "cache_ttl",
+        "cache_hit_points",
+        # 以下两个字段按 LOCALES 的顺序存放各语言的值
+        "owned_by",
+        "desc",
+    )
+
+    def __init__(self, name: str, info: dict):
+        self.name = name
+        self.base_model = _intern(info.get("baseModel"))
+        self.tokens = info.get("tokens")
+        self.points = info.get("points")
+        self.premium_model = info.get("premium_model", False)
+        self.text2image = info.get("text2image")
+        self.endpoints = tuple(_intern(e) for e in info.get("endpoints", ()))
+        self.object = _intern(info.get("object", "model"))
+        self.path = info.get("path")
+        # 响应缓存的有效期(秒), None 表示不缓存, 来自 models_policy.json
+        self.cache_ttl: Optional[int] = None
+        # 命中响应缓存时扣的积分, None 表示和正常请求一样计费
+        self.cache_hit_points: Optional[int] = None
+        self.owned_by = [None] * len(LOCALES)
+        self.desc = [None] * len(LOCALES)
+
+    def set_locale_fields(self, locale_idx: int, info: dict):
+        self.owned_by[locale_idx] = _intern(info.get("owned_by"))
+        self.desc[locale_idx] = info.get("desc")
+
+    def freeze(self):
+        # 某个语言文件里缺失的机器人, 用其他语言的描述兜底
+        fallback_owner = next((o for o in self.owned_by if o is not None), None)
+        fallback_desc = next((d for d in self.desc if d is not None), None)
+        self.owned_by = tuple(
+            o if o is not None else fallback_owner for o in self.owned_by
+        )
+        self.desc = tuple(d if d is not None else fallback_desc for d in self.desc)
+
+    def to_dict(self, locale: str = DEFAULT_LOCALE) -> dict:
+        locale_idx = _locale_index(locale)
+        info = {
+            "baseModel": self.base_model,
+            "tokens": self.tokens,
+            "endpoints": list(self.endpoints),
+            "premium_model": self.premium_model,
+            "object": self.object,
+            "owned_by": self.owned_by[locale_idx],
+            "path": self.path,
+            "desc": self.desc[locale_idx],
+            "points": self.points,
+        }
+        if self.text2image is not None:
+            info["text2image"] = self.text2image
+        return info
+
+
+class CatalogSnapshot:
+    """An immutable view of the catalog, swapped as a whole on reload."""
+
+    __slots__ = ("records", "billing", "mtimes", "version")
+
+    def __init__(
+        self,
+        records: Dict[str, BotRecord],
+        mtimes: Tuple[float, ...],
+        version: int,
+    ):
+        # 名称索引, key 为 casefold 后的名字
+        self.records = records
+        # 计费热路径只需要 (points, tokens), 单独存一张小表
+        self.billing: Dict[str, Tuple[Optional[int], Optional[int]]] = {
+            name: (record.points, record.tokens) for name, record in records.items()
+        }
+        self.mtimes = mtimes
+        self.version = version
+
+
+def _locale_index(locale: str) -> int:
+    try:
+        return LOCALES.index(locale)
+    except ValueError:
+        return 0
+
+
+def _file_mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _apply_policy(records: Dict[str, BotRecord]):
+    if not POE_BOT_POLICY.exists():
+        return
+    with open(POE_BOT_POLICY, "r", encoding="utf-8") as f:
+        policy = json.load(f)
+    for name, info in policy.items():
+        record = records.get(name.casefold())
+        if record is None:
+            logger.warning(f"Policy for unknown bot: {name}")
+            continue
+        record.cache_ttl = info.get("cache_ttl")
+        record.cache_hit_points = info.get("cache_hit_points")
+
+
+def _load_snapshot(version: int) -> CatalogSnapshot:
+    mtimes = tuple(_file_mtime(path) for path in WATCHED_FILES)
+    records: Dict[str, BotRecord] = {}
+    for locale_idx, path in enumerate(LOCALE_FILES):
+        if not path.exists():
+            logger.warning(f"Bot catalog file not found: {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for name, info in raw.items():
+            key = sys.intern(name.casefold())
+            record = records.get(key)
+            if record is None:
+                record = records[key] = BotRecord(key, info)
+            record.set_locale_fields(locale_idx, info)
+        # 原始 JSON 在这里就可以被回收了, 每个 worker 只保留紧凑的记录
+        del raw
+    for record in records.values():
+        record.freeze()
+    _apply_policy(records)
+    return CatalogSnapshot(records, mtimes, version)
+
+
+class BotCatalog:
+    """Memory-resident bot catalog built from models.json and models_zh.json.
+
+    Per-bot policies (such as the response cache TTL) are overlaid from
+    models_policy.json, which the bot updater never rewrites.
+
+    Lookups read the current snapshot without copying; reloads build a new
+    snapshot and swap the reference, so readers never see a partial catalog.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._reload_lock = asyncio.Lock()
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.reload()
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    def reload(self) -> CatalogSnapshot:
+        previous = self._snapshot
+        version = previous.version + 1 if previous is not None else 1
+        snapshot = _load_snapshot(version)
+        self._snapshot = snapshot
+        logger.info(
+            f"Bot catalog loaded: {len(snapshot.records)} bots (version {version})"
+        )
+        return snapshot
+
+    async def reload_async(self) -> CatalogSnapshot:
+        async with self._reload_lock:
+            return await asyncio.to_thread(self.reload)
+
+    def get(self, name: str) -> Optional[BotRecord]:
+        records = self.snapshot.records
+        record = records.get(name)
+        if record is None:
+            record = records.get(name.casefold())
+        return record
+
+    def get_billing(self, name: str) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        billing = self.snapshot.billing
+        entry = billing.get(name)
+        if entry is None:
+            entry = billing.get(name.casefold())
+        return entry
+
+    def get_points(self, name: str, default: int = 300) -> Optional[int]:
+        """Return the points cost of a bot, or None if the bot is unknown."""
+        entry = self.get_billing(name)
+        if entry is None:
+            return None
+        points = entry[0]
+        return default if points is None else points
+
+    def get_cache_ttl(self, name: str) -> Optional[int]:
+        """Return the response cache TTL of a bot, or None if it is not cached."""
+        record = self.get(name)
+        return record.cache_ttl if record is not None else None
+
+    def get_cache_hit_points(self, name: str) -> Optional[int]:
+        """Return the points billed for a response cache hit, or None to bill as usual."""
+        record = self.get(name)
+        return record.cache_hit_points if record is not None else None
+
+    def items(self):
+        return self.snapshot.records.items()
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __len__(self) -> int:
+        return len(self.snapshot.records)
+
+    def _files_changed(self) -> bool:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        return tuple(_file_mtime(path) for path in WATCHED_FILES) != snapshot.mtimes
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self._files_changed():
+                    logger.info("Bot catalog files changed, reloading.")
+                    await self.reload_async()
+            except Exception:
+                from traceback import format_exc
+
+                logger.error(format_exc())
+
+    def _on_reload_signal(self):
+        logger.info("Received reload signal for bot catalog.")
+        asyncio.ensure_future(self.reload_async())
+
+    def start(self, interval: float = BOT_CATALOG_RELOAD_INTERVAL):
+        loop = asyncio.get_running_loop()
+        if self._snapshot is None:
+            self.reload()
+        if self._watch_task is None and interval > 0:
+            self._watch_task = loop.create_task(self._watch(interval))
+        sighup = getattr(signal, "SIGHUP", None)
+        if sighup is not None:
+            try:
+                loop.add_signal_handler(sighup, self._on_reload_signal)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+    async def stop(self):
+        sighup = getattr(signal, "SIGHUP", None)
+        if sighup is not None:
+            try:
+                asyncio.get_running_loop().remove_signal_handler(sighup)
+            except (NotImplementedError, RuntimeError):
+                pass
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+
+bot_catalog = BotCatalog()
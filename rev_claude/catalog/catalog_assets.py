@@ -0,0 +1,157 @@
+import asyncio
+import io
+import json
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from rev_claude.catalog.bot_catalog import LOCALES, BotCatalog, bot_catalog
+from rev_claude.configs import AVATAR_DIR, AVATAR_SIZES
+from rev_claude.utils.static_asset import StaticAsset
+
+# 可以压缩的头像格式, png/jpeg 本身已经压缩过
+COMPRESSIBLE_TYPES = {"image/svg+xml"}
+AVATAR_ROUTE = "/avatars"
+
+
+def _pillow_available() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _json_asset(data) -> StaticAsset:
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return StaticAsset(body, "application/json")
+
+
+def _load_avatars(avatar_dir: Path) -> Dict[str, StaticAsset]:
+    avatars: Dict[str, StaticAsset] = {}
+    if not avatar_dir.is_dir():
+        logger.warning(f"Avatar directory not found: {avatar_dir}")
+        return avatars
+    for path in avatar_dir.iterdir():
+        if not path.is_file():
+            continue
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        avatars[path.name] = StaticAsset(
+            path.read_bytes(), media_type, compress=media_type in COMPRESSIBLE_TYPES
+        )
+    return avatars
+
+
+def _resize(avatar: StaticAsset, size: int) -> StaticAsset:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(avatar.variants["identity"])) as image:
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, format="PNG", optimize=True)
+    return StaticAsset(output.getvalue(), "image/png", compress=False)
+
+
+class _Built:
+    __slots__ = ("version", "catalogs", "avatars")
+
+    def __init__(
+        self,
+        version: int,
+        catalogs: Dict[str, StaticAsset],
+        avatars: Dict[str, StaticAsset],
+    ):
+        self.version = version
+        self.catalogs = catalogs
+        self.avatars = avatars
+
+
+class CatalogAssets:
+    """Pre-serialized catalog JSON per locale and in-memory bot avatars.
+
+    Everything is built off the event loop whenever the bot catalog
+    version changes, then served as-is with ETags and precompressed
+    variants. Each catalog entry points at its avatar with a content
+    version, so avatar responses can be cached as immutable.
+    """
+
+    def __init__(
+        self, catalog: BotCatalog = bot_catalog, avatar_dir: Path = AVATAR_DIR
+    ):
+        self.catalog = catalog
+        self.avatar_dir = avatar_dir
+        self._built: Optional[_Built] = None
+        self._lock = asyncio.Lock()
+        self._resized: Dict[Tuple[str, str, int], StaticAsset] = {}
+        # Pillow 导入较慢, 第一次需要缩放时才检查
+        self._pillow: Optional[bool] = None
+
+    def _build(self) -> _Built:
+        snapshot = self.catalog.snapshot
+        avatars = _load_avatars(self.avatar_dir)
+        catalogs = {}
+        for locale in LOCALES:
+            data = {}
+            for name, record in snapshot.records.items():
+                info = record.to_dict(locale)
+                avatar = avatars.get(record.path) if record.path else None
+                if avatar is not None:
+                    info["avatar"] = f"{AVATAR_ROUTE}/{record.path}?v={avatar.version}"
+                data[name] = info
+            catalogs[locale] = _json_asset(data)
+        logger.info(
+            f"Catalog assets built for version {snapshot.version}: "
+            f"{len(catalogs)} locales, {len(avatars)} avatars."
+        )
+        return _Built(snapshot.version, catalogs, avatars)
+
+    async def get(self) -> _Built:
+        built = self._built
+        if built is not None and built.version == self.catalog.version:
+            return built
+        async with self._lock:
+            built = self._built
+            if built is None or built.version != self.catalog.version:
+                built = self._built = await asyncio.to_thread(self._build)
+                self._resized.clear()
+        return built
+
+    async def catalog_asset(self, locale: str) -> StaticAsset:
+        built = await self.get()
+        return built.catalogs.get(locale) or built.catalogs[LOCALES[0]]
+
+    async def avatar_asset(
+        self, name: str, size: Optional[int] = None
+    ) -> Tuple[Optional[StaticAsset], Optional[str]]:
+        """Avatar (resized if ``size`` is allowed) and the version of the original."""
+        avatar = (await self.get()).avatars.get(name)
+        if avatar is None:
+            return None, None
+        if size is None or size not in AVATAR_SIZES:
+            return avatar, avatar.version
+        if self._pillow is None:
+            self._pillow = _pillow_available()
+            if not self._pillow:
+                logger.warning(
+                    "Pillow is not installed, avatars are served at full size."
+                )
+        if not self._pillow:
+            return avatar, avatar.version
+        key = (name, avatar.digest, size)
+        resized = self._resized.get(key)
+        if resized is None:
+            try:
+                resized = await asyncio.to_thread(_resize, avatar, size)
+            except Exception as e:
+                logger.warning(f"Failed to resize avatar {name}: {e}")
+                return avatar, avatar.version
+            self._resized[key] = resized
+        return resized, avatar.version
+
+    async def start(self):
+        await self.get()
+
+
+catalog_assets = CatalogAssets()
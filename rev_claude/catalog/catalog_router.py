@@ -0,0 +1,28 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from rev_claude.catalog.bot_catalog import DEFAULT_LOCALE
+from rev_claude.catalog.catalog_assets import catalog_assets
+from rev_claude.utils.static_asset import IMMUTABLE, NO_CACHE
+
+# 公开的静态数据, 不需要 API key
+router = APIRouter()
+
+
+@router.get("/catalog/models")
+async def catalog_models(request: Request, locale: str = DEFAULT_LOCALE):
+    asset = await catalog_assets.catalog_asset(locale)
+    return asset.response(request)
+
+
+@router.get("/avatars/{name}")
+async def avatar(
+    request: Request, name: str, v: Optional[str] = None, size: Optional[int] = None
+):
+    asset, version = await catalog_assets.avatar_asset(name, size)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Avatar not found.")
+    # 只有带着当前内容版本的地址才能长期缓存
+    cache_control = IMMUTABLE if v is not None and v == version else NO_CACHE
+    return asset.response(request, cache_control)
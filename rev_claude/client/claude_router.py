@@ -1,6 +1,9 @@
 import asyncio
-from functools import partial
+import json
+from contextlib import aclosing
+from functools import lru_cache, partial
 from pathlib import Path
+from time import perf_counter
 from typing import Optional, List, Union, Any
 from uuid import uuid4
 
@@ -8,36 +11,59 @@ from fastapi import APIRouter, Depends, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import HTTPException, File, UploadFile, Form
 
-from rev_claude.api_key.api_key_manage import APIKeyManager, get_api_key_manager
+from rev_claude.api_key.api_key_accounting import APIKeyState, get_api_key_accounting
+from rev_claude.catalog.bot_catalog import bot_catalog
 
-from rev_claude.client.claude import upload_attachment_for_fastapi, save_file
+from rev_claude.client.client_admission import AdmittedSlot, client_admission
 from rev_claude.client.client_manager import ClientManager
+from rev_claude.client.client_selector import client_selector
+from rev_claude.client.stream_supervisor import StreamSupervisor
 from rev_claude.configs import (
     NEW_CONVERSATION_RETRY,
     USE_MERMAID_AND_SVG,
     CLAUDE_OFFICIAL_USAGE_INCREASE,
+    RESUMABLE_STREAMS_ENABLED,
+    TOKEN_BILLING_ENABLED,
+    TOKEN_BILLING_UNIT,
 )
 from rev_claude.history.conversation_history_manager import (
-    conversation_history_manager,
     ConversationHistoryRequestInput,
     Message,
     RoleType,
 )
 from rev_claude.prompts_builder.artifacts_render_prompt import ArtifactsRendererPrompt
 from rev_claude.prompts_builder.svg_renderer_prompt import SvgRendererPrompt
+from rev_claude.prompts_builder.web_search_service import web_search_service
 from rev_claude.schemas import (
     ClaudeChatRequest,
     ObtainReverseOfficialLoginRouterRequest,
 )
 from loguru import logger
 
+from rev_claude.metrics.stream_metrics import observe_stage, stage_timer, track_stream
 from rev_claude.models import ClaudeModels
-from rev_claude.status.clients_status_manager import ClientsStatus
+from rev_claude.status.clients_status_snapshot import clients_status_snapshot
 from rev_claude.status_code.status_code_enum import HTTP_480_API_KEY_INVALID
-from rev_claude.utils.poe_bots_utils import get_poe_bot_info
+from rev_claude.utils.disconnect_aware_response import (
+    DisconnectAwareStreamingResponse,
+)
+from rev_claude.utils.document_convert_cache import document_convert_cache
+from rev_claude.utils.file_upload_utils import check_upload_limits, save_uploads
+from rev_claude.utils.response_cache import (
+    ResponseCache,
+    get_response_cache,
+    response_cache_key,
+)
+from rev_claude.utils.resumable_stream import (
+    STREAM_GENERATION_HEADER,
+    get_resumable_streams,
+    parse_last_event_id,
+)
+from rev_claude.utils.sse_encoder import SSEFrameEncoder
 from rev_claude.utils.sse_utils import build_sse_data
-from utility import get_client_status
-import numpy as np
+from rev_claude.utils.static_asset import StaticAsset
+from rev_claude.utils.tokenizer_service import TokenUsage, tokenizer_service
+from rev_claude.utils.write_behind_queue import write_behind_queue
 
 # This in only for claude router, I do not use the
 
@@ -45,35 +71,57 @@ import numpy as np
 # async def validate_api_key(
 #     api_key: str = Header(None), manager: APIKeyManager = Depends(get_api_key_manager)
 # ):
-async def validate_api_key(
-    request: Request, manager: APIKeyManager = Depends(get_api_key_manager)
-):
+async def validate_api_key(request: Request):
 
+    request.state.started_at = perf_counter()
     api_key = request.headers.get("Authorization")
     # logger.info(f"checking api key: {api_key}")
-    if api_key is None or not manager.is_api_key_valid(api_key):
+    # 有效性 / 激活 / 用量上限 在一次 Redis 往返中完成
+    key_state = (
+        await get_api_key_accounting().check(api_key) if api_key is not None else None
+    )
+    if key_state is None or not key_state.valid:
         raise HTTPException(
             status_code=HTTP_480_API_KEY_INVALID,
             detail="APIKEY已经过期或者不存在，请检查您的APIKEY是否正确。",
         )
-    # TODO: 这里增加使用次数次数改成对应增加对应的使用积分， 但是意思是一样的。
-    # manager.increment_usage(api_key)
     logger.info(f"API key:\n{api_key}")
-    logger.info(manager.get_apikey_information(api_key))
-    # 尝试激活 API key
-    active_message = manager.activate_api_key(api_key)
-    logger.info(active_message)
+    logger.info(key_state)
+    if key_state.newly_activated:
+        logger.info(f"API key {api_key} activated.")
+    request.state.api_key_state = key_state
+    observe_stage("validate_api_key", request.state.started_at)
 
 
-async def increase_usage_callback(api_key, model):
+async def increase_usage_callback(
+    api_key, model, usage: Optional[TokenUsage] = None, cache_hit: bool = False
+):
+    start = perf_counter()
     try:
-        model_info = get_poe_bot_info()[model.lower()].get("points", 300)
-        manager = get_api_key_manager()
-        manager.increment_usage(api_key, model_info)
+        points = bot_catalog.get_points(model)
+        if points is None:
+            raise KeyError(f"Unknown model: {model}")
+        # 回放缓存的回答按 models_policy.json 中的 cache_hit_points 计费, 没有配置时照常计费
+        cache_hit_points = (
+            bot_catalog.get_cache_hit_points(model) if cache_hit else None
+        )
+        if usage is not None:
+            prompt_tokens, completion_tokens = await usage.totals()
+            logger.debug(
+                f"Tokens used by {api_key}: prompt {prompt_tokens}, completion {completion_tokens}"
+            )
+            if TOKEN_BILLING_ENABLED and cache_hit_points is None:
+                units = -(-(prompt_tokens + completion_tokens) // TOKEN_BILLING_UNIT)
+                points *= max(units, 1)
+        if cache_hit_points is not None:
+            points = cache_hit_points
+        await write_behind_queue.push_usage(api_key, points)
     except Exception as e:
         from traceback import format_exc
 
         logger.error(format_exc())
+    finally:
+        observe_stage("increase_usage_callback", start)
 
 
 router = APIRouter(dependencies=[Depends(validate_api_key)])
@@ -92,18 +140,30 @@ def obtain_claude_client():
 async def patched_generate_data(original_generator, conversation_id, hrefs=None):
     # 首先发送 conversation_id
     # 然后，对原始生成器进行迭代，产生剩余的数据
-    async for data in original_generator:
-        yield build_sse_data(message=data, id=conversation_id)
-    if hrefs:
-        for href in hrefs:
-            yield build_sse_data(message=href, id=conversation_id)
+    encoder = SSEFrameEncoder(conversation_id)
+    try:
+        async with aclosing(encoder.stream(original_generator)) as frames:
+            async for frame in frames:
+                yield frame
+        if hrefs:
+            for href in hrefs:
+                yield encoder.encode(href)
 
-    yield build_sse_data(message="closed", id=conversation_id)
+        yield encoder.encode("closed")
+    finally:
+        clients_status_snapshot.notify_stream_finished()
+
+
+@lru_cache(maxsize=1)
+def _list_models_asset() -> StaticAsset:
+    # 模型列表是固定的, 只序列化和压缩一次
+    body = json.dumps([model.value for model in ClaudeModels]).encode("utf-8")
+    return StaticAsset(body, "application/json")
 
 
 @router.get("/list_models")
-async def list_models():
-    return [model.value for model in ClaudeModels]
+async def list_models(request: Request):
+    return _list_models_asset().response(request)
 
 
 @router.post("/convert_document")
@@ -111,7 +171,8 @@ async def convert_document(
     file: UploadFile = File(...),
 ):
     logger.info(f"Uploading file: {file.filename}")
-    response = await upload_attachment_for_fastapi(file)
+    # 相同内容的文档只解析一次, 解析在进程池里进行
+    response = await document_convert_cache.convert(file)
     return response
 
 
@@ -123,6 +184,7 @@ async def upload_image(
     clients=Depends(obtain_claude_client),
 ):
     logger.info(f"Uploading file: {file.filename}")
+    check_upload_limits([file])
     basic_clients = clients["basic_clients"]
     plus_clients = clients["plus_clients"]
     if client_type == "plus":
@@ -149,60 +211,20 @@ async def push_assistant_message_callback(
         hrefs_str = "".join(hrefs)
         messages[-1].content += hrefs_str
 
-    await conversation_history_manager.push_message(request, messages)
+    with stage_timer("push_assistant_message_callback"):
+        await write_behind_queue.push_history(request, messages)
 
 
-async def select_client_by_usage(
-    client_type: str,
-    client_idx: int,
-    basic_clients: dict,
-    plus_clients: dict,
-    status_list: List[ClientsStatus],
-) -> Any:
-    # 分别获取plus和basic的status
-    plus_status = [s for s in status_list if s.type == "plus"]
-    basic_status = [s for s in status_list if (s.type == "normal" or s.type == "basic")]
-    # basic类型在status中标记为normal
-
-    if client_type == "plus":
-        if not plus_status:
-            raise ValueError("No available plus clients")
-
-        # 获取plus clients的usage值
-        usages = [s.usage for s in plus_status]
-        total_usage = sum(usages)
-
-        # 如果总usage为0，使用均匀分布
-        if total_usage == 0:
-            probabilities = [1 / len(usages)] * len(usages)
-        else:
-            # 计算概率 - usage越大，概率越高
-            probabilities = [usage / total_usage for usage in usages]
-
-        # 对plus clients进行采样
-        selected_idx = np.random.choice(len(plus_status), p=probabilities)
-        selected_status = plus_status[selected_idx]
-        return plus_clients[selected_status.idx]
-
-    else:  # basic类型
-        if not basic_status:
-            raise ValueError("No available basic clients")
-
-        # 获取basic clients的usage值
-        usages = [s.usage for s in basic_status]
-        total_usage = sum(usages)
-
-        # 如果总usage为0，使用均匀分布
-        if total_usage == 0:
-            probabilities = [1 / len(usages)] * len(usages)
-        else:
-            # 计算概率 - usage越大，概率越高
-            probabilities = [usage / total_usage for usage in usages]
-
-        # 对basic clients进行采样
-        selected_idx = np.random.choice(len(basic_status), p=probabilities)
-        selected_status = basic_status[selected_idx]
-        return basic_clients[selected_status.idx]
+async def select_client_by_usage(client_type: str, clients: dict) -> Optional[int]:
+    """Admit the request on a client below its stream cap, None if it has to queue."""
+    # 采样表由快照发布时重建, 每次请求只做一次O(1)采样
+    selected_idx = client_admission.try_admit(client_type)
+    if selected_idx is not None and selected_idx not in clients:
+        # 快照里的客户端已经被删除了, 强制刷新一次再选
+        client_admission.release(client_type, selected_idx)
+        await clients_status_snapshot.refresh()
+        selected_idx = client_admission.try_admit(client_type)
+    return selected_idx
 
 
 @router.post("/form_chat")
@@ -218,15 +240,19 @@ async def chat(
     # attachments: Optional[List[str]] = Form(None),
     files: Union[List[UploadFile], UploadFile, None] = None,
     clients=Depends(obtain_claude_client),
-    manager: APIKeyManager = Depends(get_api_key_manager),
 ):
     api_key = request.headers.get("Authorization")
-    has_reached_limit = manager.has_exceeded_limit(api_key)
-    if has_reached_limit:
-        # is_deleted = not manager.is_api_key_valid(api_key)
+    if not files:
+        files = []
+    elif not isinstance(files, List):
+        files = [files]
+    # 在做任何其他工作之前先检查附件数量和大小
+    check_upload_limits(files)
+    # validate_api_key 已经在同一次往返中读取了用量上限
+    key_state: APIKeyState = request.state.api_key_state
+    if key_state.exceeded:
         done_data = build_sse_data(message="closed", id=conversation_id)
-        # TODO: fix this  message bug
-        message = manager.generate_exceed_message(api_key)
+        message = key_state.exceed_message
 
         logger.info(f"API {api_key} has reached the limit.")
         return StreamingResponse(
@@ -237,15 +263,19 @@ async def chat(
         f"Input chat request: message={message}, model={model}, client_type={client_type}, client_idx={client_idx}"
     )
 
+    # 联网搜索和保存文件同时进行
+    search_task = (
+        asyncio.create_task(web_search_service.render_prompt(message))
+        if need_web_search
+        else None
+    )
+
     basic_clients = clients["basic_clients"]
     plus_clients = clients["plus_clients"]
     client_type = "plus" if client_type == "plus" else "basic"
-    status_list = await get_client_status(basic_clients, plus_clients)
-    claude_client = await select_client_by_usage(
-        client_type, client_idx, basic_clients, plus_clients, status_list
-    )
 
     raw_message = message
+    new_conversation = not conversation_id
     if not conversation_id:
         conversation_id = str(uuid4())
 
@@ -259,19 +289,11 @@ async def chat(
     messages: list[Message] = []
 
     attachments = []
-    if not files:
-        files = []
     # This is a temporary solution to handle the case where the user uploads a file.
-    file_paths = []
-    if files:
-        if not isinstance(files, List):
-            files = [files]
-        for file in files:
-            try:
-                file_path = await save_file(file)
-                file_paths.append(file_path)
-            except Exception as e:
-                logger.error(f"Error saving file {file.filename}: {str(e)}")
+    # 分块并发写入 UPLOAD_DIR, 相同内容只保存一份
+    with stage_timer("save_files"):
+        saved_uploads = await save_uploads(files)
+    file_paths = [str(saved.path) for saved in saved_uploads]
     messages.append(
         Message(
             content=raw_message,
@@ -282,16 +304,14 @@ async def chat(
     )
     logger.debug(f"files: {files}")
     hrefs = []
-    if need_web_search:
-        from rev_claude.prompts_builder.duckduck_search_prompt import (
-            DuckDuckSearchPrompt,
-        )
-
-        message, hrefs = await DuckDuckSearchPrompt(
-            prompt=message,
-        ).render_prompt()
+    if search_task is not None:
+        # 只统计搜索在关键路径上额外等待的时间
+        with stage_timer("web_search"):
+            message, hrefs = await search_task
         logger.info(f"Prompt After search: \n{message}")
 
+    # prompt 在线程池中计数, 输出在流式返回的同时计数, 都不会阻塞事件循环
+    usage = TokenUsage(tokenizer_service, message)
     call_back = [
         partial(
             push_assistant_message_callback,
@@ -299,29 +319,160 @@ async def chat(
             messages,
             hrefs,
         ),
-        partial(increase_usage_callback, api_key, model),
+        partial(increase_usage_callback, api_key, model, usage),
     ]
 
+    async def record_answer(answer: str, cache_hit: bool = False):
+        await push_assistant_message_callback(
+            conversation_history_request, messages, hrefs, answer
+        )
+        await increase_usage_callback(api_key, model, usage, cache_hit=cache_hit)
+
     if stream:
-        streaming_res = claude_client.stream_message(
-            message,
-            conversation_id,
-            model,
-            client_type=client_type,
-            client_idx=client_idx,
-            attachments=attachments,
-            files=files,
-            call_back=call_back,
-            api_key=api_key,
-            file_paths=file_paths,
+        # 只缓存新对话且不联网搜索的请求, 其他情况下相同的消息上下文不同
+        cache_ttl = (
+            bot_catalog.get_cache_ttl(model)
+            if new_conversation and not need_web_search
+            else None
         )
-        streaming_res = patched_generate_data(streaming_res, conversation_id, hrefs)
-        return StreamingResponse(
+        cache_key = None
+        if cache_ttl:
+            cache_key = response_cache_key(
+                model, raw_message, (saved.sha256 for saved in saved_uploads)
+            )
+            with stage_timer("response_cache"):
+                cached = await get_response_cache().get(cache_key)
+            if cached is not None:
+
+                async def replay_cached():
+                    async with aclosing(
+                        usage.completion.wrap(ResponseCache.replay(cached))
+                    ) as chunks:
+                        async for chunk in chunks:
+                            yield chunk
+                    await record_answer("".join(cached), cache_hit=True)
+
+                return DisconnectAwareStreamingResponse(
+                    patched_generate_data(replay_cached(), conversation_id, hrefs),
+                    media_type="text/event-stream",
+                )
+
+        with stage_timer("client_status"):
+            if clients_status_snapshot.current() is None:
+                await clients_status_snapshot.get()
+        # 在返回 200 之前确认有可用的客户端
+        if not client_selector.has_clients(client_type):
+            raise HTTPException(
+                status_code=503, detail=f"No available {client_type} clients"
+            )
+        type_clients = plus_clients if client_type == "plus" else basic_clients
+
+        async def select_client() -> Optional[int]:
+            with stage_timer("select_client"):
+                return await select_client_by_usage(client_type, type_clients)
+
+        def start_stream(claude_client, selected_idx: int, attempt_call_back: list):
+            streaming_res = claude_client.stream_message(
+                message,
+                conversation_id,
+                model,
+                client_type=client_type,
+                client_idx=client_idx,
+                attachments=attachments,
+                files=files,
+                call_back=attempt_call_back,
+                api_key=api_key,
+                file_paths=file_paths,
+            )
+            return track_stream(
+                streaming_res,
+                model,
+                client_type,
+                selected_idx,
+                request_start=request.state.started_at,
+            )
+
+        def build_stream(slot: AdmittedSlot):
+            # 首 token 超时时对冲到另一个客户端, 中途失败时换客户端重试
+            supervisor = StreamSupervisor(
+                client_type,
+                type_clients,
+                start_stream,
+                call_back,
+                # 客户端中途断开时, 用已经生成的部分内容记录历史和计费
+                on_cancel=record_answer,
+                # 中途失败的那部分输出不计费
+                on_retry=usage.completion.reset,
+            )
+            answer = supervisor.stream(slot)
+            if cache_key is not None:
+                # 完整且没有中途换客户端的回答才写入缓存
+                answer = get_response_cache().record(
+                    cache_key, cache_ttl, answer, lambda: supervisor.completed
+                )
+            return patched_generate_data(
+                usage.completion.wrap(answer),
+                conversation_id,
+                hrefs,
+            )
+
+        # 名额在响应开始迭代时才占用; 所有客户端都满了时先告诉用户在排队, 拿到客户端后再开始生成
+        streaming_res = client_admission.stream(
+            client_type,
+            build_stream,
+            notice=lambda depth: build_sse_data(
+                message=f"当前使用人数较多, 正在排队(前面还有{depth}个请求), 请稍候...\n\n",
+                id=conversation_id,
+            ),
+            rejected=lambda reason: build_sse_data(
+                message="当前使用人数过多, 排队超时, 请稍后再试。", id=conversation_id
+            )
+            + build_sse_data(message="closed", id=conversation_id),
+            select=select_client,
+        )
+        headers = None
+        if RESUMABLE_STREAMS_ENABLED:
+            # 生成在后台进行, 断线后客户端可以凭 generation 和 Last-Event-ID
+            # 从 /form_chat/resume 续传
+            generation, streaming_res = await get_resumable_streams().start(
+                conversation_id, api_key, streaming_res
+            )
+            headers = {STREAM_GENERATION_HEADER: generation}
+        # 客户端断开后立即取消上游(续传模式下只停止推送), 释放连接和客户端名额
+        return DisconnectAwareStreamingResponse(
             streaming_res,
             media_type="text/event-stream",
+            headers=headers,
         )
     else:
         return StreamingResponse(
             build_sse_data(message="不支持非SSE"),
             media_type="text/event-stream",
         )
+
+
+@router.get("/form_chat/resume")
+async def resume_chat(
+    request: Request,
+    conversation_id: str,
+    generation: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+):
+    api_key = request.headers.get("Authorization")
+    resumable_streams = get_resumable_streams()
+    generation = generation or await resumable_streams.latest(conversation_id)
+    if (
+        generation is None
+        or await resumable_streams.owner(conversation_id, generation) != api_key
+    ):
+        raise HTTPException(
+            status_code=404, detail="No resumable stream for this conversation."
+        )
+    # 浏览器 EventSource 重连时会自动带上 Last-Event-ID 头
+    last_event_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or last_event_id
+    )
+    return DisconnectAwareStreamingResponse(
+        resumable_streams.replay(conversation_id, generation, last_event_id),
+        media_type="text/event-stream",
+    )
@@ -0,0 +1,240 @@
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from time import perf_counter
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Deque,
+    Dict,
+    Optional,
+)
+
+from loguru import logger
+
+from rev_claude.client.client_selector import (
+    ClientSelector,
+    client_selector,
+    normalize_client_type,
+)
+from rev_claude.configs import (
+    ADMISSION_QUEUE_MAX_WAITERS,
+    ADMISSION_QUEUE_POLL_INTERVAL,
+    ADMISSION_QUEUE_TIMEOUT,
+    CLIENT_MAX_CONCURRENT_STREAMS,
+)
+from rev_claude.metrics.prometheus_metrics import registry
+from rev_claude.metrics.stream_metrics import STREAMS_IN_FLIGHT
+
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "revpoe_admission_queue_depth",
+    "Requests waiting for a free upstream client, per client type.",
+    ("client_type",),
+)
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "revpoe_admission_wait_seconds",
+    "Time queued requests waited for a free upstream client.",
+    ("client_type",),
+)
+ADMISSION_TOTAL = registry.counter(
+    "revpoe_admission_total",
+    "Admission decisions by outcome.",
+    ("client_type", "outcome"),
+)
+
+
+class AdmissionRejected(Exception):
+    """The admission queue is full or the wait deadline passed."""
+
+
+class AdmittedSlot:
+    """A client slot taken for one request.
+
+    The admission keeps owning the slot until the stream built on it calls
+    ``take()``; whoever owns it last releases it.
+    """
+
+    __slots__ = ("client_type", "idx", "taken")
+
+    def __init__(self, client_type: str, idx: int):
+        self.client_type = client_type
+        self.idx = idx
+        self.taken = False
+
+    def take(self) -> int:
+        self.taken = True
+        return self.idx
+
+
+class ClientAdmission:
+    """Caps concurrent streams per client, queueing the overflow in FIFO order.
+
+    In-flight counts are the selector's own, so the selection policies see
+    the same numbers the caps are enforced on.
+    """
+
+    def __init__(
+        self,
+        selector: ClientSelector = client_selector,
+        max_concurrent_streams: Dict[str, int] = CLIENT_MAX_CONCURRENT_STREAMS,
+        max_waiters: int = ADMISSION_QUEUE_MAX_WAITERS,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        poll_interval: float = ADMISSION_QUEUE_POLL_INTERVAL,
+    ):
+        self.selector = selector
+        self.max_concurrent_streams = max_concurrent_streams
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+
+    def cap(self, client_type: str) -> int:
+        return self.max_concurrent_streams.get(normalize_client_type(client_type), 0)
+
+    def queue_depth(self, client_type: str) -> int:
+        waiters = self._waiters.get(normalize_client_type(client_type))
+        return len(waiters) if waiters else 0
+
+    def _take_slot(
+        self, client_type: str, exclude: Collection[int] = ()
+    ) -> Optional[int]:
+        idx = self.selector.select_available(
+            client_type, self.cap(client_type), exclude
+        )
+        if idx is not None:
+            self.selector.acquire(client_type, idx)
+        return idx
+
+    def try_admit(
+        self, client_type: str, exclude: Collection[int] = ()
+    ) -> Optional[int]:
+        """Take a slot without waiting, None if the request has to queue."""
+        client_type = normalize_client_type(client_type)
+        # 已经有人在排队时不插队
+        if self.queue_depth(client_type):
+            return None
+        idx = self._take_slot(client_type, exclude)
+        if idx is not None:
+            ADMISSION_TOTAL.inc(client_type, "immediate")
+        return idx
+
+    async def admit(self, client_type: str, timeout: Optional[float] = None) -> int:
+        """Wait in line for a slot, raise AdmissionRejected on overflow or timeout."""
+        client_type = normalize_client_type(client_type)
+        idx = self.try_admit(client_type)
+        if idx is not None:
+            return idx
+        waiters = self._waiters.setdefault(client_type, deque())
+        if len(waiters) >= self.max_waiters:
+            ADMISSION_TOTAL.inc(client_type, "rejected")
+            raise AdmissionRejected(
+                f"Too many requests waiting for {client_type} clients"
+            )
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiters.append(future)
+        ADMISSION_QUEUE_DEPTH.inc(client_type)
+        start = perf_counter()
+        deadline = loop.time() + (self.timeout if timeout is None else timeout)
+        try:
+            while not future.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    ADMISSION_TOTAL.inc(client_type, "timeout")
+                    raise AdmissionRejected(
+                        f"Timed out waiting for {client_type} clients"
+                    )
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(future), min(remaining, self.poll_interval)
+                    )
+                except asyncio.TimeoutError:
+                    # 客户端列表可能刷新了, 没有释放也重新检查一次
+                    self.wake(client_type)
+            ADMISSION_TOTAL.inc(client_type, "queued")
+            ADMISSION_WAIT_SECONDS.observe(perf_counter() - start, client_type)
+            return future.result()
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # 槽位已经分给了我们, 但调用方不要了, 还回去
+                self.release(client_type, future.result())
+            else:
+                future.cancel()
+            raise
+        finally:
+            try:
+                waiters.remove(future)
+            except ValueError:
+                pass
+            else:
+                ADMISSION_QUEUE_DEPTH.dec(client_type)
+
+    def wake(self, client_type: str):
+        """Hand free slots to waiters in arrival order."""
+        client_type = normalize_client_type(client_type)
+        waiters = self._waiters.get(client_type)
+        while waiters:
+            future = waiters[0]
+            if future.done():
+                waiters.popleft()
+                ADMISSION_QUEUE_DEPTH.dec(client_type)
+                continue
+            try:
+                idx = self._take_slot(client_type)
+            except ValueError:
+                return
+            if idx is None:
+                return
+            waiters.popleft()
+            ADMISSION_QUEUE_DEPTH.dec(client_type)
+            future.set_result(idx)
+
+    def release(self, client_type: str, idx: int):
+        self.selector.release(client_type, idx)
+        self.wake(client_type)
+
+    async def stream(
+        self,
+        client_type: str,
+        build_stream: Callable[[AdmittedSlot], AsyncIterator],
+        notice: Callable[[int], str],
+        rejected: Callable[[str], str],
+        select: Optional[Callable[[], Awaitable[Optional[int]]]] = None,
+    ) -> AsyncIterator:
+        """Admit the request once iterated, then stream ``build_stream(slot)``.
+
+        The slot is only taken when this generator runs, so a response that
+        is closed before its first item never holds one. If all clients are
+        busy, a queue notice is streamed right away while waiting. The slot
+        is released here unless the built stream took it over.
+        """
+        idx = await select() if select is not None else self.try_admit(client_type)
+        if idx is None:
+            logger.info(f"All {client_type} clients are busy, queueing request.")
+            yield notice(self.queue_depth(client_type))
+            try:
+                idx = await self.admit(client_type)
+            except AdmissionRejected as e:
+                logger.warning(str(e))
+                yield rejected(str(e))
+                return
+        slot = AdmittedSlot(client_type, idx)
+        # 按请求计数, 对冲和重试的上游请求不重复计入
+        STREAMS_IN_FLIGHT.inc()
+        try:
+            stream = build_stream(slot)
+            # 客户端断开时要关闭真正的流, 由它释放名额
+            async with aclosing(stream):
+                async for item in stream:
+                    yield item
+        finally:
+            STREAMS_IN_FLIGHT.dec()
+            # 流还没开始就被关闭了(或者创建失败), 名额还在这里
+            if not slot.taken:
+                self.release(client_type, idx)
+
+
+client_admission = ClientAdmission()
@@ -0,0 +1,312 @@
+import random
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Collection,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from loguru import logger
+
+from rev_claude.configs import CLIENT_SELECTION_POLICY
+
+if TYPE_CHECKING:
+    # 只用于类型标注, 选择器本身只读取 type / idx / usage
+    from rev_claude.status.clients_status_manager import ClientsStatus
+
+
+STATUS_TYPE_TO_CLIENT_TYPE = {
+    "plus": "plus",
+    # basic类型在status中标记为normal
+    "normal": "basic",
+    "basic": "basic",
+}
+
+
+def normalize_client_type(client_type: str) -> str:
+    return "plus" if client_type == "plus" else "basic"
+
+
+class ClientPool:
+    """Clients of one type together with a precomputed alias table."""
+
+    __slots__ = ("idxs", "usages", "prob", "alias")
+
+    def __init__(self, idxs: List[int], usages: List[float]):
+        self.idxs = idxs
+        self.usages = usages
+        self.prob, self.alias = build_alias_table(usages)
+
+    def __len__(self):
+        return len(self.idxs)
+
+    def draw_position(self) -> int:
+        # Vose alias method: 一次均匀采样 + 一次伯努利, O(1)
+        n = len(self.idxs)
+        pos = int(random.random() * n)
+        if random.random() < self.prob[pos]:
+            return pos
+        return self.alias[pos]
+
+    def draw(self) -> int:
+        return self.idxs[self.draw_position()]
+
+
+def build_alias_table(weights: List[float]) -> Tuple[List[float], List[int]]:
+    n = len(weights)
+    if n == 0:
+        return [], []
+    total = float(sum(weights))
+    if total <= 0:
+        # 如果总usage为0，使用均匀分布
+        return [1.0] * n, list(range(n))
+
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    for i in large + small:
+        prob[i] = 1.0
+    return prob, alias
+
+
+class SelectionPolicy:
+    name = ""
+
+    def pick(self, pool: ClientPool, in_flight: Dict[int, int]) -> int:
+        raise NotImplementedError
+
+
+class UsageWeightedPolicy(SelectionPolicy):
+    """usage越大，概率越高."""
+
+    name = "usage_weighted"
+
+    def pick(self, pool: ClientPool, in_flight: Dict[int, int]) -> int:
+        return pool.draw()
+
+
+class LeastInFlightPolicy(SelectionPolicy):
+    """Pick the client serving the fewest streams, ties broken at random."""
+
+    name = "least_in_flight"
+
+    def pick(self, pool: ClientPool, in_flight: Dict[int, int]) -> int:
+        idxs = pool.idxs
+        n = len(idxs)
+        start = int(random.random() * n)
+        best = idxs[start]
+        best_load = in_flight.get(best, 0)
+        for offset in range(1, n):
+            if best_load == 0:
+                break
+            idx = idxs[(start + offset) % n]
+            load = in_flight.get(idx, 0)
+            if load < best_load:
+                best, best_load = idx, load
+        return best
+
+
+class PowerOfTwoChoicesPolicy(SelectionPolicy):
+    """Draw two clients by usage weight and keep the less loaded one."""
+
+    name = "power_of_two"
+
+    def pick(self, pool: ClientPool, in_flight: Dict[int, int]) -> int:
+        first = pool.draw()
+        if len(pool) == 1:
+            return first
+        second = pool.draw()
+        if in_flight.get(second, 0) < in_flight.get(first, 0):
+            return second
+        return first
+
+
+SELECTION_POLICIES = {
+    policy.name: policy
+    for policy in (UsageWeightedPolicy, LeastInFlightPolicy, PowerOfTwoChoicesPolicy)
+}
+
+
+def get_selection_policy(name: str) -> SelectionPolicy:
+    try:
+        return SELECTION_POLICIES[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown client selection policy: {name}, "
+            f"available: {list(SELECTION_POLICIES)}"
+        )
+
+
+class ClientSelector:
+    """Selects a client per request from tables rebuilt only on status changes."""
+
+    def __init__(self, policy: str = CLIENT_SELECTION_POLICY):
+        self.policy = get_selection_policy(policy)
+        self._pools: Dict[str, ClientPool] = {}
+        self._fingerprint: Optional[tuple] = None
+        self._version: Optional[int] = None
+        # 本 worker 的在途流数
+        self._local_in_flight: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # 其他 worker 的在途流数, 由 SharedClientState 定期从 Redis 同步
+        self._remote_in_flight: Dict[str, Dict[int, int]] = {}
+        # 选择策略和并发上限看到的是两者之和
+        self._in_flight: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # 最近失败过的客户端, 冷却期内尽量不选
+        self._unhealthy: Dict[str, Set[int]] = {}
+
+    def set_policy(self, policy: str):
+        self.policy = get_selection_policy(policy)
+
+    def update(
+        self, status_list: List["ClientsStatus"], version: Optional[int] = None
+    ) -> bool:
+        """Rebuild the per-type tables if the usages changed, return True if rebuilt.
+
+        Callers that version their status lists can pass ``version`` so an
+        unchanged list is recognised without looking at its entries.
+        """
+        if version is not None and version == self._version:
+            return False
+        self._version = version
+        fingerprint = tuple((s.type, s.idx, s.usage) for s in status_list)
+        if fingerprint == self._fingerprint:
+            return False
+        grouped: Dict[str, Tuple[List[int], List[float]]] = {}
+        for status in status_list:
+            client_type = STATUS_TYPE_TO_CLIENT_TYPE.get(status.type)
+            if client_type is None:
+                continue
+            idxs, usages = grouped.setdefault(client_type, ([], []))
+            idxs.append(status.idx)
+            usages.append(max(float(status.usage or 0), 0.0))
+        self._pools = {
+            client_type: ClientPool(idxs, usages)
+            for client_type, (idxs, usages) in grouped.items()
+        }
+        self._fingerprint = fingerprint
+        logger.debug(
+            "Client selector rebuilt: "
+            + ", ".join(f"{t}={len(p)}" for t, p in self._pools.items())
+        )
+        return True
+
+    def has_clients(self, client_type: str) -> bool:
+        return bool(self._pools.get(normalize_client_type(client_type)))
+
+    def select(self, client_type: str) -> int:
+        client_type = normalize_client_type(client_type)
+        pool = self._pools.get(client_type)
+        if not pool:
+            raise ValueError(f"No available {client_type} clients")
+        return self.policy.pick(pool, self._in_flight[client_type])
+
+    def select_available(
+        self, client_type: str, max_in_flight: int, exclude: Collection[int] = ()
+    ) -> Optional[int]:
+        """Like select, but only among clients below ``max_in_flight`` and not in ``exclude``.
+
+        A cap of 0 means unlimited. Returns None when no client qualifies.
+        """
+        client_type = normalize_client_type(client_type)
+        pool = self._pools.get(client_type)
+        if not pool:
+            raise ValueError(f"No available {client_type} clients")
+        limit = max_in_flight if max_in_flight > 0 else float("inf")
+        unhealthy = self._unhealthy.get(client_type)
+        if unhealthy:
+            skip = unhealthy.union(exclude)
+            # 全部都不健康时只能照常选择
+            if any(i not in skip for i in pool.idxs):
+                exclude = skip
+        in_flight = self._in_flight[client_type]
+        idx = self.policy.pick(pool, in_flight)
+        if idx not in exclude and in_flight.get(idx, 0) < limit:
+            return idx
+        # 采到的客户端已满或者已经试过, 退而选择剩下最空闲的那个
+        candidates = [i for i in pool.idxs if i not in exclude]
+        if not candidates:
+            return None
+        idx = min(candidates, key=lambda i: in_flight.get(i, 0))
+        if in_flight.get(idx, 0) < limit:
+            return idx
+        return None
+
+    def in_flight(self, client_type: str, idx: int) -> int:
+        return self._in_flight[normalize_client_type(client_type)].get(idx, 0)
+
+    @staticmethod
+    def _bump(counts: Dict[int, int], idx: int, delta: int):
+        remaining = counts.get(idx, 0) + delta
+        if remaining > 0:
+            counts[idx] = remaining
+        else:
+            counts.pop(idx, None)
+
+    def acquire(self, client_type: str, idx: int):
+        client_type = normalize_client_type(client_type)
+        self._bump(self._local_in_flight[client_type], idx, 1)
+        self._bump(self._in_flight[client_type], idx, 1)
+
+    def release(self, client_type: str, idx: int):
+        client_type = normalize_client_type(client_type)
+        self._bump(self._local_in_flight[client_type], idx, -1)
+        self._bump(self._in_flight[client_type], idx, -1)
+
+    def local_in_flight(self) -> Dict[str, Dict[int, int]]:
+        return {
+            client_type: dict(counts)
+            for client_type, counts in self._local_in_flight.items()
+            if counts
+        }
+
+    def set_remote_in_flight(self, remote: Dict[str, Dict[int, int]]):
+        """Replace the other workers' in-flight counts."""
+        self._remote_in_flight = remote
+        merged: Dict[str, Dict[int, int]] = defaultdict(dict)
+        for counts in (remote, self._local_in_flight):
+            for client_type, type_counts in counts.items():
+                target = merged[client_type]
+                for idx, count in type_counts.items():
+                    target[idx] = target.get(idx, 0) + count
+        self._in_flight = merged
+
+    def set_unhealthy(self, unhealthy: Dict[str, Set[int]]):
+        self._unhealthy = unhealthy
+
+    def mark_unhealthy(self, client_type: str, idx: int):
+        client_type = normalize_client_type(client_type)
+        self._unhealthy = {
+            **self._unhealthy,
+            client_type: self._unhealthy.get(client_type, set()) | {idx},
+        }
+
+    async def track(
+        self, client_type: str, idx: int, generator: AsyncIterator
+    ) -> AsyncIterator:
+        """Count a stream as in flight on a client while it is being consumed."""
+        self.acquire(client_type, idx)
+        try:
+            async for item in generator:
+                yield item
+        finally:
+            self.release(client_type, idx)
+
+
+client_selector = ClientSelector()
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import socket
+import time
+from typing import Dict, Optional, Set
+
+from loguru import logger
+
+from rev_claude.client.client_selector import (
+    ClientSelector,
+    client_selector,
+    normalize_client_type,
+)
+from rev_claude.configs import CLIENT_FAILURE_COOLDOWN, SHARED_STATE_SYNC_INTERVAL
+from rev_claude.utils.async_redis_utils import get_async_redis
+
+WORKERS_KEY = "client_state:workers"
+IN_FLIGHT_KEY_PREFIX = "client_state:in_flight:"
+UNHEALTHY_KEY_PREFIX = "client_state:unhealthy:"
+CLIENT_TYPES = ("plus", "basic")
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SharedClientState:
+    """Shares per-client in-flight counts and failures between workers through Redis.
+
+    Every worker publishes its own counts under a key that expires unless
+    refreshed, so a crashed worker's streams drop out on their own. The hot
+    path stays local: selection reads the merged counts from the last sync.
+    """
+
+    def __init__(
+        self,
+        selector: ClientSelector = client_selector,
+        interval: float = SHARED_STATE_SYNC_INTERVAL,
+        failure_cooldown: float = CLIENT_FAILURE_COOLDOWN,
+    ):
+        self.selector = selector
+        self.interval = interval
+        self.failure_cooldown = failure_cooldown
+        self.worker_id = worker_id()
+        self._in_flight_key = IN_FLIGHT_KEY_PREFIX + self.worker_id
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    def report_failure(self, client_type: str, idx: int):
+        """Mark a client unhealthy here right away and for other workers on the next sync."""
+        client_type = normalize_client_type(client_type)
+        self.selector.mark_unhealthy(client_type, idx)
+        task = asyncio.get_running_loop().create_task(
+            self._publish_failure(client_type, idx)
+        )
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish_failure(self, client_type: str, idx: int):
+        try:
+            await get_async_redis().zadd(
+                UNHEALTHY_KEY_PREFIX + client_type,
+                {str(idx): time.time() + self.failure_cooldown},
+            )
+        except Exception as e:
+            logger.warning(f"Failed to publish client failure: {e}")
+
+    async def sync(self):
+        redis = get_async_redis()
+        now = time.time()
+        ttl = max(int(self.interval * 5), 5)
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._in_flight_key)
+            local = self.selector.local_in_flight()
+            mapping = {
+                f"{client_type}:{idx}": count
+                for client_type, counts in local.items()
+                for idx, count in counts.items()
+            }
+            if mapping:
+                pipe.hset(self._in_flight_key, mapping=mapping)
+                pipe.expire(self._in_flight_key, ttl)
+            pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+            # 超过几个周期没有心跳的 worker 视为已经退出
+            pipe.zremrangebyscore(WORKERS_KEY, "-inf", now - ttl)
+            pipe.zrange(WORKERS_KEY, 0, -1)
+            for client_type in CLIENT_TYPES:
+                pipe.zremrangebyscore(UNHEALTHY_KEY_PREFIX + client_type, "-inf", now)
+                pipe.zrange(UNHEALTHY_KEY_PREFIX + client_type, 0, -1)
+            results = await pipe.execute()
+
+        unhealthy_results = results[-2 * len(CLIENT_TYPES) + 1 :: 2]
+        workers = results[-2 * len(CLIENT_TYPES) - 1]
+        others = [w for w in workers if w != self.worker_id]
+        remote: Dict[str, Dict[int, int]] = {}
+        if others:
+            async with redis.pipeline(transaction=False) as pipe:
+                for other in others:
+                    pipe.hgetall(IN_FLIGHT_KEY_PREFIX + other)
+                for counts in await pipe.execute():
+                    for field, count in counts.items():
+                        client_type, _, idx = field.partition(":")
+                        type_counts = remote.setdefault(client_type, {})
+                        type_counts[int(idx)] = type_counts.get(int(idx), 0) + int(
+                            count
+                        )
+        self.selector.set_remote_in_flight(remote)
+        unhealthy: Dict[str, Set[int]] = {
+            client_type: {int(idx) for idx in idxs}
+            for client_type, idxs in zip(CLIENT_TYPES, unhealthy_results)
+            if idxs
+        }
+        self.selector.set_unhealthy(unhealthy)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Shared client state sync failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipe:
+                pipe.delete(self._in_flight_key)
+                pipe.zrem(WORKERS_KEY, self.worker_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to unregister worker {self.worker_id}: {e}")
+
+
+shared_client_state = SharedClientState()
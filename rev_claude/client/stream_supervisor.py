@@ -0,0 +1,298 @@
+import asyncio
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from loguru import logger
+
+from rev_claude.client.client_admission import (
+    AdmittedSlot,
+    ClientAdmission,
+    client_admission,
+)
+from rev_claude.client.shared_client_state import shared_client_state
+from rev_claude.configs import STREAM_FIRST_TOKEN_BUDGET, STREAM_MAX_ATTEMPTS
+from rev_claude.metrics.prometheus_metrics import registry
+
+STREAM_FAILOVER_TOTAL = registry.counter(
+    "revpoe_stream_failover_total",
+    "Hedged requests and failover retries by event.",
+    ("client_type", "event"),
+)
+STREAM_CANCELLED_TOTAL = registry.counter(
+    "revpoe_stream_cancelled_total",
+    "Upstream streams cancelled because the client went away, by stage.",
+    ("client_type", "stage"),
+)
+
+RETRY_NOTICE = "\n\n[上游连接中断, 已切换线路重新生成]\n\n"
+
+
+class _Attempt:
+    """One upstream stream started on one client."""
+
+    __slots__ = ("idx", "stream", "next_task", "callbacks", "closed")
+
+    def __init__(self, idx: int):
+        self.idx = idx
+        self.stream: Optional[AsyncIterator] = None
+        self.next_task: Optional[asyncio.Future] = None
+        # stream_message 结束时调用的回调, 只有最终胜出的那个流才会真正执行
+        self.callbacks: List[Callable] = []
+        self.closed = False
+
+
+class StreamSupervisor:
+    """Runs a chat stream with a first token budget, hedging and failover.
+
+    If the first token does not arrive within ``first_token_budget``, a hedged
+    request is started on another client; the first stream to produce a token
+    wins and the other is closed. A stream failing mid-way is retried on
+    another client. Each attempt holds its own admission slot, and the
+    ``call_back`` list only runs for the attempt that finished the response.
+    If the client goes away mid-answer, the upstream is closed and
+    ``on_cancel`` gets the partial text instead, unless the upstream already
+    ran its callbacks while closing. ``on_retry`` is called once the retry
+    notice has been sent, so whatever was counted from the failed attempt
+    can be dropped.
+    """
+
+    def __init__(
+        self,
+        client_type: str,
+        clients: Dict[int, Any],
+        start_stream: Callable[[Any, int, list], AsyncIterator],
+        call_back: list,
+        admission: ClientAdmission = client_admission,
+        first_token_budget: float = STREAM_FIRST_TOKEN_BUDGET,
+        max_attempts: int = STREAM_MAX_ATTEMPTS,
+        retry_notice: str = RETRY_NOTICE,
+        on_cancel: Optional[Callable[[str], Awaitable]] = None,
+        on_retry: Optional[Callable[[], Any]] = None,
+    ):
+        self.client_type = client_type
+        self.clients = clients
+        self.start_stream = start_stream
+        self.call_back = call_back
+        self.admission = admission
+        self.first_token_budget = first_token_budget or None
+        self.max_attempts = max_attempts
+        self.retry_notice = retry_notice
+        self.on_cancel = on_cancel
+        self.on_retry = on_retry
+        self._attempts: List[_Attempt] = []
+        # 胜出的流已经输出的文本, 客户端断开时用来记录历史和计费
+        self._partial: List[str] = []
+        self.winner: Optional[_Attempt] = None
+        # 整个回答由同一个流完整输出(中途没有换客户端重试)
+        self.completed = False
+        self._retried = False
+
+    @property
+    def client_idx(self) -> Optional[int]:
+        return self.winner.idx if self.winner is not None else None
+
+    def _deferred_call_back(self, attempt: _Attempt) -> list:
+        async def record(callback, *args, **kwargs):
+            attempt.callbacks.append(partial(callback, *args, **kwargs))
+
+        return [partial(record, callback) for callback in self.call_back]
+
+    def _start(self, idx: int) -> _Attempt:
+        """Start a stream on an admitted client, taking over its slot."""
+        attempt = _Attempt(idx)
+        self._attempts.append(attempt)
+        try:
+            attempt.stream = self.start_stream(
+                self.clients[idx], idx, self._deferred_call_back(attempt)
+            )
+        except BaseException:
+            self._release(attempt)
+            raise
+        return attempt
+
+    def _start_spare(self) -> Optional[_Attempt]:
+        if len(self._attempts) >= self.max_attempts:
+            return None
+        tried = {attempt.idx for attempt in self._attempts}
+        try:
+            idx = self.admission.try_admit(self.client_type, exclude=tried)
+        except ValueError:
+            return None
+        if idx is None:
+            return None
+        if idx not in self.clients:
+            self.admission.release(self.client_type, idx)
+            return None
+        return self._start(idx)
+
+    def _release(self, attempt: _Attempt):
+        if not attempt.closed:
+            attempt.closed = True
+            self.admission.release(self.client_type, attempt.idx)
+
+    async def _close(self, attempt: _Attempt):
+        task, attempt.next_task = attempt.next_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+        if attempt.stream is not None:
+            try:
+                await attempt.stream.aclose()
+            except Exception as e:
+                logger.debug(f"Closing stream on client {attempt.idx} failed: {e}")
+        self._release(attempt)
+
+    async def _first_chunk(self, attempt: _Attempt) -> Tuple[Optional[_Attempt], Any]:
+        """Race attempts for the first chunk, hedging once the budget runs out."""
+        racing = [attempt]
+        attempt.next_task = asyncio.ensure_future(attempt.stream.__anext__())
+        budget = self.first_token_budget
+        last_error: Optional[BaseException] = None
+        while racing:
+            done, _ = await asyncio.wait(
+                [a.next_task for a in racing],
+                timeout=budget,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # 首 token 超时, 在另一个客户端上对冲, 之后只对冲一次
+                budget = None
+                spare = self._start_spare()
+                if spare is not None:
+                    logger.warning(
+                        f"No first token from {self.client_type} client {racing[0].idx} "
+                        f"in {self.first_token_budget}s, hedging on client {spare.idx}."
+                    )
+                    STREAM_FAILOVER_TOTAL.inc(self.client_type, "hedge_started")
+                    spare.next_task = asyncio.ensure_future(spare.stream.__anext__())
+                    racing.append(spare)
+                continue
+
+            finished = [a for a in racing if a.next_task in done]
+            racing = [a for a in racing if a.next_task not in done]
+            winner = None
+            for candidate in finished:
+                task = candidate.next_task
+                if task.cancelled():
+                    last_error = asyncio.CancelledError()
+                elif task.exception() is None:
+                    if winner is None:
+                        winner = candidate
+                        continue
+                elif not isinstance(task.exception(), StopAsyncIteration):
+                    last_error = task.exception()
+                    logger.warning(
+                        f"Stream on {self.client_type} client {candidate.idx} failed "
+                        f"before the first token: {last_error}"
+                    )
+                    shared_client_state.report_failure(self.client_type, candidate.idx)
+                await self._close(candidate)
+            if winner is not None:
+                first = winner.next_task.result()
+                winner.next_task = None
+                for other in racing:
+                    await self._close(other)
+                if len(self._attempts) > 1:
+                    event = (
+                        "primary_won" if winner is self._attempts[0] else "spare_won"
+                    )
+                    STREAM_FAILOVER_TOTAL.inc(self.client_type, event)
+                return winner, first
+            if not racing:
+                # 全部失败了, 换一个客户端重试
+                spare = self._start_spare()
+                if spare is not None:
+                    STREAM_FAILOVER_TOTAL.inc(self.client_type, "retry")
+                    spare.next_task = asyncio.ensure_future(spare.stream.__anext__())
+                    racing.append(spare)
+                    budget = self.first_token_budget
+        if last_error is not None:
+            raise last_error
+        return None, None
+
+    async def _run_callbacks(self, attempt: _Attempt):
+        callbacks, attempt.callbacks = attempt.callbacks, []
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Stream callback failed: {e}")
+
+    def _collect(self, chunk):
+        if isinstance(chunk, str):
+            self._partial.append(chunk)
+
+    async def _finish(self, cancelled: bool):
+        for attempt in self._attempts:
+            if attempt is not self.winner:
+                await self._close(attempt)
+        winner = self.winner
+        if winner is None:
+            return
+        # 先关闭上游, 它可能在关闭时执行回调
+        await self._close(winner)
+        if winner.callbacks or not cancelled or self.on_cancel is None:
+            await self._run_callbacks(winner)
+            return
+        try:
+            await self.on_cancel("".join(self._partial))
+        except Exception as e:
+            logger.error(f"Stream cancel callback failed: {e}")
+
+    async def stream(self, slot: AdmittedSlot) -> AsyncIterator:
+        """Yield the upstream chunks, starting on the already admitted ``slot``."""
+        cancelled = False
+        try:
+            # 从这里开始名额由 supervisor 负责释放
+            attempt = self._start(slot.take())
+            while True:
+                attempt, first = await self._first_chunk(attempt)
+                if attempt is None:
+                    return
+                self.winner = attempt
+                self._collect(first)
+                yield first
+                try:
+                    async for chunk in attempt.stream:
+                        self._collect(chunk)
+                        yield chunk
+                    self.completed = not self._retried
+                    return
+                except Exception as e:
+                    logger.warning(
+                        f"Stream on {self.client_type} client {attempt.idx} failed mid-way: {e}"
+                    )
+                    shared_client_state.report_failure(self.client_type, attempt.idx)
+                    # 中途失败的流不记录历史也不计费
+                    self.winner = None
+                    self._partial = []
+                    await self._close(attempt)
+                    spare = self._start_spare()
+                    if spare is None:
+                        raise
+                    STREAM_FAILOVER_TOTAL.inc(self.client_type, "retry")
+                    self._retried = True
+                    yield self.retry_notice
+                    if self.on_retry is not None:
+                        self.on_retry()
+                    attempt = spare
+        except (GeneratorExit, asyncio.CancelledError):
+            cancelled = True
+            stage = "before_first_token" if self.winner is None else "mid_stream"
+            STREAM_CANCELLED_TOTAL.inc(self.client_type, stage)
+            raise
+        finally:
+            # 清理放在独立的任务里, 即使再次被取消也会关闭上游、释放名额并只执行一次回调
+            await asyncio.shield(self._finish(cancelled))
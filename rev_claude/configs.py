@@ -13,19 +13,46 @@ DATA_DIR = ROOT / "data"
 LOG_DIR = ROOT / "logs"
 POE_BOT_INFO = DATA_DIR / "models.json"
 POE_BOT_INFO_ZH = DATA_DIR / "models_zh.json"
+# 按模型的策略(例如响应缓存), 单独存放, 不会被更新机器人信息覆盖
+POE_BOT_POLICY = DATA_DIR / "models_policy.json"
 UPLOAD_DIR = ROOT / "uploaded_files"
+# 文档解析结果缓存(按内容哈希), 超过上限后按 LRU 清理
+DOCUMENT_CACHE_DIR = ROOT / "cache" / "documents"
+DOCUMENT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+DOCUMENT_CONVERT_WORKERS = 2
+# 机器人目录文件的 mtime 检查间隔(秒), 0 表示只在收到 SIGHUP 时重新加载
+BOT_CATALOG_RELOAD_INTERVAL = 5
+# 机器人头像, 带 ?v=<内容哈希> 请求时按 immutable 长期缓存
+AVATAR_DIR = DATA_DIR / "bots_avatars"
+# 允许的缩略图尺寸(像素), 需要安装 Pillow
+AVATAR_SIZES = (32, 64, 128)
 
 API_KEY_REFRESH_INTERVAL = API_KEY_REFRESH_INTERVAL_HOURS * 60 * 60
 # TODO: 这里增加使用次数次数改成对应增加对应的使用积分， 但是意思是一样的。
 BASIC_KEY_MAX_USAGE = 30e4  # 普通用户一个月30万积分
 PLUS_KEY_MAX_USAGE = 100e4  # plus 用户一个月。
+# 维护用量排行的 key 类型, 其他类型只计入总量和按时间的统计
+API_KEY_TYPES = ("basic", "plus")
 ACCOUNT_DELETE_LIMIT = 1000000000
+# 每个 worker 内 API key 信息的本地缓存, 管理接口修改 key 时通过 pub/sub 失效
+API_KEY_CACHE_SIZE = 10000
+API_KEY_CACHE_TTL = 30
+# 批量管理接口: 每个 Lua 脚本/流水线处理的 key 数量, 分页大小
+API_KEY_BATCH_CHUNK_SIZE = 1000
+API_KEY_LIST_PAGE_SIZE = 500
+# 用量排行的有序集合随每次计费增量更新, 每隔这么久(秒)从 SCAN 完整重建一次以清理已删除的 key
+API_KEY_USAGE_INDEX_REBUILD_INTERVAL = 24 * 60 * 60
+# 按小时/按天的用量统计保留时间(秒)
+USAGE_HOURLY_RETENTION = 8 * 24 * 60 * 60
+USAGE_DAILY_RETENTION = 400 * 24 * 60 * 60
 
 
 STREAM_CONNECTION_TIME_OUT = 60
 STREAM_READ_TIME_OUT = 60
 STREAM_POOL_TIME_OUT = 10 * 60
 CLAUDE_CLIENT_LIMIT_CHECKS_INTERVAL_MINUTES = 10
+# 客户端状态快照的有效期(秒), 过期后在后台刷新
+CLIENTS_STATUS_SNAPSHOT_TTL = 10
 
 NEW_CONVERSATION_RETRY = 5
 
@@ -33,8 +60,76 @@ NEW_CONVERSATION_RETRY = 5
 
 DEFAULT_TOKENIZER = "cl100k_base"
 USE_TOKEN_SHORTEN = True
+# token 计数在线程池中进行, 相同文本(例如重复的历史消息)的计数结果会被缓存
+TOKENIZER_WORKERS = 2
+TOKENIZER_MEMO_SIZE = 4096
+# 流式输出累计到这么多字符后在后台计数一次
+TOKENIZER_STREAM_FLUSH_CHARS = 2048
+# 按 token 计费(默认关闭, 按每次对话固定积分计费): 积分 = 模型积分 * ceil(总 token 数 / 单位)
+TOKEN_BILLING_ENABLED = False
+TOKEN_BILLING_UNIT = 1000
+
+# 可断点续传的 SSE: 生成与 HTTP 连接解耦, 帧写入 Redis stream, 断线后凭 Last-Event-ID 续传
+RESUMABLE_STREAMS_ENABLED = False
+RESUMABLE_STREAM_TTL = 5 * 60
+RESUMABLE_STREAM_MAXLEN = 10000
+# 续传时等待新帧的最长时间(毫秒), 超时后发送一次心跳
+RESUMABLE_STREAM_BLOCK_MS = 15000
+# 每个生成等待写入 Redis 的帧数上限, Redis 落后太多时生成会等待
+RESUMABLE_STREAM_WRITE_QUEUE_SIZE = 256
+
+# 完全相同的请求的响应缓存, 按模型在 models_policy.json 中开启, 例如 {"xxx": {"cache_ttl": 3600}}
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 256 * 1024  # 压缩后超过这个大小的响应不缓存
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 缓存总大小, 超过后先淘汰最早写入的
 
 MAX_ATTACHMENTS = 5
+MAX_UPLOAD_FILE_SIZE = 32 * 1024 * 1024  # 单个附件最大 32MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传文件分块写入, 每块 1MB
+
+# 流结束后的 Redis 写入(历史记录/用量)合并批量写入
+WRITE_BEHIND_BATCH_SIZE = 64
+WRITE_BEHIND_FLUSH_INTERVAL = 0.005  # 5 毫秒
+WRITE_BEHIND_MAX_BACKLOG = 10000  # 积压超过这个数量时写入方需要等待
+WRITE_BEHIND_DRAIN_TIMEOUT = 10
+
+# 联网搜索: 结果缓存和超时(秒), 超时后直接使用原始 prompt
+WEB_SEARCH_PROVIDER = os.environ.get("WEB_SEARCH_PROVIDER", "duckduckgo")
+WEB_SEARCH_CACHE_TTL = 10 * 60
+WEB_SEARCH_CACHE_SIZE = 1024
+WEB_SEARCH_DEADLINE = 8
+
+# SSE 合并窗口: 在这个时间(秒)内到达的小块文本合并成一帧发送, 0 表示不合并
+SSE_COALESCE_WINDOW = 0.003
+SSE_COALESCE_MAX_BYTES = 2048
+# 上游和 SSE 编码之间最多缓冲的块数, 客户端读得慢时上游也会暂停读取
+SSE_PUMP_QUEUE_SIZE = 64
+
+# 客户端选择策略: usage_weighted / least_in_flight / power_of_two
+CLIENT_SELECTION_POLICY = os.environ.get("CLIENT_SELECTION_POLICY", "usage_weighted")
+
+# 每个客户端同时服务的最大流数, 0 表示不限制
+CLIENT_MAX_CONCURRENT_STREAMS = {
+    "plus": 4,
+    "basic": 2,
+}
+# 所有客户端都满时的排队上限和最长等待时间(秒)
+ADMISSION_QUEUE_MAX_WAITERS = 500
+ADMISSION_QUEUE_TIMEOUT = 60
+ADMISSION_QUEUE_POLL_INTERVAL = 1
+
+# 多 worker 部署: 各 worker 通过 Redis 同步客户端的在途流数和失败状态的间隔(秒)
+SHARED_STATE_SYNC_INTERVAL = 1
+# 客户端失败后的冷却时间(秒), 冷却期内所有 worker 都尽量不选它
+CLIENT_FAILURE_COOLDOWN = 60
+# worker 数量, 大于 1 时以多进程方式启动
+SERVER_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+# 重启或停止时等待进行中的 SSE 流结束的最长时间(秒)
+GRACEFUL_SHUTDOWN_TIMEOUT = 5 * 60
+
+# 首 token 超过这个时间(秒)还没到, 就在另一个客户端上发起对冲请求, 0 表示不对冲
+STREAM_FIRST_TOKEN_BUDGET = 10
+# 一次请求最多使用的上游流数(含对冲和失败重试)
+STREAM_MAX_ATTEMPTS = 3
 
 
 # 设置连接超时为你的 STREAM_CONNECTION_TIME_OUT，其他超时设置为无限
@@ -73,7 +168,7 @@ CLAUDE_OFFICIAL_USAGE_INCREASE = 15
 """
 这里是对Poe后端的定义
 """
-POE_BOT_BASE_URL = "https://api.poe.com/bot/"
+POE_BOT_BASE_URL = os.environ.get("POE_BOT_BASE_URL", "https://api.poe.com/bot/")
 POE_BOT_TEMPERATURE = 0.95
 
 
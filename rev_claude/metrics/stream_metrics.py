@@ -0,0 +1,106 @@
+import asyncio
+from contextlib import aclosing, contextmanager
+from time import perf_counter
+from typing import AsyncIterator, Optional
+
+from rev_claude.catalog.bot_catalog import bot_catalog
+from rev_claude.metrics.prometheus_metrics import registry
+
+STAGE_SECONDS = registry.histogram(
+    "revpoe_stage_seconds",
+    "Time spent in each stage of a /form_chat request.",
+    ("stage",),
+)
+TIME_TO_FIRST_TOKEN_SECONDS = registry.histogram(
+    "revpoe_time_to_first_token_seconds",
+    "Time from request start to the first upstream chunk, per model.",
+    ("model",),
+)
+TOKENS_PER_SECOND_BY_MODEL = registry.histogram(
+    "revpoe_stream_tokens_per_second",
+    "Streamed tokens per second after the first token, per model.",
+    ("model",),
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320, 640),
+)
+TOKENS_PER_SECOND_BY_CLIENT = registry.histogram(
+    "revpoe_client_tokens_per_second",
+    "Streamed tokens per second after the first token, per upstream client.",
+    ("client_type", "client_idx"),
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320, 640),
+)
+STREAMS_IN_FLIGHT = registry.gauge(
+    "revpoe_streams_in_flight", "Number of admitted /form_chat streams being served."
+)
+UPSTREAM_ATTEMPTS_TOTAL = registry.counter(
+    "revpoe_upstream_attempts_total",
+    "Finished upstream stream attempts (hedges and retries included) by outcome.",
+    ("outcome",),
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(perf_counter() - start, stage)
+
+
+def observe_stage(stage: str, start: float):
+    STAGE_SECONDS.observe(perf_counter() - start, stage)
+
+
+def model_label(model: str) -> str:
+    """Catalog name of ``model``, so user input can't create new label values."""
+    record = bot_catalog.get(model)
+    return record.name if record is not None else "unknown"
+
+
+async def track_stream(
+    source: AsyncIterator,
+    model: str,
+    client_type: str,
+    client_idx: int,
+    request_start: Optional[float] = None,
+) -> AsyncIterator:
+    """Measure first token latency and throughput of an upstream stream.
+
+    Every upstream chunk counts as one token.
+    """
+    model = model_label(model)
+    stream_start = perf_counter()
+    if request_start is None:
+        request_start = stream_start
+    first_token_at = None
+    tokens = 0
+    outcome = "error"
+    try:
+        # 被关闭时同时关闭上游, 释放连接
+        async with aclosing(source):
+            async for chunk in source:
+                if first_token_at is None:
+                    first_token_at = perf_counter()
+                    STAGE_SECONDS.observe(
+                        first_token_at - stream_start, "upstream_first_chunk"
+                    )
+                    TIME_TO_FIRST_TOKEN_SECONDS.observe(
+                        first_token_at - request_start, model
+                    )
+                tokens += 1
+                yield chunk
+        outcome = "completed"
+    except GeneratorExit:
+        outcome = "closed"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        UPSTREAM_ATTEMPTS_TOTAL.inc(outcome)
+        if first_token_at is not None and tokens > 1:
+            elapsed = perf_counter() - first_token_at
+            if elapsed > 0:
+                rate = (tokens - 1) / elapsed
+                TOKENS_PER_SECOND_BY_MODEL.observe(rate, model)
+                TOKENS_PER_SECOND_BY_CLIENT.observe(rate, client_type, client_idx)
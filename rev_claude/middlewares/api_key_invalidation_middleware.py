@@ -0,0 +1,93 @@
+import json
+import re
+
+from loguru import logger
+
+from rev_claude.api_key.api_key_admin import get_api_key_admin
+from rev_claude.api_key.api_key_cache import INVALIDATE_ALL, api_key_cache
+
+API_KEY_ROUTE_PREFIX = "/api/v1/api_key/"
+# 这些管理接口会修改单个 key 的状态
+SINGLE_KEY_ROUTE = re.compile(
+    r"^/api/v1/api_key/"
+    r"(?:delete_key|reset_current_usage|extend_expiration)/(?P<api_key>[^/]+)/?$"
+)
+# 批量接口的 key 在请求体里, 直接让所有缓存失效
+BATCH_KEY_ROUTE = re.compile(r"^/api/v1/api_key/(?:delete_batch_keys|batch_\w+)/?$")
+# 删除的 key 还要从用量排行里移除
+DELETE_KEY_ROUTE = re.compile(r"^/api/v1/api_key/delete_key/(?P<api_key>[^/]+)/?$")
+DELETE_BATCH_ROUTE = re.compile(r"^/api/v1/api_key/delete_batch_keys/?$")
+
+
+def _keys_to_invalidate(path: str):
+    match = SINGLE_KEY_ROUTE.match(path)
+    if match:
+        return [match.group("api_key")]
+    if BATCH_KEY_ROUTE.match(path):
+        return [INVALIDATE_ALL]
+    return None
+
+
+def _deleted_keys(path: str, body: bytes):
+    match = DELETE_KEY_ROUTE.match(path)
+    if match:
+        return [match.group("api_key")]
+    try:
+        payload = json.loads(body or b"null")
+    except ValueError:
+        return []
+    if isinstance(payload, dict):
+        payload = payload.get("api_keys")
+    if not isinstance(payload, list):
+        return []
+    return [api_key for api_key in payload if isinstance(api_key, str)]
+
+
+class APIKeyInvalidationMiddleware:
+    """Broadcast API key cache invalidations after successful admin writes.
+
+    A plain ASGI middleware so that streaming responses of other routes
+    pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "GET":
+            return await self.app(scope, receive, send)
+        path = scope.get("path", "")
+        if not path.startswith(API_KEY_ROUTE_PREFIX):
+            return await self.app(scope, receive, send)
+        api_keys = _keys_to_invalidate(path)
+        if api_keys is None:
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        deleting = bool(DELETE_KEY_ROUTE.match(path) or DELETE_BATCH_ROUTE.match(path))
+        body = []
+
+        async def receive_wrapper():
+            message = await receive()
+            if deleting and message["type"] == "http.request":
+                body.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        await self.app(scope, receive_wrapper, send_wrapper)
+        if status_code < 400:
+            try:
+                if deleting:
+                    await get_api_key_admin().remove_from_usage_index(
+                        _deleted_keys(path, b"".join(body))
+                    )
+                await api_key_cache.publish_invalidation(api_keys)
+            except Exception:
+                from traceback import format_exc
+
+                logger.error(format_exc())
@@ -0,0 +1,171 @@
+import asyncio
+import importlib
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from rev_claude.configs import (
+    WEB_SEARCH_CACHE_SIZE,
+    WEB_SEARCH_CACHE_TTL,
+    WEB_SEARCH_DEADLINE,
+    WEB_SEARCH_PROVIDER,
+)
+
+SearchResult = Tuple[str, List[str]]
+
+
+class SearchProvider:
+    name = ""
+
+    async def render_prompt(self, prompt: str) -> SearchResult:
+        raise NotImplementedError
+
+    async def warm_up(self):
+        pass
+
+
+class DuckDuckSearchProvider(SearchProvider):
+    name = "duckduckgo"
+
+    def __init__(self):
+        self._prompt_class = None
+
+    async def _load(self):
+        # duckduckgo_search 导入较慢, 放到线程里导入, 不阻塞事件循环
+        if self._prompt_class is None:
+            module = await asyncio.to_thread(
+                importlib.import_module,
+                "rev_claude.prompts_builder.duckduck_search_prompt",
+            )
+            self._prompt_class = module.DuckDuckSearchPrompt
+        return self._prompt_class
+
+    async def warm_up(self):
+        await self._load()
+
+    async def render_prompt(self, prompt: str) -> SearchResult:
+        prompt_class = await self._load()
+        return await prompt_class(prompt=prompt).render_prompt()
+
+
+class StubSearchProvider(SearchProvider):
+    """Offline provider with a fixed latency, for benchmarks and local runs."""
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+
+    async def render_prompt(self, prompt: str) -> SearchResult:
+        await asyncio.sleep(self.latency)
+        hrefs = [f"\n[1] https://example.com/search?q={len(prompt)}"]
+        return f"Search results for the question below.\n\n{prompt}", hrefs
+
+
+SEARCH_PROVIDERS = {
+    provider.name: provider for provider in (DuckDuckSearchProvider, StubSearchProvider)
+}
+
+
+def get_search_provider(name: str) -> SearchProvider:
+    try:
+        return SEARCH_PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown web search provider: {name}, available: {list(SEARCH_PROVIDERS)}"
+        )
+
+
+def normalize_query(prompt: str) -> str:
+    return " ".join(prompt.split()).casefold()
+
+
+def _consume_exception(task: asyncio.Task):
+    # 超时后没人等待的搜索任务, 避免 "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class WebSearchService:
+    """Web search with a TTL/LRU result cache and a hard deadline.
+
+    When the deadline passes the plain prompt is used; the search keeps
+    running in the background so its result still lands in the cache.
+    """
+
+    def __init__(
+        self,
+        provider: Optional[SearchProvider] = None,
+        ttl: float = WEB_SEARCH_CACHE_TTL,
+        maxsize: int = WEB_SEARCH_CACHE_SIZE,
+        deadline: float = WEB_SEARCH_DEADLINE,
+    ):
+        self.provider = provider or get_search_provider(WEB_SEARCH_PROVIDER)
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.deadline = deadline
+        # normalized query -> (expires_at, SearchResult)
+        self._cache: "OrderedDict[str, Tuple[float, SearchResult]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def warm_up(self):
+        await self.provider.warm_up()
+
+    def set_provider(self, provider: SearchProvider):
+        self.provider = provider
+        self._cache.clear()
+
+    def _get_cached(self, key: str) -> Optional[SearchResult]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            self._cache.pop(key, None)
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _put_cached(self, key: str, result: SearchResult):
+        self._cache[key] = (time.monotonic() + self.ttl, result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    async def _search(self, key: str, prompt: str) -> SearchResult:
+        try:
+            result = await self.provider.render_prompt(prompt)
+            self._put_cached(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def render_prompt(self, prompt: str) -> SearchResult:
+        key = normalize_query(prompt)
+        cached = self._get_cached(key)
+        if cached is not None:
+            message, hrefs = cached
+            return message, list(hrefs)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.get_running_loop().create_task(
+                self._search(key, prompt)
+            )
+            task.add_done_callback(_consume_exception)
+        try:
+            message, hrefs = await asyncio.wait_for(asyncio.shield(task), self.deadline)
+        except asyncio.TimeoutError:
+            logger.warning(f"Web search exceeded {self.deadline}s, using plain prompt.")
+            return prompt, []
+        except Exception:
+            from traceback import format_exc
+
+            logger.error(format_exc())
+            return prompt, []
+        return message, list(hrefs)
+
+
+web_search_service = WebSearchService()
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from rev_claude.client.client_manager import ClientManager
+from rev_claude.client.client_selector import client_selector
+from rev_claude.configs import CLIENTS_STATUS_SNAPSHOT_TTL
+from rev_claude.status.clients_status_manager import ClientsStatus
+from utility import get_client_status
+
+
+class ClientsStatusSnapshot:
+    """Shared, short-lived snapshot of all clients' status.
+
+    The chat path reads the current snapshot without awaiting; a stale
+    snapshot triggers one background refresh that every concurrent caller
+    shares, instead of each request fanning out to Redis on its own.
+    """
+
+    def __init__(self, ttl: float = CLIENTS_STATUS_SNAPSHOT_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._status_list: Optional[List[ClientsStatus]] = None
+        self._grouped: Optional[List[ClientsStatus]] = None
+        self._grouped_version = -1
+        self._refreshed_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._scheduled_refresh: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._refreshed_at > self.ttl
+
+    def current(self) -> Optional[List[ClientsStatus]]:
+        """Return the snapshot without waiting, scheduling a refresh if stale."""
+        if self.is_stale:
+            self._ensure_refresh()
+        return self._status_list
+
+    async def get(self) -> List[ClientsStatus]:
+        status_list = self.current()
+        if status_list is None:
+            status_list = await self.refresh()
+        return status_list
+
+    async def refresh(self) -> List[ClientsStatus]:
+        # single-flight: 并发请求共享同一个正在进行的刷新
+        task = self._ensure_refresh()
+        return await asyncio.shield(task)
+
+    def _ensure_refresh(self) -> asyncio.Task:
+        task = self._refresh_task
+        if task is None or task.done():
+            task = self._refresh_task = asyncio.get_running_loop().create_task(
+                self._refresh()
+            )
+        return task
+
+    async def _refresh(self) -> List[ClientsStatus]:
+        try:
+            basic_clients, plus_clients = ClientManager().get_clients()
+            status_list = await get_client_status(basic_clients, plus_clients)
+        except Exception:
+            from traceback import format_exc
+
+            logger.error(format_exc())
+            if self._status_list is None:
+                raise
+            # 刷新失败时继续使用旧的快照, 等待下一次刷新
+            self._refreshed_at = time.monotonic()
+            return self._status_list
+        self._publish(status_list)
+        return status_list
+
+    def _publish(self, status_list: List[ClientsStatus]):
+        self._status_list = status_list
+        self._refreshed_at = time.monotonic()
+        self.version += 1
+        client_selector.update(status_list, version=self.version)
+
+    def notify_stream_finished(self):
+        # 流结束后客户端的usage会变化, 但最多每个 TTL 刷新一次, 同一时间段内结束的流共享这次刷新
+        handle = self._scheduled_refresh
+        if handle is not None and not handle.cancelled():
+            return
+        delay = max(self._refreshed_at + self.ttl - time.monotonic(), 0.0)
+        self._scheduled_refresh = asyncio.get_running_loop().call_later(
+            delay, self._run_scheduled_refresh
+        )
+
+    def _run_scheduled_refresh(self):
+        self._scheduled_refresh = None
+        if self.is_stale:
+            self._ensure_refresh()
+
+    def grouped(self) -> Optional[List[ClientsStatus]]:
+        """Usage aggregated by client type, recomputed only when the snapshot changes."""
+        status_list = self.current()
+        if status_list is None:
+            return None
+        if self._grouped_version != self.version:
+            # Group by type and aggregate usage
+            grouped_status: Dict[str, dict] = {}
+            for status in status_list:
+                client_type = status.type
+                if client_type not in grouped_status:
+                    grouped_status[client_type] = status.model_dump()
+                    grouped_status[client_type]["usage"] = status.usage
+                else:
+                    grouped_status[client_type]["usage"] += status.usage
+            self._grouped = [
+                ClientsStatus(**status) for status in grouped_status.values()
+            ]
+            self._grouped_version = self.version
+        return self._grouped
+
+    async def get_grouped(self) -> List[ClientsStatus]:
+        if self._status_list is None:
+            await self.refresh()
+        return self.grouped()
+
+    def start(self):
+        self._ensure_refresh()
+
+    async def stop(self):
+        if self._scheduled_refresh is not None:
+            self._scheduled_refresh.cancel()
+            self._scheduled_refresh = None
+        task = self._refresh_task
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._refresh_task = None
+
+
+clients_status_snapshot = ClientsStatusSnapshot()
@@ -0,0 +1,24 @@
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from rev_claude.configs import REDIS_HOST, REDIS_PORT
+
+_async_redis: Optional[aioredis.Redis] = None
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Process-wide asyncio Redis client sharing one connection pool."""
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.Redis(
+            host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True
+        )
+    return _async_redis
+
+
+async def close_async_redis():
+    global _async_redis
+    if _async_redis is not None:
+        await _async_redis.aclose()
+        _async_redis = None
@@ -0,0 +1,64 @@
+import asyncio
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """StreamingResponse that stops its body as soon as the client goes away.
+
+    The body is streamed in its own task while ``http.disconnect`` is
+    watched. On disconnect the task is cancelled once and the body iterator
+    closed, so upstream streams release their connections and client slots
+    right away instead of when the next write fails.
+    """
+
+    async def _stream(self, send: Send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+    @staticmethod
+    async def _wait_disconnect(receive: Receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def _close_body(self):
+        aclose = getattr(self.body_iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await super().__call__(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        stream_task = loop.create_task(self._stream(send))
+        disconnect_task = loop.create_task(self._wait_disconnect(receive))
+        try:
+            await asyncio.wait(
+                {stream_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            # 服务关闭时取消一次, 生成器在自己的任务里完成清理
+            disconnect_task.cancel()
+            stream_task.cancel()
+            raise
+        disconnect_task.cancel()
+        if not stream_task.done():
+            stream_task.cancel()
+            try:
+                await asyncio.shield(stream_task)
+            except asyncio.CancelledError:
+                if not stream_task.done():
+                    raise
+            await self._close_body()
+            return
+        await stream_task
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import mimetypes
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+from uuid import uuid4
+
+from fastapi import UploadFile
+from loguru import logger
+from starlette.datastructures import Headers
+
+from rev_claude.configs import (
+    DOCUMENT_CACHE_DIR,
+    DOCUMENT_CACHE_MAX_BYTES,
+    DOCUMENT_CONVERT_WORKERS,
+)
+from rev_claude.utils.file_upload_utils import check_upload_limits, spooled_upload
+
+# 这两个字段取决于上传者, 不写入缓存, 每次按当前请求填写
+REQUEST_FIELDS = ("file_name", "file_type")
+# 缓存内容的格式变化时修改, 旧的条目不再命中, 之后按 LRU 清理
+ENTRY_VERSION = "v2"
+
+
+def convert_saved_document(
+    path: str, filename: Optional[str], content_type: Optional[str], size: int
+) -> dict:
+    """Run upload_attachment_for_fastapi on a saved upload; runs inside the process pool."""
+    from rev_claude.client.claude import upload_attachment_for_fastapi
+
+    headers = Headers({"content-type": content_type}) if content_type else None
+    with open(path, "rb") as f:
+        upload = UploadFile(f, size=size, filename=filename, headers=headers)
+        return asyncio.run(upload_attachment_for_fastapi(upload))
+
+
+def _for_request(file: UploadFile, content: dict) -> dict:
+    file_type = file.content_type or mimetypes.guess_type(file.filename or "")[0]
+    return {"file_name": file.filename, "file_type": file_type, **content}
+
+
+class DocumentConvertCache:
+    """Content-addressed cache of /convert_document results.
+
+    The parsed content lives on disk as ``<sha256>.v2.json`` and is
+    evicted least recently used first once the directory grows past
+    ``max_bytes``; the file name and type always come from the current
+    request. Misses go through ``upload_attachment_for_fastapi`` in a
+    process pool, and concurrent uploads of the same content wait for a
+    single parse.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = DOCUMENT_CACHE_DIR,
+        max_bytes: int = DOCUMENT_CACHE_MAX_BYTES,
+        workers: int = DOCUMENT_CONVERT_WORKERS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._total_bytes: Optional[int] = None
+        # _write 和 _evict 在不同的工作线程里执行
+        self._bytes_lock = threading.Lock()
+
+    def _entry_path(self, digest: str) -> Path:
+        return self.cache_dir / f"{digest}.{ENTRY_VERSION}.json"
+
+    def _read(self, digest: str) -> Optional[dict]:
+        path = self._entry_path(digest)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # 更新 mtime, 作为 LRU 的访问时间
+        os.utime(path)
+        return result
+
+    def _scan_total_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*.json"))
+
+    def _write(self, digest: str, content: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        tmp_path = self.cache_dir / f".{uuid4().hex}.part"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self._entry_path(digest))
+        with self._bytes_lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total_bytes()
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 调用方持有 _bytes_lock
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # 清理到上限的 90%, 避免每次写入都触发清理
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._total_bytes = total
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def convert(self, file: UploadFile) -> dict:
+        check_upload_limits([file])
+        # 上传的文档只在解析期间保存在磁盘上, 缓存的是解析结果
+        async with spooled_upload(file) as saved:
+            return await self._convert_cached(file, saved)
+
+    async def _convert_cached(self, file: UploadFile, saved) -> dict:
+        digest = saved.sha256
+        content = await asyncio.to_thread(self._read, digest)
+        if content is not None:
+            logger.debug(f"Document cache hit: {file.filename} ({digest})")
+            return _for_request(file, content)
+
+        future = self._inflight.get(digest)
+        if future is not None:
+            return _for_request(file, await asyncio.shield(future))
+        future = self._inflight[digest] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._convert(file, saved)
+            content = {k: v for k, v in result.items() if k not in REQUEST_FIELDS}
+            await asyncio.to_thread(self._write, digest, content)
+            future.set_result(content)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(digest, None)
+
+    async def _convert(self, file: UploadFile, saved) -> dict:
+        # 解析是 CPU 密集的同步代码, 放到进程池里, 不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            convert_saved_document,
+            str(saved.path),
+            file.filename,
+            file.content_type,
+            saved.size,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+document_convert_cache = DocumentConvertCache()
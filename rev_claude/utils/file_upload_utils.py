@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile
+from loguru import logger
+
+from rev_claude.configs import (
+    MAX_ATTACHMENTS,
+    MAX_UPLOAD_FILE_SIZE,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_DIR,
+)
+
+
+class SavedUpload:
+    __slots__ = ("path", "sha256", "size")
+
+    def __init__(self, path: Path, sha256: str, size: int):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+
+def _too_large(filename: Optional[str]) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"文件 {filename} 超过了大小限制 {MAX_UPLOAD_FILE_SIZE // (1024 * 1024)}MB。",
+    )
+
+
+def check_upload_limits(files: List[UploadFile]):
+    """Reject the request before any file body is read."""
+    if len(files) > MAX_ATTACHMENTS:
+        raise HTTPException(
+            status_code=400, detail=f"最多只能上传{MAX_ATTACHMENTS}个附件。"
+        )
+    for file in files:
+        if file.size is not None and file.size > MAX_UPLOAD_FILE_SIZE:
+            raise _too_large(file.filename)
+
+
+def _safe_filename(filename: Optional[str]) -> str:
+    name = Path(filename or "").name.strip()
+    # Path("..").name 仍然是 "..", 会指向哈希目录的上一级
+    if name in ("", ".", ".."):
+        return "file"
+    return name
+
+
+def _write_chunk(fh, hasher, chunk: bytes):
+    hasher.update(chunk)
+    fh.write(chunk)
+
+
+def _store_blob(tmp_path: Path, digest: str, filename: str) -> Path:
+    # 按内容哈希存放: UPLOAD_DIR/<sha256>/<原文件名>, 相同内容只保存一份
+    blob_dir = UPLOAD_DIR / digest
+    target = blob_dir / filename
+    if target.resolve().parent != blob_dir.resolve():
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=f"无效的文件名: {filename}")
+    if target.exists():
+        tmp_path.unlink(missing_ok=True)
+        return target
+    blob_dir.mkdir(parents=True, exist_ok=True)
+    existing = next((p for p in blob_dir.iterdir() if p.is_file()), None)
+    if existing is None:
+        os.replace(tmp_path, target)
+        return target
+    # 同样的内容换了个文件名, 用硬链接而不是再存一份
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(existing, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copyfile(existing, target)
+    return target
+
+
+async def _spool(file: UploadFile) -> Tuple[Path, str, int]:
+    """Stream an upload to a temporary file in UPLOAD_DIR, returning its path, sha256 and size."""
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = UPLOAD_DIR / f".{uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    fh = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_FILE_SIZE:
+                raise _too_large(file.filename)
+            await asyncio.to_thread(_write_chunk, fh, hasher, chunk)
+    except BaseException:
+        await asyncio.to_thread(fh.close)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(fh.close)
+    return tmp_path, hasher.hexdigest(), size
+
+
+async def save_upload(file: UploadFile) -> SavedUpload:
+    """Stream an upload to UPLOAD_DIR in bounded chunks, deduplicated by content."""
+    tmp_path, digest, size = await _spool(file)
+    path = await asyncio.to_thread(
+        _store_blob, tmp_path, digest, _safe_filename(file.filename)
+    )
+    # 上游客户端之后还会读取这个文件
+    await file.seek(0)
+    return SavedUpload(path, digest, size)
+
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile) -> AsyncIterator[SavedUpload]:
+    """Like save_upload, but the file is only kept until the block exits."""
+    tmp_path, digest, size = await _spool(file)
+    try:
+        await file.seek(0)
+        yield SavedUpload(tmp_path, digest, size)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+async def save_uploads(files: List[UploadFile]) -> List[SavedUpload]:
+    """Save several uploads concurrently, skipping the ones that fail."""
+    check_upload_limits(files)
+    results = await asyncio.gather(
+        *(save_upload(file) for file in files), return_exceptions=True
+    )
+    saved = []
+    for file, result in zip(files, results):
+        if isinstance(result, HTTPException):
+            raise result
+        if isinstance(result, BaseException):
+            logger.error(f"Error saving file {file.filename}: {str(result)}")
+            continue
+        saved.append(result)
+    return saved
@@ -0,0 +1,174 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import unicodedata
+import zlib
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from rev_claude.configs import (
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES,
+)
+from rev_claude.metrics.prometheus_metrics import registry
+from rev_claude.utils.async_redis_utils import get_async_redis
+
+RESPONSE_CACHE_TOTAL = registry.counter(
+    "revpoe_response_cache_total",
+    "Response cache lookups and writes by outcome.",
+    ("outcome",),
+)
+
+# 所有 key 都带同一个 hash tag, 在 Redis Cluster 中落在同一个 slot.
+# STORE_SCRIPT 淘汰的条目事先不知道, 无法放进 KEYS, 依赖这一点才能在集群中运行
+CACHE_KEY_PREFIX = "response_cache:{rc}:"
+INDEX_KEY = f"{CACHE_KEY_PREFIX}index"
+SIZES_KEY = f"{CACHE_KEY_PREFIX}sizes"
+TOTAL_BYTES_KEY = f"{CACHE_KEY_PREFIX}bytes"
+# 每次写入时检查多少条最早的条目是否已经过期
+PRUNE_BATCH = 32
+
+# 写入一条缓存并记录大小. 先从索引里清理已经按 TTL 过期的条目,
+# 总大小仍超过上限时再按写入时间淘汰最早的条目
+STORE_SCRIPT = """
+local function drop(member)
+    local member_size = tonumber(redis.call('HGET', KEYS[3], member) or '0')
+    redis.call('ZREM', KEYS[2], member)
+    redis.call('HDEL', KEYS[3], member)
+    redis.call('DEL', member)
+    return redis.call('DECRBY', KEYS[4], member_size)
+end
+local size = string.len(ARGV[1])
+local old = tonumber(redis.call('HGET', KEYS[3], KEYS[1]) or '0')
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], size)
+local total = redis.call('INCRBY', KEYS[4], size - old)
+for _, member in ipairs(redis.call('ZRANGE', KEYS[2], 0, tonumber(ARGV[5]) - 1)) do
+    if redis.call('EXISTS', member) == 0 then
+        total = drop(member)
+    end
+end
+local max_bytes = tonumber(ARGV[4])
+while total > max_bytes do
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0)
+    if #oldest == 0 then break end
+    total = drop(oldest[1])
+end
+return total
+"""
+
+
+def normalize_message(message: str) -> str:
+    # 只做不改变语义的归一化: Unicode NFC、统一换行、去掉行尾和首尾空白
+    message = unicodedata.normalize("NFC", message).replace("\r\n", "\n")
+    return "\n".join(line.rstrip() for line in message.strip().split("\n"))
+
+
+def response_cache_key(
+    model: str, message: str, attachment_hashes: Iterable[str] = ()
+) -> str:
+    hasher = hashlib.sha256()
+    parts = (model.casefold(), normalize_message(message), *sorted(attachment_hashes))
+    for part in parts:
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return f"{CACHE_KEY_PREFIX}{model.casefold()}:{hasher.hexdigest()}"
+
+
+def _encode(chunks: List[str]) -> str:
+    raw = json.dumps(chunks, ensure_ascii=False).encode("utf-8")
+    # Redis 客户端按文本解码响应, 压缩后的数据用 base64 存放
+    return base64.b64encode(zlib.compress(raw)).decode("ascii")
+
+
+def _decode(value: str) -> List[str]:
+    return json.loads(zlib.decompress(base64.b64decode(value)))
+
+
+class ResponseCache:
+    """Exact-match cache of complete streamed answers, compressed in Redis.
+
+    Entries are keyed on the model, the normalized message and the
+    attachment digests, expire after the bot's ``cache_ttl`` and are evicted
+    oldest first once the cache grows past ``max_bytes``. Chunks are kept
+    as streamed, so a hit replays through the normal SSE path.
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    ):
+        self.redis = redis or get_async_redis()
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._store_script = self.redis.register_script(STORE_SCRIPT)
+        self._pending: Set[asyncio.Task] = set()
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        try:
+            value = await self.redis.get(key)
+            chunks = _decode(value) if value is not None else None
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            chunks = None
+        RESPONSE_CACHE_TOTAL.inc("hit" if chunks is not None else "miss")
+        return chunks
+
+    async def put(self, key: str, chunks: List[str], ttl: int):
+        try:
+            value = await asyncio.to_thread(_encode, chunks)
+            if len(value) > self.max_entry_bytes:
+                RESPONSE_CACHE_TOTAL.inc("too_large")
+                return
+            await self._store_script(
+                keys=[key, INDEX_KEY, SIZES_KEY, TOTAL_BYTES_KEY],
+                args=[value, int(ttl), time.time(), self.max_bytes, PRUNE_BATCH],
+            )
+            RESPONSE_CACHE_TOTAL.inc("stored")
+        except Exception as e:
+            logger.warning(f"Failed to store cached response: {e}")
+
+    async def record(
+        self,
+        key: str,
+        ttl: int,
+        source: AsyncIterator,
+        complete: Callable[[], bool],
+    ) -> AsyncIterator:
+        """Pass ``source`` through and cache it once it finished and ``complete()`` holds."""
+        chunks: List[str] = []
+        cacheable = True
+        async with aclosing(source):
+            async for chunk in source:
+                if isinstance(chunk, str):
+                    chunks.append(chunk)
+                else:
+                    cacheable = False
+                yield chunk
+        if cacheable and chunks and complete():
+            # 写缓存不占用响应的时间
+            task = asyncio.get_running_loop().create_task(self.put(key, chunks, ttl))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    @staticmethod
+    async def replay(chunks: List[str]) -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,230 @@
+import asyncio
+import uuid
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from rev_claude.configs import (
+    GRACEFUL_SHUTDOWN_TIMEOUT,
+    RESUMABLE_STREAM_BLOCK_MS,
+    RESUMABLE_STREAM_MAXLEN,
+    RESUMABLE_STREAM_TTL,
+    RESUMABLE_STREAM_WRITE_QUEUE_SIZE,
+)
+from rev_claude.utils.async_redis_utils import get_async_redis
+
+STREAM_KEY_PREFIX = "sse_stream:"
+FRAME_FIELD = "frame"
+END_FIELD = "end"
+KEEPALIVE_FRAME = b": keepalive\n\n"
+# 响应头里返回本次生成的 token, 续传时作为 generation 参数带上
+STREAM_GENERATION_HEADER = "X-Stream-Generation"
+
+
+def _latest_key(conversation_id: str) -> str:
+    return f"{STREAM_KEY_PREFIX}{conversation_id}:latest"
+
+
+def _stream_keys(conversation_id: str, generation: str) -> Tuple[str, str]:
+    # 每次生成单独一个 stream, 同一对话的新生成不会和仍在进行的旧生成混在一起
+    key = f"{STREAM_KEY_PREFIX}{conversation_id}:{generation}"
+    return key, f"{key}:owner"
+
+
+def _with_id(seq: int, frame: Union[str, bytes]) -> bytes:
+    if isinstance(frame, str):
+        frame = frame.encode("utf-8")
+    return b"id: %d\n" % seq + frame
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    try:
+        return max(int(value), 0) if value else 0
+    except ValueError:
+        return 0
+
+
+class ResumableStream:
+    """One generation running independently of the HTTP connection.
+
+    Frames get increasing sequence ids, which are also their Redis stream
+    ids (``<seq>-0``), so a client that reconnects with ``Last-Event-ID``
+    can be replayed from Redis on any worker. The connection that started
+    the generation follows the in-process buffer and never waits on Redis;
+    frames reach Redis through a bounded queue drained by a background
+    writer, so the generation only waits when Redis falls that far behind.
+    """
+
+    def __init__(
+        self,
+        conversation_id: str,
+        generation: str,
+        redis,
+        ttl: int,
+        maxlen: int,
+        queue_size: int = RESUMABLE_STREAM_WRITE_QUEUE_SIZE,
+    ):
+        self.conversation_id = conversation_id
+        self.generation = generation
+        self.key, _ = _stream_keys(conversation_id, generation)
+        self.redis = redis
+        self.ttl = ttl
+        self.maxlen = maxlen
+        self._frames: List[bytes] = []
+        self._done = False
+        self._changed = asyncio.Event()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 1))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _publish(self, entries: List[Tuple[int, Dict[str, str]]]):
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for seq, fields in entries:
+                    pipe.xadd(
+                        self.key,
+                        fields,
+                        id=f"{seq}-0",
+                        maxlen=self.maxlen,
+                        approximate=True,
+                    )
+                pipe.expire(self.key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(
+                f"Failed to buffer frames {entries[0][0]}-{entries[-1][0]} "
+                f"of {self.conversation_id}: {e}"
+            )
+
+    async def _write(self):
+        # 每次把队列里已有的帧合并成一个流水线写入, 写到结束标记为止
+        while True:
+            entries = [await self._queue.get()]
+            while not self._queue.empty():
+                entries.append(self._queue.get_nowait())
+            await self._publish(entries)
+            if END_FIELD in entries[-1][1]:
+                return
+
+    async def _finish(self, writer: asyncio.Task):
+        await self._queue.put((len(self._frames) + 1, {END_FIELD: "1"}))
+        await writer
+
+    async def run(self, source: AsyncIterator):
+        writer = asyncio.get_running_loop().create_task(self._write())
+        try:
+            async with aclosing(source):
+                async for frame in source:
+                    seq = len(self._frames) + 1
+                    self._frames.append(_with_id(seq, frame))
+                    self._notify()
+                    if isinstance(frame, bytes):
+                        frame = frame.decode("utf-8")
+                    await self._queue.put((seq, {FRAME_FIELD: frame}))
+        except Exception as e:
+            logger.error(f"Resumable stream {self.conversation_id} failed: {e}")
+        finally:
+            self._done = True
+            self._notify()
+            await asyncio.shield(self._finish(writer))
+
+    async def follow(self) -> AsyncIterator[bytes]:
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self._frames):
+                yield self._frames[sent]
+                sent += 1
+            if self._done:
+                return
+            await changed.wait()
+
+
+class ResumableStreams:
+    """Starts detached generations and replays them to reconnecting clients."""
+
+    def __init__(
+        self,
+        redis=None,
+        ttl: int = RESUMABLE_STREAM_TTL,
+        maxlen: int = RESUMABLE_STREAM_MAXLEN,
+        block_ms: int = RESUMABLE_STREAM_BLOCK_MS,
+    ):
+        self.redis = redis or get_async_redis()
+        self.ttl = ttl
+        self.maxlen = maxlen
+        self.block_ms = block_ms
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(
+        self, conversation_id: str, owner: str, source: AsyncIterator
+    ) -> Tuple[str, AsyncIterator[bytes]]:
+        """Run ``source`` in the background.
+
+        Returns the generation token the client resumes with and a live
+        follower of the generation's frames.
+        """
+        generation = uuid.uuid4().hex
+        _, owner_key = _stream_keys(conversation_id, generation)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(owner_key, owner, ex=self.ttl)
+            # 没有带 generation 的续传请求默认接上最新一次生成
+            pipe.set(_latest_key(conversation_id), generation, ex=self.ttl)
+            await pipe.execute()
+        stream = ResumableStream(
+            conversation_id, generation, self.redis, self.ttl, self.maxlen
+        )
+        task = asyncio.get_running_loop().create_task(stream.run(source))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return generation, stream.follow()
+
+    async def latest(self, conversation_id: str) -> Optional[str]:
+        return await self.redis.get(_latest_key(conversation_id))
+
+    async def owner(self, conversation_id: str, generation: str) -> Optional[str]:
+        _, owner_key = _stream_keys(conversation_id, generation)
+        return await self.redis.get(owner_key)
+
+    async def replay(
+        self, conversation_id: str, generation: str, last_event_id: int
+    ) -> AsyncIterator[bytes]:
+        """Frames after ``last_event_id``, then the live tail until the generation ends."""
+        key, _ = _stream_keys(conversation_id, generation)
+        last_id = f"{last_event_id}-0"
+        while True:
+            response = await self.redis.xread({key: last_id}, block=self.block_ms)
+            if not response:
+                if not await self.redis.exists(key):
+                    return
+                yield KEEPALIVE_FRAME
+                continue
+            for entry_id, fields in response[0][1]:
+                if END_FIELD in fields:
+                    return
+                last_id = entry_id
+                yield _with_id(int(entry_id.split("-", 1)[0]), fields[FRAME_FIELD])
+
+    async def stop(self, timeout: float = GRACEFUL_SHUTDOWN_TIMEOUT):
+        """Let running generations finish for up to ``timeout`` seconds, then cancel them."""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} unfinished resumable streams.")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+_resumable_streams: Optional[ResumableStreams] = None
+
+
+def get_resumable_streams() -> ResumableStreams:
+    global _resumable_streams
+    if _resumable_streams is None:
+        _resumable_streams = ResumableStreams()
+    return _resumable_streams
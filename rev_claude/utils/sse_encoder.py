@@ -0,0 +1,144 @@
+import asyncio
+from json import dumps
+from json.encoder import encode_basestring, encode_basestring_ascii
+from typing import AsyncIterator, Callable, Optional
+
+from rev_claude.configs import (
+    SSE_COALESCE_MAX_BYTES,
+    SSE_COALESCE_WINDOW,
+    SSE_PUMP_QUEUE_SIZE,
+)
+from rev_claude.utils.sse_utils import build_sse_data
+
+_MESSAGE_SLOT = "__sse_message_slot__"
+# 用来确认模板和 build_sse_data 的转义方式完全一致
+_PROBE_MESSAGE = 'probe "quoted" \\ \n 中文 </end>'
+_END = object()
+
+
+class SSEFrameEncoder:
+    """Encodes the SSE frames of one stream straight to bytes.
+
+    The frame layout is taken from ``build_sse_data`` once per stream: the
+    bytes before and after the message (including the repeated
+    conversation id) are kept, so each delta only costs one string escape.
+    Falls back to ``build_sse_data`` if the layout cannot be derived.
+    """
+
+    __slots__ = ("conversation_id", "_prefix", "_suffix", "_escape")
+
+    def __init__(self, conversation_id: Optional[str]):
+        self.conversation_id = conversation_id
+        self._prefix: bytes = b""
+        self._suffix: bytes = b""
+        self._escape: Optional[Callable[[str], str]] = None
+        self._derive_template()
+
+    def _derive_template(self):
+        frame = build_sse_data(message=_MESSAGE_SLOT, id=self.conversation_id)
+        if isinstance(frame, bytes):
+            frame = frame.decode("utf-8")
+        quoted_slot = dumps(_MESSAGE_SLOT)
+        if frame.count(quoted_slot) != 1:
+            return
+        prefix, suffix = frame.split(quoted_slot)
+        expected = build_sse_data(message=_PROBE_MESSAGE, id=self.conversation_id)
+        if isinstance(expected, bytes):
+            expected = expected.decode("utf-8")
+        for escape in (encode_basestring_ascii, encode_basestring):
+            if prefix + escape(_PROBE_MESSAGE) + suffix == expected:
+                self._prefix = prefix.encode("utf-8")
+                self._suffix = suffix.encode("utf-8")
+                self._escape = escape
+                return
+
+    def encode(self, message) -> bytes:
+        escape = self._escape
+        if escape is None or not isinstance(message, str):
+            frame = build_sse_data(message=message, id=self.conversation_id)
+            return frame if isinstance(frame, bytes) else frame.encode("utf-8")
+        return self._prefix + escape(message).encode("utf-8") + self._suffix
+
+    async def stream(
+        self,
+        source: AsyncIterator,
+        coalesce_window: float = SSE_COALESCE_WINDOW,
+        max_bytes: int = SSE_COALESCE_MAX_BYTES,
+        queue_size: int = SSE_PUMP_QUEUE_SIZE,
+    ) -> AsyncIterator[bytes]:
+        """Encode every item of ``source``.
+
+        With a positive ``coalesce_window`` (seconds), text chunks that
+        arrive within the window after a first one are merged into a single
+        frame, up to ``max_bytes`` characters. At most ``queue_size`` chunks
+        are read ahead of the client, so a slow client slows the upstream down.
+        """
+        if coalesce_window <= 0:
+            try:
+                async for message in source:
+                    yield self.encode(message)
+            finally:
+                await _aclose(source)
+            return
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 1))
+
+        async def pump():
+            try:
+                async for message in source:
+                    await queue.put(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(_END)
+
+        loop = asyncio.get_running_loop()
+        pump_task = loop.create_task(pump())
+        try:
+            pending = None
+            while True:
+                item = pending if pending is not None else await queue.get()
+                pending = None
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                if not isinstance(item, str):
+                    yield self.encode(item)
+                    continue
+                parts = [item]
+                size = len(item)
+                deadline = loop.time() + coalesce_window
+                while size < max_bytes:
+                    try:
+                        nxt = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            nxt = await asyncio.wait_for(queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if not isinstance(nxt, str):
+                        pending = nxt
+                        break
+                    parts.append(nxt)
+                    size += len(nxt)
+                yield self.encode(parts[0] if len(parts) == 1 else "".join(parts))
+        finally:
+            if not pump_task.done():
+                pump_task.cancel()
+                try:
+                    await pump_task
+                except asyncio.CancelledError:
+                    pass
+            await _aclose(source)
+
+
+async def _aclose(source):
+    aclose = getattr(source, "aclose", None)
+    if aclose is not None:
+        await aclose()
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+NO_CACHE = "no-cache"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# 按优先级排列的压缩方式
+ENCODINGS = ("br", "gzip")
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _accepted_encodings(header: Optional[str]) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class StaticAsset:
+    """A response body serialized once, with precompressed variants and ETags.
+
+    Each content encoding gets its own strong ETag; any of them matches
+    ``If-None-Match`` since they all stand for the same content.
+    """
+
+    __slots__ = ("media_type", "digest", "variants", "etags")
+
+    def __init__(self, body: bytes, media_type: str, compress: bool = True):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants: Dict[str, bytes] = {"identity": body}
+        if compress:
+            brotli = _brotli()
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            # 压缩后没有变小的就不提供
+            for encoding in ENCODINGS:
+                if len(self.variants.get(encoding, body)) >= len(body):
+                    self.variants.pop(encoding, None)
+        tag = self.digest[:32]
+        self.etags: Dict[str, str] = {
+            encoding: f'"{tag}"' if encoding == "identity" else f'"{tag}-{encoding}"'
+            for encoding in self.variants
+        }
+
+    @property
+    def version(self) -> str:
+        return self.digest[:12]
+
+    def _not_modified(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or not tags.isdisjoint(self.etags.values())
+
+    def _choose_encoding(self, accept_encoding: Optional[str]) -> str:
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            q = accepted.get(encoding, accepted.get("*", 0.0))
+            if q > 0 and encoding in self.variants:
+                return encoding
+        return "identity"
+
+    def response(self, request: Request, cache_control: str = NO_CACHE) -> Response:
+        encoding = self._choose_encoding(request.headers.get("accept-encoding"))
+        headers = {"ETag": self.etags[encoding], "Cache-Control": cache_control}
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if self._not_modified(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(
+            self.variants[encoding], media_type=self.media_type, headers=headers
+        )
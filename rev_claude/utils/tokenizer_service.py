@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple
+
+from loguru import logger
+
+from rev_claude.configs import (
+    DEFAULT_TOKENIZER,
+    TOKENIZER_MEMO_SIZE,
+    TOKENIZER_STREAM_FLUSH_CHARS,
+    TOKENIZER_WORKERS,
+)
+from rev_claude.metrics.prometheus_metrics import registry
+
+TOKENS_PER_REQUEST = registry.histogram(
+    "revpoe_tokens_per_request",
+    "Prompt and completion tokens per chat request.",
+    ("kind",),
+    buckets=(16, 64, 256, 1024, 4096, 16384, 65536, 262144),
+)
+
+# 没有空白可切分时(中日韩文本常见)保留在缓冲区的字符数, 其余的直接计数
+UNSETTLED_TAIL_CHARS = 16
+
+
+def _estimate_tokens(text: str) -> int:
+    # 没有 tiktoken 时的粗略估计: 平均每个 token 约 4 个字节
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+class TokenizerService:
+    """Token counting with one encoder loaded at startup.
+
+    Counting runs in a small thread pool so long prompts never block the
+    event loop, and results are memoized by content digest so repeated
+    history messages are only encoded once.
+    """
+
+    def __init__(
+        self,
+        encoding_name: str = DEFAULT_TOKENIZER,
+        workers: int = TOKENIZER_WORKERS,
+        memo_size: int = TOKENIZER_MEMO_SIZE,
+    ):
+        self.encoding_name = encoding_name
+        self.workers = workers
+        self.memo_size = memo_size
+        self._encoding = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._memo: "OrderedDict[bytes, int]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def load(self):
+        if self._encoding is not None:
+            return
+        try:
+            import tiktoken
+
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning(
+                f"Failed to load tokenizer {self.encoding_name}, falling back to estimates: {e}"
+            )
+
+    async def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="tokenizer"
+            )
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.load)
+        if self._encoding is not None:
+            logger.info(f"Tokenizer {self.encoding_name} loaded.")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def encode_length(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None:
+            return _estimate_tokens(text)
+        return len(self._encoding.encode_ordinary(text))
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _memo_get(self, digest: bytes) -> Optional[int]:
+        with self._memo_lock:
+            count = self._memo.get(digest)
+            if count is not None:
+                self._memo.move_to_end(digest)
+            return count
+
+    def _memo_put(self, digest: bytes, count: int):
+        with self._memo_lock:
+            self._memo[digest] = count
+            self._memo.move_to_end(digest)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def count_sync(self, text: str) -> int:
+        digest = self._digest(text)
+        count = self._memo_get(digest)
+        if count is None:
+            count = self.encode_length(text)
+            # 词表加载完成之前的估计值不缓存
+            if self._encoding is not None:
+                self._memo_put(digest, count)
+        return count
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    async def count(self, text: str) -> int:
+        if not text:
+            return 0
+        # 命中缓存时不需要切换线程
+        count = self._memo_get(self._digest(text))
+        if count is not None:
+            return count
+        return await self._run(self.count_sync, text)
+
+    async def count_uncached(self, text: str) -> int:
+        return await self._run(self.encode_length, text)
+
+    def stream_counter(self) -> "StreamTokenCounter":
+        return StreamTokenCounter(self)
+
+
+class StreamTokenCounter:
+    """Counts the tokens of a streamed response while it is being streamed.
+
+    Chunks are buffered and encoded in the background up to the last
+    whitespace, since a token never starts in the middle of a word; the
+    unsettled tail is carried over to the next flush. Text without
+    whitespace is cut a fixed number of characters before its end instead.
+    """
+
+    def __init__(
+        self, service: TokenizerService, flush_chars: int = TOKENIZER_STREAM_FLUSH_CHARS
+    ):
+        self.service = service
+        self.flush_chars = flush_chars
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._pending: List[asyncio.Future] = []
+
+    def feed(self, text: str):
+        if not isinstance(text, str) or not text:
+            return
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if self._buffered_chars >= self.flush_chars:
+            self._flush()
+
+    def _flush(self):
+        joined = "".join(self._buffer)
+        cut = max(joined.rfind(" "), joined.rfind("\n"))
+        if cut <= 0:
+            cut = len(joined) - UNSETTLED_TAIL_CHARS
+            if cut <= 0:
+                return
+        settled, tail = joined[:cut], joined[cut:]
+        self._buffer = [tail]
+        self._buffered_chars = len(tail)
+        self._pending.append(
+            asyncio.ensure_future(self.service.count_uncached(settled))
+        )
+
+    def reset(self):
+        """Forget everything fed so far, e.g. the text of a failed attempt."""
+        for future in self._pending:
+            future.cancel()
+        self._buffer = []
+        self._buffered_chars = 0
+        self._pending = []
+
+    async def total(self) -> int:
+        tail = "".join(self._buffer)
+        counts = await asyncio.gather(*self._pending, self.service.count_uncached(tail))
+        return sum(counts)
+
+    async def wrap(self, source: AsyncIterator) -> AsyncIterator:
+        async with aclosing(source):
+            async for chunk in source:
+                self.feed(chunk)
+                yield chunk
+
+
+class TokenUsage:
+    """Prompt and completion token counts of one chat request.
+
+    The upstream client keeps the conversation itself, so the prompt is
+    the message sent upstream (after web search), not the whole history.
+    """
+
+    def __init__(self, service: TokenizerService, prompt: str):
+        self._prompt_task = asyncio.ensure_future(service.count(prompt))
+        self.completion = service.stream_counter()
+
+    async def totals(self) -> Tuple[int, int]:
+        prompt_tokens = await self._prompt_task
+        completion_tokens = await self.completion.total()
+        TOKENS_PER_REQUEST.observe(prompt_tokens, "prompt")
+        TOKENS_PER_REQUEST.observe(completion_tokens, "completion")
+        return prompt_tokens, completion_tokens
+
+
+tokenizer_service = TokenizerService()
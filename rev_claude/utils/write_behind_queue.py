@@ -0,0 +1,135 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from rev_claude.api_key.api_key_accounting import get_api_key_accounting
+from rev_claude.configs import (
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_DRAIN_TIMEOUT,
+    WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_MAX_BACKLOG,
+)
+from rev_claude.history.conversation_history_manager import (
+    ConversationHistoryRequestInput,
+    Message,
+    conversation_history_manager,
+)
+
+USAGE = "usage"
+HISTORY = "history"
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Coalesces the Redis writes that run at the end of every stream.
+
+    Usage increments and history pushes are queued and flushed together,
+    either when ``batch_size`` writes are pending or ``flush_interval``
+    seconds after the first one. Usage increments of a batch are summed
+    per key and sent as one pipeline. A full backlog makes producers wait.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_backlog: int = WRITE_BEHIND_MAX_BACKLOG,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def backlog(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def push_usage(self, api_key: str, amount: int):
+        if not self.running:
+            await get_api_key_accounting().increment_usage(api_key, amount)
+            return
+        await self._queue.put((USAGE, api_key, amount))
+
+    async def push_history(
+        self, request: ConversationHistoryRequestInput, messages: List[Message]
+    ):
+        if not self.running:
+            await conversation_history_manager.push_message(request, messages)
+            return
+        await self._queue.put((HISTORY, request, messages))
+
+    async def _run(self):
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        increments: Dict[str, int] = {}
+        writes = []
+        for kind, *payload in batch:
+            if kind == USAGE:
+                api_key, amount = payload
+                increments[api_key] = increments.get(api_key, 0) + amount
+            else:
+                request, messages = payload
+                writes.append(
+                    conversation_history_manager.push_message(request, messages)
+                )
+        if increments:
+            writes.append(get_api_key_accounting().increment_usage_many(increments))
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.opt(exception=result).error("Write-behind flush failed.")
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_backlog)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT):
+        """Flush everything queued so far, then stop the flusher."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Write-behind queue not drained in {timeout}s, "
+                f"{self.backlog} writes dropped."
+            )
+        finally:
+            self._task = None
+
+
+write_behind_queue = WriteBehindQueue()
@@ -0,0 +1,39 @@
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from rev_claude.api_key.api_key_cache import api_key_cache
+from rev_claude.api_key.api_key_layout import APIKeyRedisKeys
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis():
+    client = FakeAsyncRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+    await client.aclose()
+
+
+@pytest.fixture
+def clear_api_key_cache():
+    api_key_cache.clear()
+    yield
+    api_key_cache.clear()
+
+
+@pytest.fixture
+def create_key(redis):
+    """Write an API key the way APIKeyManager lays it out."""
+
+    async def create(api_key, key_type="plus", **fields):
+        keys = APIKeyRedisKeys(api_key)
+        await redis.set(keys.api_key, "active")
+        await redis.set(keys.type, key_type)
+        for field, value in fields.items():
+            await redis.set(getattr(keys, field), value)
+
+    return create
@@ -0,0 +1,74 @@
+import pytest
+
+from rev_claude.api_key.api_key_accounting import (
+    USAGE_TOTALS_KEY,
+    APIKeyAccounting,
+    usage_bucket_keys,
+)
+from rev_claude.api_key.api_key_layout import APIKeyRedisKeys
+from rev_claude.configs import BASIC_KEY_MAX_USAGE
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("clear_api_key_cache")]
+
+
+async def test_check_unknown_key_is_invalid(redis):
+    state = await APIKeyAccounting(redis).check("sj-missing", use_cache=False)
+    assert not state.valid
+    assert not state.exceeded
+
+
+async def test_check_activates_key_once(redis, create_key):
+    await create_key("sj-new", expiration_days=2)
+    accounting = APIKeyAccounting(redis)
+
+    state = await accounting.check("sj-new", use_cache=False)
+    assert state.valid and state.newly_activated
+    assert state.key_type == "plus"
+    assert 0 < state.ttl <= 2 * 86400
+    assert await redis.get(APIKeyRedisKeys("sj-new").is_activated) == "1"
+
+    state = await accounting.check("sj-new", use_cache=False)
+    assert state.valid and not state.newly_activated
+
+
+async def test_check_uses_default_limit_per_type(redis, create_key):
+    await create_key("sj-basic", key_type="basic", current_usage=10)
+    state = await APIKeyAccounting(redis).check("sj-basic", use_cache=False)
+    assert state.usage_limit == BASIC_KEY_MAX_USAGE
+    assert state.current_usage == 10
+
+
+async def test_increment_usage_reports_exceeded_limit(redis, create_key):
+    await create_key("sj-limited", usage_limit=100)
+    accounting = APIKeyAccounting(redis)
+
+    result = await accounting.increment_usage("sj-limited", 60)
+    assert (result.total_usage, result.current_usage, result.exceeded) == (
+        60,
+        60,
+        False,
+    )
+    result = await accounting.increment_usage("sj-limited", 40)
+    assert result.current_usage == 100 and result.exceeded
+
+    state = await accounting.check("sj-limited", use_cache=False)
+    assert state.exceeded
+
+
+async def test_increment_usage_many_updates_aggregates(redis, create_key):
+    await create_key("sj-a", key_type="plus")
+    await create_key("sj-b", key_type="basic")
+    results = await APIKeyAccounting(redis).increment_usage_many({"sj-a": 5, "sj-b": 7})
+
+    assert results["sj-a"].total_usage == 5
+    assert results["sj-b"].total_usage == 7
+    totals = await redis.hgetall(USAGE_TOTALS_KEY)
+    assert totals == {
+        "plus:points": "5",
+        "plus:requests": "1",
+        "basic:points": "7",
+        "basic:requests": "1",
+    }
+    hourly_key, daily_key = usage_bucket_keys()
+    assert await redis.hget(hourly_key, "plus:points") == "5"
+    assert await redis.hget(daily_key, "basic:points") == "7"
@@ -0,0 +1,132 @@
+import pytest
+
+from rev_claude.api_key.api_key_accounting import (
+    USAGE_INDEX_REBUILD_KEY,
+    USAGE_TOTALS_KEY,
+    APIKeyAccounting,
+    usage_index_key,
+    usage_index_staging_key,
+)
+from rev_claude.api_key.api_key_admin import APIKeyAdmin
+from rev_claude.api_key.api_key_layout import APIKeyRedisKeys
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("clear_api_key_cache")]
+
+
+async def list_all(admin, count, key_type=None):
+    listed, cursor = [], 0
+    while True:
+        cursor, page = await admin.list_keys_page(cursor, count, key_type)
+        listed.extend(page)
+        if cursor == 0:
+            return listed
+
+
+async def test_list_keys_page_lists_each_key_once(redis, create_key):
+    for i in range(20):
+        fields = {"usage": i} if i % 2 else {"expiration_days": 3}
+        key_type = "basic" if i < 5 else "plus"
+        await create_key(f"sj-{i}", key_type=key_type, **fields)
+    # 不是 API key 的 key 不应出现
+    await redis.set("conversation:1", "x")
+    await redis.set("sj-deleted:usage", 1)
+    admin = APIKeyAdmin(redis)
+
+    listed = await list_all(admin, 3)
+    assert sorted(listed) == sorted(f"sj-{i}" for i in range(20))
+    assert len(await list_all(admin, 3, key_type="basic")) == 5
+
+
+async def test_list_keys_page_reads_fields(redis, create_key):
+    await create_key("sj-a", usage=7, current_usage=3, is_activated="1")
+    _, page = await APIKeyAdmin(redis).list_keys_page(0, 100)
+    info = page["sj-a"]
+    assert info["key_type"] == "plus"
+    assert (info["usage"], info["current_usage"]) == (7, 3)
+    assert info["is_activated"] and info["usage_limit"] is None
+
+
+async def test_batch_reset_usage(redis, create_key):
+    await create_key("sj-a", current_usage=50)
+    results = await APIKeyAdmin(redis).batch_reset_usage(["sj-a", "sj-missing"])
+    assert results == {"sj-a": True, "sj-missing": False}
+    assert await redis.get(APIKeyRedisKeys("sj-a").current_usage) == "0"
+    assert not await redis.exists(APIKeyRedisKeys("sj-missing").current_usage)
+
+
+async def test_batch_extend_expiration(redis, create_key):
+    await create_key("sj-active", is_activated="1")
+    await redis.expire("sj-active", 100)
+    await create_key("sj-pending", expiration_days=2)
+    results = await APIKeyAdmin(redis).batch_extend_expiration(
+        ["sj-active", "sj-pending", "sj-missing"], 1
+    )
+    assert results["sj-active"] == 100 + 86400
+    assert results["sj-pending"] == -1
+    assert results["sj-missing"] == -2
+    assert await redis.get(APIKeyRedisKeys("sj-pending").expiration_days) == "3"
+
+
+async def test_rebuild_seeds_totals_billed_before_first_rebuild(redis, create_key):
+    await create_key("sj-old", usage=6000)
+    await APIKeyAccounting(redis).increment_usage("sj-old", 10)
+    admin = APIKeyAdmin(redis)
+
+    # 还没有完整重建过, 先返回现有排行, 重建在后台进行
+    assert await admin.top_usage("plus") == [{"api_key": "sj-old", "usage": 10}]
+    await admin._rebuild_task
+    assert await admin.top_usage("plus") == [{"api_key": "sj-old", "usage": 6010}]
+    assert (await admin.usage_totals())["plus"] == {"points": 6010, "requests": 1}
+    assert admin._rebuild_task.done()
+
+
+async def test_rebuild_keeps_increments_made_while_running(redis, create_key):
+    for i in range(6):
+        await create_key(f"sj-{i}", usage=100)
+    accounting = APIKeyAccounting(redis)
+    admin = APIKeyAdmin(redis)
+    scan_page = admin._scan_page
+
+    async def scan_page_with_billing(cursor, count):
+        result = await scan_page(cursor, 2)
+        # 每扫描一页就给所有 key 计费一次, 有的已经写入临时集合, 有的还没有
+        await accounting.increment_usage_many({f"sj-{i}": 1 for i in range(6)})
+        return result
+
+    admin._scan_page = scan_page_with_billing
+    assert await admin.rebuild_usage_index()
+
+    usage = {f"sj-{i}": int(await redis.get(f"sj-{i}:usage")) for i in range(6)}
+    index = await redis.zrange(usage_index_key("plus"), 0, -1, withscores=True)
+    assert {api_key: int(score) for api_key, score in index} == usage
+    total = await redis.hget(USAGE_TOTALS_KEY, "plus:points")
+    assert total == str(sum(usage.values()))
+    assert not await redis.exists(USAGE_INDEX_REBUILD_KEY)
+
+
+async def test_rebuild_drops_deleted_keys_and_skips_concurrent_runs(redis, create_key):
+    await create_key("sj-a", key_type="basic", usage=5)
+    await create_key("sj-b", key_type="basic", usage=7)
+    admin = APIKeyAdmin(redis)
+    assert await admin.rebuild_usage_index()
+
+    await redis.delete("sj-b", "sj-b:usage", "sj-b:type")
+    await redis.set(USAGE_INDEX_REBUILD_KEY, "other")
+    assert not await admin.rebuild_usage_index()
+    await redis.delete(USAGE_INDEX_REBUILD_KEY)
+
+    assert await admin.rebuild_usage_index()
+    assert await admin.top_usage("basic") == [{"api_key": "sj-a", "usage": 5}]
+    assert (await admin.usage_totals())["basic"]["points"] == 5
+
+
+async def test_remove_from_usage_index(redis, create_key):
+    await create_key("sj-a", usage=5)
+    await create_key("sj-b", usage=7)
+    admin = APIKeyAdmin(redis)
+    assert await admin.rebuild_usage_index()
+    await redis.zadd(usage_index_staging_key("plus"), {"sj-b": 7})
+
+    await admin.remove_from_usage_index(["sj-b", "sj-missing"])
+    assert await admin.top_usage("plus") == [{"api_key": "sj-a", "usage": 5}]
+    assert not await redis.zscore(usage_index_staging_key("plus"), "sj-b")
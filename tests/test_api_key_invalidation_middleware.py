@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from rev_claude.api_key.api_key_accounting import usage_index_key
+from rev_claude.api_key.api_key_admin import APIKeyAdmin
+from rev_claude.api_key.api_key_cache import api_key_cache
+from rev_claude.middlewares import api_key_invalidation_middleware
+from rev_claude.middlewares.api_key_invalidation_middleware import (
+    APIKeyInvalidationMiddleware,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def invalidated(redis, monkeypatch):
+    published = []
+
+    async def publish_invalidation(api_keys):
+        published.extend(api_keys)
+
+    admin = APIKeyAdmin(redis)
+    monkeypatch.setattr(api_key_cache, "publish_invalidation", publish_invalidation)
+    monkeypatch.setattr(
+        api_key_invalidation_middleware, "get_api_key_admin", lambda: admin
+    )
+    return published
+
+
+async def call(path: str, body: bytes = b"", status: int = 200):
+    async def app(scope, receive, send):
+        # 像路由一样读完请求体再响应
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "DELETE", "path": path}
+    await APIKeyInvalidationMiddleware(app)(scope, receive, send)
+
+
+async def test_deleted_key_leaves_usage_index(redis, invalidated):
+    await redis.zadd(usage_index_key("plus"), {"sj-a": 5, "sj-b": 7})
+    await call("/api/v1/api_key/delete_key/sj-a")
+    assert await redis.zrange(usage_index_key("plus"), 0, -1) == ["sj-b"]
+    assert invalidated == ["sj-a"]
+
+
+async def test_batch_delete_reads_keys_from_body(redis, invalidated):
+    await redis.zadd(usage_index_key("basic"), {"sj-a": 5, "sj-b": 7, "sj-c": 1})
+    body = json.dumps({"api_keys": ["sj-a", "sj-c"]}).encode()
+    await call("/api/v1/api_key/delete_batch_keys", body)
+    assert await redis.zrange(usage_index_key("basic"), 0, -1) == ["sj-b"]
+
+
+async def test_failed_delete_keeps_usage_index(redis, invalidated):
+    await redis.zadd(usage_index_key("plus"), {"sj-a": 5})
+    await call("/api/v1/api_key/delete_key/sj-a", status=404)
+    assert await redis.zrange(usage_index_key("plus"), 0, -1) == ["sj-a"]
+    assert invalidated == []
@@ -0,0 +1,22 @@
+import json
+
+from rev_claude.catalog import bot_catalog
+from rev_claude.catalog.bot_catalog import BotRecord
+
+
+def test_policy_sets_cache_fields(tmp_path, monkeypatch):
+    policy = tmp_path / "models_policy.json"
+    policy.write_text(
+        json.dumps({"Cached-Bot": {"cache_ttl": 3600, "cache_hit_points": 0}})
+    )
+    monkeypatch.setattr(bot_catalog, "POE_BOT_POLICY", policy)
+    records = {
+        "cached-bot": BotRecord("Cached-Bot", {"points": 300}),
+        "other-bot": BotRecord("Other-Bot", {"points": 100}),
+    }
+    bot_catalog._apply_policy(records)
+
+    assert records["cached-bot"].cache_ttl == 3600
+    assert records["cached-bot"].cache_hit_points == 0
+    assert records["other-bot"].cache_ttl is None
+    assert records["other-bot"].cache_hit_points is None
@@ -0,0 +1,403 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from rev_claude.client.client_admission import ClientAdmission
+from rev_claude.client.client_selector import ClientSelector
+from rev_claude.client.shared_client_state import shared_client_state
+from rev_claude.client.stream_supervisor import RETRY_NOTICE, StreamSupervisor
+from rev_claude.metrics.stream_metrics import STREAMS_IN_FLIGHT
+from rev_claude.utils.disconnect_aware_response import (
+    DisconnectAwareStreamingResponse,
+)
+from rev_claude.utils.tokenizer_service import TokenizerService
+
+pytestmark = pytest.mark.anyio
+
+
+def make_admission(cap: int = 1, clients: int = 1, timeout: float = 5):
+    selector = ClientSelector("least_in_flight")
+    selector.update(
+        [SimpleNamespace(type="plus", idx=idx, usage=0) for idx in range(clients)]
+    )
+    admission = ClientAdmission(
+        selector,
+        max_concurrent_streams={"plus": cap, "basic": cap},
+        timeout=timeout,
+        poll_interval=0.05,
+    )
+    return selector, admission
+
+
+def in_flight(selector, clients: int = 1) -> int:
+    return sum(selector.in_flight("plus", idx) for idx in range(clients))
+
+
+def admitted(admission, build_stream):
+    return admission.stream(
+        "plus",
+        build_stream,
+        notice=lambda depth: f"queued:{depth}",
+        rejected=lambda reason: "rejected",
+    )
+
+
+def supervised(admission, chunks, delay: float = 0, **kwargs):
+    def start_stream(client, idx, call_back):
+        async def upstream():
+            for chunk in chunks:
+                await asyncio.sleep(delay)
+                yield chunk
+            for callback in call_back:
+                await callback()
+
+        return upstream()
+
+    call_back = kwargs.pop("call_back", [])
+
+    def build_stream(slot):
+        supervisor = StreamSupervisor(
+            "plus",
+            {0: object()},
+            start_stream,
+            call_back,
+            admission=admission,
+            first_token_budget=0,
+            **kwargs,
+        )
+        return supervisor.stream(slot)
+
+    return build_stream
+
+
+async def test_closing_unstarted_stream_takes_no_slot():
+    selector, admission = make_admission()
+    stream = admitted(admission, supervised(admission, ["a"]))
+    await stream.aclose()
+    assert in_flight(selector) == 0
+
+
+async def test_slot_released_when_built_stream_never_starts():
+    selector, admission = make_admission()
+    started = asyncio.Event()
+
+    def build_stream(slot):
+        async def wrapper():
+            # 像 SSE 编码的 pump 一样, 内层的流还没开始就被取消
+            started.set()
+            await asyncio.sleep(10)
+            slot.take()
+            yield "never"
+
+        return wrapper()
+
+    async def consume():
+        async for _ in admitted(admission, build_stream):
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await started.wait()
+    assert in_flight(selector) == 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert in_flight(selector) == 0
+
+
+async def test_slot_released_when_build_stream_fails():
+    selector, admission = make_admission()
+
+    def build_stream(slot):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        async for _ in admitted(admission, build_stream):
+            pass
+    assert in_flight(selector) == 0
+
+
+async def test_completed_stream_runs_callbacks_and_releases():
+    selector, admission = make_admission()
+    finished = []
+
+    async def call_back():
+        finished.append(True)
+
+    stream = admitted(
+        admission, supervised(admission, ["a", "b"], call_back=[call_back])
+    )
+    assert [chunk async for chunk in stream] == ["a", "b"]
+    assert finished == [True]
+    assert in_flight(selector) == 0
+
+
+async def test_streams_in_flight_counts_admitted_requests():
+    _, admission = make_admission()
+    before = STREAMS_IN_FLIGHT.get()
+    stream = admitted(admission, supervised(admission, ["a", "b"]))
+    assert await stream.__anext__() == "a"
+    assert STREAMS_IN_FLIGHT.get() == before + 1
+    await stream.aclose()
+    assert STREAMS_IN_FLIGHT.get() == before
+
+
+async def test_cancelled_stream_reports_partial_answer_and_releases():
+    selector, admission = make_admission()
+    partial = []
+
+    async def on_cancel(answer):
+        partial.append(answer)
+
+    stream = admitted(
+        admission, supervised(admission, ["a", "b", "c"], on_cancel=on_cancel)
+    )
+    assert await stream.__anext__() == "a"
+    assert in_flight(selector) == 1
+    await stream.aclose()
+    assert partial == ["a"]
+    assert in_flight(selector) == 0
+
+
+async def test_queued_request_waits_for_released_slot():
+    selector, admission = make_admission(cap=1)
+    first = admitted(admission, supervised(admission, ["a", "b"]))
+    assert await first.__anext__() == "a"
+
+    second = admitted(admission, supervised(admission, ["c"]))
+    assert await second.__anext__() == "queued:0"
+    waiting = asyncio.ensure_future(second.__anext__())
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+
+    await first.aclose()
+    assert await waiting == "c"
+    await second.aclose()
+    assert in_flight(selector) == 0
+    assert admission.queue_depth("plus") == 0
+
+
+async def test_closing_queued_request_leaves_no_slot_or_waiter():
+    selector, admission = make_admission(cap=1)
+    first = admitted(admission, supervised(admission, ["a", "b"]))
+    await first.__anext__()
+
+    second = admitted(admission, supervised(admission, ["c"]))
+    await second.__anext__()
+    waiting = asyncio.ensure_future(second.__anext__())
+    await asyncio.sleep(0.1)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    await second.aclose()
+    assert admission.queue_depth("plus") == 0
+
+    await first.aclose()
+    assert in_flight(selector) == 0
+
+
+async def serve(body, disconnect_after: int = None):
+    """Run ``body`` over ASGI; the client leaves after ``disconnect_after`` chunks."""
+    sent = []
+    chunk_sent = asyncio.Event()
+
+    async def receive():
+        while disconnect_after is not None and len(sent) < disconnect_after:
+            chunk_sent.clear()
+            await chunk_sent.wait()
+        if disconnect_after is None:
+            await asyncio.sleep(10)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            sent.append(message["body"].decode())
+            chunk_sent.set()
+
+    response = DisconnectAwareStreamingResponse(body, media_type="text/event-stream")
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    await asyncio.wait_for(response(scope, receive, send), 5)
+    return sent
+
+
+async def test_disconnect_before_first_chunk_releases_slot():
+    selector, admission = make_admission()
+    partial = []
+
+    async def on_cancel(answer):
+        partial.append(answer)
+
+    stream = admitted(
+        admission, supervised(admission, ["a"], delay=10, on_cancel=on_cancel)
+    )
+    assert await serve(stream, disconnect_after=0) == []
+    assert in_flight(selector) == 0
+    # 还没有输出就断开, 不记录历史也不计费
+    assert partial == []
+
+
+async def test_disconnect_mid_stream_releases_slot():
+    selector, admission = make_admission()
+    partial = []
+
+    async def on_cancel(answer):
+        partial.append(answer)
+
+    stream = admitted(
+        admission,
+        supervised(admission, ["a", "b", "c"], delay=0.05, on_cancel=on_cancel),
+    )
+    assert await serve(stream, disconnect_after=1) == ["a"]
+    assert in_flight(selector) == 0
+    assert partial == ["a"]
+
+
+async def test_disconnect_while_queued_leaves_no_slot_or_waiter():
+    selector, admission = make_admission(cap=1)
+    first = admitted(admission, supervised(admission, ["a", "b"]))
+    await first.__anext__()
+
+    second = admitted(admission, supervised(admission, ["c"]))
+    assert await serve(second, disconnect_after=1) == ["queued:0"]
+    assert admission.queue_depth("plus") == 0
+
+    await first.aclose()
+    assert in_flight(selector) == 0
+
+
+async def test_completed_response_releases_slot():
+    selector, admission = make_admission()
+    stream = admitted(admission, supervised(admission, ["a", "b"]))
+    assert await serve(stream) == ["a", "b"]
+    assert in_flight(selector) == 0
+
+
+def test_has_clients_per_type():
+    selector, _ = make_admission()
+    assert selector.has_clients("plus")
+    assert not selector.has_clients("basic")
+
+
+@pytest.fixture
+def no_failure_publish(monkeypatch):
+    async def publish(client_type, idx):
+        pass
+
+    monkeypatch.setattr(shared_client_state, "_publish_failure", publish)
+
+
+def scripted(admission, attempts, clients: int = 2, **kwargs):
+    """Supervised stream whose n-th upstream attempt follows ``attempts[n]``.
+
+    Each attempt is ``(first_delay, chunks, error)``: it waits ``first_delay``,
+    yields ``chunks`` and then raises ``error`` if one is given. Returns the
+    stream builder and a list of the attempts that were closed early.
+    """
+    started = []
+    closed = []
+
+    def start_stream(client, idx, call_back):
+        first_delay, chunks, error = attempts[len(started)]
+        attempt = len(started)
+        started.append(idx)
+
+        async def upstream():
+            finished = False
+            try:
+                await asyncio.sleep(first_delay)
+                for chunk in chunks:
+                    yield chunk
+                if error is not None:
+                    raise error
+                finished = True
+                for callback in call_back:
+                    await callback()
+            finally:
+                if not finished:
+                    closed.append(attempt)
+
+        return upstream()
+
+    call_back = kwargs.pop("call_back", [])
+    wrap = kwargs.pop("wrap", None)
+
+    def build_stream(slot):
+        supervisor = StreamSupervisor(
+            "plus",
+            {idx: object() for idx in range(clients)},
+            start_stream,
+            call_back,
+            admission=admission,
+            **kwargs,
+        )
+        stream = supervisor.stream(slot)
+        return wrap(stream) if wrap is not None else stream
+
+    return build_stream, closed
+
+
+async def test_hedge_wins_when_first_token_is_late(no_failure_publish):
+    selector, admission = make_admission(cap=1, clients=2)
+    build_stream, closed = scripted(
+        admission,
+        [(10, ["slow"], None), (0, ["a", "b"], None)],
+        first_token_budget=0.05,
+    )
+    stream = admitted(admission, build_stream)
+    assert await stream.__anext__() == "a"
+    # 较慢的那个流已经关闭, 名额也已释放
+    assert closed == [0]
+    assert in_flight(selector, 2) == 1
+    assert [chunk async for chunk in stream] == ["b"]
+    assert in_flight(selector, 2) == 0
+
+
+async def test_failover_when_upstream_fails_before_first_token(no_failure_publish):
+    selector, admission = make_admission(cap=1, clients=2)
+    finished = []
+
+    async def call_back():
+        finished.append(True)
+
+    build_stream, _ = scripted(
+        admission,
+        [(0, [], RuntimeError("upstream down")), (0, ["a", "b"], None)],
+        first_token_budget=5,
+        call_back=[call_back],
+    )
+    stream = admitted(admission, build_stream)
+    assert [chunk async for chunk in stream] == ["a", "b"]
+    assert finished == [True]
+    assert in_flight(selector, 2) == 0
+
+
+async def test_mid_stream_retry_does_not_bill_failed_text(no_failure_publish):
+    selector, admission = make_admission(cap=1, clients=2)
+    service = TokenizerService()
+    counter = service.stream_counter()
+    billed = []
+
+    async def call_back():
+        billed.append(await counter.total())
+
+    build_stream, _ = scripted(
+        admission,
+        [
+            (0, ["failed ", "partial answer "], RuntimeError("connection reset")),
+            (0, ["complete ", "answer"], None),
+        ],
+        first_token_budget=5,
+        call_back=[call_back],
+        on_retry=counter.reset,
+        wrap=counter.wrap,
+    )
+    stream = admitted(admission, build_stream)
+    assert [chunk async for chunk in stream] == [
+        "failed ",
+        "partial answer ",
+        RETRY_NOTICE,
+        "complete ",
+        "answer",
+    ]
+    assert billed == [service.encode_length("complete answer")]
+    assert in_flight(selector, 2) == 0
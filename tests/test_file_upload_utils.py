@@ -0,0 +1,43 @@
+import io
+
+import pytest
+from fastapi import UploadFile
+
+from rev_claude.utils import file_upload_utils
+from rev_claude.utils.file_upload_utils import save_upload, spooled_upload
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_upload_utils, "UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+def upload(data: bytes, filename: str) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename)
+
+
+@pytest.mark.parametrize("filename", ["..", ".", "", "../..", "a/.."])
+async def test_save_upload_keeps_dot_names_inside_hash_dir(upload_dir, filename):
+    saved = await save_upload(upload(b"hello", filename))
+    assert saved.path.is_file()
+    assert saved.path.parent == upload_dir / saved.sha256
+    assert saved.path.read_bytes() == b"hello"
+
+
+async def test_save_upload_dedupes_by_content(upload_dir):
+    first = await save_upload(upload(b"same", "a.txt"))
+    second = await save_upload(upload(b"same", "a.txt"))
+    assert first.path == second.path
+    assert [p.name for p in upload_dir.iterdir()] == [first.sha256]
+
+
+async def test_spooled_upload_is_removed_after_use(upload_dir):
+    file = upload(b"document", "doc.pdf")
+    async with spooled_upload(file) as saved:
+        assert saved.path.read_bytes() == b"document"
+        # 上游仍可以再读一次
+        assert await file.read() == b"document"
+    assert list(upload_dir.iterdir()) == []
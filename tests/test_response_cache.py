@@ -0,0 +1,86 @@
+import pytest
+
+from rev_claude.utils.response_cache import (
+    CACHE_KEY_PREFIX,
+    INDEX_KEY,
+    SIZES_KEY,
+    TOTAL_BYTES_KEY,
+    ResponseCache,
+    _encode,
+    response_cache_key,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def entry_size(chunks) -> int:
+    return len(_encode(chunks))
+
+
+async def test_put_then_get_returns_chunks(redis):
+    cache = ResponseCache(redis)
+    key = response_cache_key("bot", "hello")
+    await cache.put(key, ["a", "b"], ttl=60)
+
+    assert await cache.get(key) == ["a", "b"]
+    assert 0 < await redis.ttl(key) <= 60
+    assert int(await redis.get(TOTAL_BYTES_KEY)) == entry_size(["a", "b"])
+
+
+async def test_key_ignores_insignificant_whitespace():
+    assert response_cache_key("Bot", "hi \r\nthere\n") == response_cache_key(
+        "bot", "hi\nthere"
+    )
+    assert response_cache_key("bot", "hi") != response_cache_key("bot", "hi", ["x"])
+
+
+async def test_too_large_entry_is_not_stored(redis):
+    cache = ResponseCache(redis, max_entry_bytes=10)
+    key = response_cache_key("bot", "hello")
+    await cache.put(key, ["x" * 100], ttl=60)
+    assert await cache.get(key) is None
+    assert not await redis.exists(INDEX_KEY)
+
+
+async def test_overwrite_keeps_total_in_sync(redis):
+    cache = ResponseCache(redis)
+    key = response_cache_key("bot", "hello")
+    await cache.put(key, ["a"], ttl=60)
+    await cache.put(key, ["a" * 50], ttl=60)
+    assert int(await redis.get(TOTAL_BYTES_KEY)) == entry_size(["a" * 50])
+    assert await redis.zcard(INDEX_KEY) == 1
+
+
+async def test_evicts_oldest_entries_past_max_bytes(redis):
+    chunks = [["first"], ["second"], ["third"]]
+    cache = ResponseCache(redis, max_bytes=sum(map(entry_size, chunks[1:])))
+    keys = [response_cache_key("bot", str(i)) for i in range(3)]
+    for key, entry in zip(keys, chunks):
+        await cache.put(key, entry, ttl=60)
+
+    assert await cache.get(keys[0]) is None
+    assert await cache.get(keys[1]) == ["second"]
+    assert await cache.get(keys[2]) == ["third"]
+    assert set(await redis.hkeys(SIZES_KEY)) == set(keys[1:])
+    assert int(await redis.get(TOTAL_BYTES_KEY)) == cache.max_bytes
+
+
+async def test_store_prunes_expired_entries(redis):
+    cache = ResponseCache(redis)
+    expired = response_cache_key("bot", "old")
+    await cache.put(expired, ["old"], ttl=60)
+    # 模拟按 TTL 过期: key 已经不在了, 但索引里还有它
+    await redis.delete(expired)
+
+    live = response_cache_key("bot", "new")
+    await cache.put(live, ["new"], ttl=60)
+    assert await redis.zrange(INDEX_KEY, 0, -1) == [live]
+    assert await redis.hkeys(SIZES_KEY) == [live]
+    assert int(await redis.get(TOTAL_BYTES_KEY)) == entry_size(["new"])
+
+
+def test_keys_share_one_cluster_slot():
+    # 脚本会删除没有在 KEYS 中声明的条目, 所有 key 必须带同一个 hash tag
+    for key in (INDEX_KEY, SIZES_KEY, TOTAL_BYTES_KEY, response_cache_key("b", "m")):
+        assert key.startswith(CACHE_KEY_PREFIX)
+        assert key[key.index("{") : key.index("}") + 1] == "{rc}"
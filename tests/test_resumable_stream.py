@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from rev_claude.utils.resumable_stream import ResumableStreams
+
+pytestmark = pytest.mark.anyio
+
+
+async def frames(*chunks, delay: float = 0, started: asyncio.Event = None):
+    for chunk in chunks:
+        if started is not None:
+            started.set()
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+async def test_follower_and_replay_see_the_same_frames(redis):
+    streams = ResumableStreams(redis)
+    generation, follower = await streams.start("c1", "sj-a", frames("a", "b", "c"))
+    assert await collect(follower) == [b"id: 1\na", b"id: 2\nb", b"id: 3\nc"]
+    await streams.stop()
+
+    assert await streams.owner("c1", generation) == "sj-a"
+    replayed = await collect(streams.replay("c1", generation, 1))
+    assert replayed == [b"id: 2\nb", b"id: 3\nc"]
+
+
+async def test_new_generation_does_not_collide_with_running_one(redis):
+    streams = ResumableStreams(redis)
+    started = asyncio.Event()
+    first, first_follower = await streams.start(
+        "c1", "sj-a", frames("old-1", "old-2", delay=0.05, started=started)
+    )
+    await started.wait()
+    second, second_follower = await streams.start("c1", "sj-a", frames("new"))
+    assert first != second
+    assert await streams.latest("c1") == second
+
+    assert await collect(second_follower) == [b"id: 1\nnew"]
+    assert await collect(first_follower) == [b"id: 1\nold-1", b"id: 2\nold-2"]
+    await streams.stop()
+    assert await collect(streams.replay("c1", first, 0)) == [
+        b"id: 1\nold-1",
+        b"id: 2\nold-2",
+    ]
+    assert await collect(streams.replay("c1", second, 0)) == [b"id: 1\nnew"]
+
+
+async def test_generation_does_not_wait_for_redis_per_frame(redis):
+    streams = ResumableStreams(redis)
+    execute = redis.pipeline
+    writes = []
+
+    def slow_pipeline(*args, **kwargs):
+        pipe = execute(*args, **kwargs)
+        pipe_execute = pipe.execute
+
+        async def delayed_execute(*a, **kw):
+            await asyncio.sleep(0.05)
+            writes.append(len(pipe.command_stack))
+            return await pipe_execute(*a, **kw)
+
+        pipe.execute = delayed_execute
+        return pipe
+
+    redis.pipeline = slow_pipeline
+    chunks = [str(i) for i in range(50)]
+    generation, follower = await streams.start("c1", "sj-a", frames(*chunks))
+    assert len(await asyncio.wait_for(collect(follower), 1)) == 50
+    await streams.stop()
+    redis.pipeline = execute
+
+    # 帧被合并成少量流水线写入, 而且全部写进了 Redis
+    assert len(writes) < 10
+    assert len(await collect(streams.replay("c1", generation, 0))) == 50
@@ -0,0 +1,8 @@
+from rev_claude.catalog.bot_catalog import bot_catalog
+from rev_claude.metrics.stream_metrics import model_label
+
+
+def test_model_label_uses_catalog_name():
+    name, _ = next(iter(bot_catalog.items()))
+    assert model_label(name.casefold()) == bot_catalog.get(name).name
+    assert model_label("no-such-bot-\n-from-user") == "unknown"
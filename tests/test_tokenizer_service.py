@@ -0,0 +1,28 @@
+import pytest
+
+from rev_claude.utils.tokenizer_service import TokenizerService
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_stream_counter_flushes_text_without_whitespace():
+    service = TokenizerService()
+    counter = service.stream_counter()
+    counter.flush_chars = 64
+    for _ in range(500):
+        counter.feed("你好世界")
+        # 没有空白时缓冲区也不会一直增长
+        assert counter._buffered_chars < counter.flush_chars
+    text = "你好世界" * 500
+    assert abs(await counter.total() - service.encode_length(text)) <= len(
+        counter._pending
+    )
+
+
+async def test_stream_counter_keeps_word_tail():
+    counter = TokenizerService().stream_counter()
+    counter.flush_chars = 8
+    counter.feed("hello wor")
+    assert "".join(counter._buffer) == " wor"
+    counter.feed("ld")
+    assert await counter.total() > 0